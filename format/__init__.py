@@ -1,8 +1,16 @@
 import abc as _abc
 import bitstring as _bitstring
 import collections as _collections
+import importlib as _importlib
+import operator as _operator
+import threading as _threading
 
 
+# Guards the class level caches: slots subclasses, variant registries and
+# traces. Lookups don't take it, so they stay cheap when decoding from many
+# threads; everything is built before being published under it.
+_lock = _threading.RLock()
+
 class MissingParameterError(Exception):
     """A parameter was missing on instantiation of a Specification."""
 
@@ -11,10 +19,13 @@ class NoDefaultForAnonymousRecord(Exception):
 
 class Record(metaclass=_abc.ABCMeta):
     representation = NotImplemented
-    def __init__(self, name=None, default=NotImplemented):
+    def __init__(self, name=None, default=NotImplemented, branch=False):
         super().__init__()
         self.name = name
         self.default = default
+        # True, or a function of the value, if the records that follow
+        # depend on this one's value (see Specification._traced)
+        self.branch = branch
     def instantiate(self, dct):
         if self.name is not None and self.name in dct:
             return dct[self.name]
@@ -34,6 +45,13 @@ class Record(metaclass=_abc.ABCMeta):
     @_abc.abstractmethod
     def write(self, val, stream, data):
         pass
+    def write_iter(self, val, stream, data):
+        """
+        `write` as a generator, yielding wherever what has been written to
+        `stream` so far can be taken out of it (see `Specification._write_iter`).
+        """
+        self.write(val, stream, data)
+        yield from ()
 
 class Query(Record):
     """
@@ -82,6 +100,52 @@ def _run_generator(gen, data, fn):
     except StopIteration as ex:
         return ex.value
 
+def _branch_key(record, value):
+    return record.branch(value) if callable(record.branch) else value
+
+class _Trace:
+    # A stretch of records recorded from a traced specification. Either it
+    # ends in a branch record, and `branches` maps the branch key to the
+    # stretch that follows, or it ends the specification, and `path` is
+    # every record of the run and `result` the class to read them into.
+    __slots__ = ('records', 'branches', 'path', 'result')
+    def __init__(self, records, branches, path=None, result=None):
+        self.records = records
+        self.branches = branches
+        self.path = path
+        self.result = result
+
+def _merge_trace(root, recorded, result):
+    """
+    Add a run, a list of (record, value) pairs, to the traces at `root`.
+
+    Returns the new root and whether the run took a path not seen before.
+    Called with `_lock` held; readers may walk the traces at any time.
+    """
+    records = tuple(record for record, value in recorded)
+    trace, parent, key, start = root, None, None, 0
+    for end, (record, value) in enumerate(recorded, 1):
+        if not record.branch:
+            continue
+        if trace is None:
+            trace = _Trace(records[start:end], {})
+            if parent is None:
+                root = trace
+            else:
+                parent.branches[key] = trace
+        elif trace.branches is None:
+            return root, False
+        parent, key, start = trace, _branch_key(record, value), end
+        trace = trace.branches.get(key)
+    if trace is not None:
+        return root, False
+    trace = _Trace(records[start:], None, records, result)
+    if parent is None:
+        root = trace
+    else:
+        parent.branches[key] = trace
+    return root, True
+
 class Composite(Record):
     def __init__(self, *args, gen, **kwargs):
         super().__init__(*args)
@@ -110,19 +174,46 @@ class SpecificationMeta(_abc.ABCMeta):
     def __new__(meta, name, bases, props):
         # Detect variants by their magic class attribute
         if '_variant_key_name' in props:
-            props['_registry'] = {}
+            props.setdefault('_registry', {})
             props['_is_variant'] = True
         else:
             props['_is_variant'] = False
         props['_slots_cache'] = {}
         props.setdefault('_is_cached_subclass', False)
+        # compact instances are tuples, which can't have a __dict__ beside
+        # their items for free, so their classes don't add one
+        if '__slots__' not in props and not props['_is_cached_subclass'] and (
+                props.get('_compact') or any(getattr(base, '_compact', False) for base in bases)):
+            props['__slots__'] = ()
+        if not props['_is_cached_subclass']:
+            props['_trace'] = None
+            props['_traces'] = 0
         klass = super(SpecificationMeta, meta).__new__(meta, name, bases, props)
         # Auto-register subclasses of variants in the variant system
-        for base in bases:
-            if base._is_variant:
-                base._registry[props[base._variant_key_name]] = klass
+        with _lock:
+            for base in bases:
+                if getattr(base, '_is_variant', False):
+                    base._registry[props[base._variant_key_name]] = klass
         return klass
 
+class LazyRegistry(dict):
+    """
+    Variant registry that imports the module defining a key on first use.
+
+    Give it as the `_registry` of a variant class, and fill `modules` with
+    the name of the module each key's subclass is defined in.
+    """
+    def __init__(self, modules=()):
+        super().__init__()
+        self.modules = dict(modules)
+    def __missing__(self, key):
+        module = self.modules.get(key)
+        if module is None:
+            raise KeyError(key)
+        # importing the module registers its subclasses
+        _importlib.import_module(module)
+        return super().__getitem__(key)
+
 class UnusedParametersError(Exception):
     """A Specification was instantiated with arguments that were not used."""
 
@@ -147,14 +238,52 @@ class Specification(metaclass=SpecificationMeta):
     The magic class attribute `_variant_key_name` allows the definition of variant
     classes that while uninstantiatable will seamlessly replace themselves with an
     instance of a subclass selected by the attribute whose name is the value of
-    `_variant_key_name`
+    `_variant_key_name`. The subclasses are looked up in `_registry`, which a
+    variant can set to a `LazyRegistry` to import them only when needed.
 
     This makes it easy to make a class of messages that describes some common structural preamble,
     keeping all the subclasses DRY.
+
+    Setting the class attribute `_encode_once` makes instances keep the output
+    of their first `_write` and reuse it. Assigning to a field throws the
+    cached encoding away, but changing a field's value in place (appending to
+    a list, or modifying a nested instance) does not, so only use it for
+    specifications whose instances are treated as immutable.
+
+    Setting the class attribute `_traced` makes reads and writes record the
+    records `_data` produced, keyed on the values of the records created with
+    `branch` set, and replay them without running the generator when the same
+    branch values come up again. Up to `_max_traces` different runs are kept,
+    anything else goes through the generator. This is only correct if every
+    record's parameters depend on nothing but the values of branch records
+    (pass a function of `data` where they would otherwise need a value read
+    earlier, as `Bytes` allows for `length`), and if reading values gives
+    the same fields that instantiating from them would.
+
+    Setting the class attribute `_compact` makes instances tuples of their
+    fields, with a property for each, like a namedtuple. Building, comparing
+    and hashing instances is then done on the tuple in one go, which is
+    cheaper for small, high volume specifications. Their fields can't be
+    assigned to; use `_replace`. They aren't sequences: they have no length,
+    can't be iterated over, added to or ordered, and with `_encode_once`
+    the tuple has the encoding as one more item.
     """
+    __slots__ = ()
+    _encode_once = False
+    _traced = False
+    _max_traces = 64
+    _compact = False
     def __new__(cls, **kwargs):
         if cls._is_cached_subclass:
-            return super(Specification, cls).__new__(cls)
+            if cls._compact:
+                values = [kwargs[f] for f in cls._fields]
+                if cls._encode_once:
+                    values.append(_Encoding())
+                return tuple.__new__(cls, values)
+            self = super(Specification, cls).__new__(cls)
+            for k, v in kwargs.items():
+                setattr(self, k, v)
+            return self
         elif cls._is_variant:
             data = {}
             def run(record):
@@ -192,21 +321,73 @@ class Specification(metaclass=SpecificationMeta):
                     name: kwargs[name]
                     for name in unused_fields})
 
-            fields = tuple(data.keys())
-            if fields in cls._slots_cache:
-                return cls._slots_cache[fields](**data)
-            else:
-                subclass = type(cls.__name__, (cls,), {
-                    '__slots__': fields,
-                    '_is_cached_subclass': True,
-                    '_fields': fields,
-                })
+            return cls._slots_class(tuple(data.keys()))(**data)
+    @classmethod
+    def _slots_class(cls, fields):
+        """The cached subclass of `cls` whose slots are `fields`."""
+        if cls._is_cached_subclass:
+            return cls._specification._slots_class(fields)
+        subclass = cls._slots_cache.get(fields)
+        if subclass is not None:
+            return subclass
+        with _lock:
+            subclass = cls._slots_cache.get(fields)
+            if subclass is None:
+                subclass = cls._make_slots_class(fields)
                 cls._slots_cache[fields] = subclass
-                return subclass(**data)
+            return subclass
+    @classmethod
+    def _make_slots_class(cls, fields):
+        props = {
+            '__slots__': fields,
+            '_is_cached_subclass': True,
+            '_specification': cls,
+            '_fields': fields,
+        }
+        if cls._compact:
+            props['__eq__'] = Specification._compact_eq
+            props['__ne__'] = Specification._compact_ne
+            props['__hash__'] = tuple.__hash__
+            props['__bool__'] = Specification._compact_bool
+            for name in ('__len__', '__iter__', '__contains__', '__add__', '__mul__', '__rmul__',
+                         '__lt__', '__le__', '__gt__', '__ge__'):
+                props[name] = Specification._compact_unsupported
+            for i, field in enumerate(fields):
+                props[field] = property(_operator.itemgetter(i), doc='Alias for field number {}'.format(i))
+            # tuples can't have slots, so the encoding is kept in the tuple
+            if cls._encode_once:
+                props['_encoded'] = property(_get_encoded, _set_encoded)
+            props['__slots__'] = ()
+            return type(cls.__name__, (cls, tuple), props)
+        if cls._encode_once:
+            props['__slots__'] += ('_encoded',)
+            props['__setattr__'] = Specification._setattr_uncached
+        return type(cls.__name__, (cls,), props)
+    def _compact_eq(self, other):
+        if isinstance(other, type(self)):
+            return tuple.__eq__(self, other)
+        # not NotImplemented, or the tuple's own __eq__ would compare items
+        return False if isinstance(other, tuple) else NotImplemented
+    def _compact_ne(self, other):
+        equal = Specification._compact_eq(self, other)
+        return equal if equal is NotImplemented else not equal
+    def _compact_bool(self):
+        return True
+    def _compact_unsupported(self, *args):
+        raise TypeError('{} instances are not sequences'.format(type(self).__name__))
+    def __reduce__(self):
+        # the cached subclasses can't be found by name, so pickle the
+        # specification and rebuild the subclass from the field names
+        return (_restore, (
+            self._specification,
+            self._fields,
+            tuple(
+                bytes(v) if isinstance(v, memoryview) else v
+                for v in (getattr(self, f) for f in self._fields))))
     def __init__(self, **kwargs):
+        # fields are set by __new__, so that values normalised by
+        # Record.instantiate are not overwritten with the raw arguments
         super().__init__()
-        for k, v in kwargs.items():
-            setattr(self, k, v)
     def __eq__(self, other):
         if isinstance(other, type(self)):
             return all(getattr(self, f) == getattr(other, f) for f in self._fields)
@@ -224,12 +405,23 @@ class Specification(metaclass=SpecificationMeta):
                 for name in self._fields))
     @classmethod
     def _read(cls, stream):
+        if cls._is_cached_subclass:
+            return cls._specification._read(stream)
         data = {}
-        if isinstance(stream, bytes):
-            stream = _bitstring.ConstBitStream(stream)
+        if isinstance(stream, (bytes, bytearray, memoryview)):
+            stream = _BufferStream.from_buffer(stream)
         old_pos = stream.pos
+        if cls._trace is not None:
+            result = cls._read_trace(stream)
+            if result is not None:
+                return result
+            stream.pos = old_pos
+        recorded = [] if cls._traced and not cls._is_variant else None
         def run(record):
-            return record.read(stream, data)
+            value = record.read(stream, data)
+            if recorded is not None:
+                recorded.append((record, value))
+            return value
         _run_generator(
             gen=cls._data(data),
             data=data,
@@ -240,28 +432,171 @@ class Specification(metaclass=SpecificationMeta):
             stream.pos = old_pos
             return cls._registry[data[cls._variant_key_name]]._read(stream)
         else:
-            return cls(**data)
+            result = cls(**data)
+            if recorded is not None:
+                cls._record_trace(recorded, type(result))
+            return result
+    @classmethod
+    def _read_trace(cls, stream):
+        """Replay the traces of `cls`, or None for a new branch value."""
+        trace = cls._trace
+        data = {}
+        while True:
+            for record in trace.records:
+                value = record.read(stream, data)
+                if record.name is not None:
+                    data[record.name] = value
+            if trace.branches is None:
+                return trace.result(**data)
+            trace = trace.branches.get(_branch_key(record, value))
+            if trace is None:
+                return None
+    @classmethod
+    def _record_trace(cls, recorded, result):
+        if cls._traces >= cls._max_traces:
+            return
+        with _lock:
+            if cls._traces < cls._max_traces:
+                cls._trace, added = _merge_trace(cls._trace, recorded, result)
+                cls._traces += added
     @classmethod
     @_abc.abstractmethod
     def _data(cls, data):
         return iter(())
+    def _replace(self, **changes):
+        """
+        A copy with the fields in `changes` replaced, made without going
+        through `_data` again, like `namedtuple._replace`. Only for changes
+        that keep the instance valid as it is (no new fields or lengths).
+        """
+        unused_fields = set(changes) - set(self._fields)
+        if unused_fields:
+            raise UnusedParametersError({name: changes[name] for name in unused_fields})
+        kwargs = {f: getattr(self, f) for f in self._fields}
+        kwargs.update(changes)
+        return type(self)(**kwargs)
+    def _setattr_uncached(self, name, value):
+        object.__setattr__(self, '_encoded', None)
+        object.__setattr__(self, name, value)
     def _write(self, stream=None):
+        if self._encode_once:
+            encoded = getattr(self, '_encoded', None)
+            if encoded is None:
+                encoded = _bitstring.BitStream()
+                self._encode(encoded)
+                if encoded.len % 8 == 0:
+                    encoded = encoded.bytes
+                object.__setattr__(self, '_encoded', encoded)
+            if stream is None:
+                return encoded if isinstance(encoded, bytes) else encoded.bytes
+            stream.insert(encoded)
+        elif stream is None:
+            stream = _bitstring.BitStream()
+            self._encode(stream)
+            return stream.bytes
+        else:
+            self._encode(stream)
+    def _encode(self, stream):
         data = {f: getattr(self, f) for f in self._fields}
-        used_stream = stream
-        if stream is None:
-            used_stream = _bitstring.BitStream()
+        if self._trace is not None and self._encode_trace(stream, data):
+            return
+        recorded = [] if self._traced else None
         def run(record):
             d = data.get(record.name)
             if d is None and record.default is not NotImplemented:
                 d = record.default
-            record.write(d, used_stream, data)
+            record.write(d, stream, data)
+            if recorded is not None:
+                recorded.append((record, d))
             return d
         _run_generator(
             gen=self._data(data),
             data=data,
             fn=run)
-        if stream is None:
-            return used_stream.bytes
+        if recorded is not None:
+            self._specification._record_trace(recorded, type(self))
+    def _encode_iter(self, stream):
+        # _encode, with the records' write_iter
+        if self._encode_once:
+            self._write(stream)
+            return
+        data = {f: getattr(self, f) for f in self._fields}
+        gen = self._data(data)
+        current = None
+        while True:
+            try:
+                record = gen.send(current)
+            except StopIteration:
+                return
+            d = data.get(record.name)
+            if d is None and record.default is not NotImplemented:
+                d = record.default
+            yield from record.write_iter(d, stream, data)
+            current = d
+            if record.name is not None:
+                data[record.name] = d
+    def _write_iter(self, chunk_size=1 << 16):
+        """
+        Encode as a generator of byte strings, each (but the last) at least
+        `chunk_size` long. The encoding is cut after list elements
+        (`Repeat`, `Consume`, `LengthPrefixedRepeat`), so that only about
+        `chunk_size` bytes plus an element are held at a time, and lists
+        can be given as iterators. Those of a `LengthPrefixedRepeat` are
+        made into a list first, since their length is written before them.
+        """
+        stream = _bitstring.BitStream()
+        for _ in self._encode_iter(stream):
+            if stream.len >= chunk_size * 8:
+                length = stream.len - stream.len % 8
+                chunk = stream[:length].bytes
+                del stream[:length]
+                stream.pos = stream.len
+                yield chunk
+        if stream.len:
+            yield stream.bytes
+    def _encode_trace(self, stream, data):
+        # find the whole run before writing anything, so that a new branch
+        # value can still go through the generator
+        trace = self._trace
+        while trace.branches is not None:
+            record = trace.records[-1]
+            d = data.get(record.name)
+            if d is None and record.default is not NotImplemented:
+                d = record.default
+            trace = trace.branches.get(_branch_key(record, d))
+            if trace is None:
+                return False
+        for record in trace.path:
+            d = data.get(record.name)
+            if d is None and record.default is not NotImplemented:
+                d = record.default
+            record.write(d, stream, data)
+            if record.name is not None:
+                data[record.name] = d
+        return True
+
+class _BufferStream(_bitstring.ConstBitStream):
+    """A ConstBitStream that remembers the buffer it was made from."""
+    __slots__ = ('_buffer',)
+    @classmethod
+    def from_buffer(cls, buffer):
+        stream = cls(bytes=buffer)
+        stream._buffer = memoryview(buffer)
+        return stream
+
+def _read_view(stream, length):
+    buffer = getattr(stream, '_buffer', None)
+    pos = stream.pos
+    if buffer is None or pos % 8 != 0:
+        return stream.read('bytes:{}'.format(length))
+    start = pos // 8
+    if start + length > len(buffer):
+        raise _bitstring.ReadError('Reading off the end of the data.')
+    stream.pos = pos + length*8
+    return buffer[start:start+length]
+
+def _restore(specification, fields, values):
+    return specification._slots_class(fields)(**dict(zip(fields, values)))
 
 class Integer(Record):
     def __init__(self, *args, bits=None, bytes=None, le=None, unsigned=True, **kwargs):
@@ -301,16 +636,31 @@ class Bits(Record):
         stream.insert(_bitstring.Bits(val, length=self.bits))
 
 class Bytes(Record):
+    """
+    A fixed length run of bytes.
+
+    With `view=True`, reading from a stream that `Specification._read` made out
+    of a bytes-like object returns a `memoryview` slice of that object instead
+    of a copy. The view keeps the whole source buffer alive for as long as it
+    is referenced, and if the source is mutable (a `bytearray`) the value
+    changes along with it, so only pass buffers that will not be reused. Call
+    `bytes()` on the value to detach it. Reads from other streams, or that are
+    not byte aligned, return `bytes` as usual.
+    """
     representation = bytes
-    def __init__(self, *args, length, **kwargs):
+    def __init__(self, *args, length, view=False, **kwargs):
         super().__init__(*args, **kwargs)
-        self._format = 'bytes:{}'.format(length)
+        # `length` can also be a function of the data read so far
         self.length = length
+        self.view = view
     def read(self, stream, data):
-        return stream.read(self._format)
+        length = self.length(data) if callable(self.length) else self.length
+        if self.view:
+            return _read_view(stream, length)
+        return stream.read('bytes:{}'.format(length))
     def write(self, val, stream, data):
-        assert len(val) == self.length
-        stream.insert(val)
+        assert len(val) == (self.length(data) if callable(self.length) else self.length)
+        stream.insert(bytes(val))
 
 class String(Bytes):
     representation = str
@@ -322,6 +672,74 @@ class String(Bytes):
     def write(self, val, stream, data):
         super().write(val.encode(encoding=self.encoding), stream, data)
 
+class LengthPrefixed(Record):
+    """
+    A variable length field preceded by its length as an unsigned integer.
+
+    The count is read along with the body and worked out from the value when
+    writing, so it is not a field of the specification. Takes the same
+    `bits`, `bytes` and `le` arguments as `Integer` for the count; subclasses
+    say how to read and write the body.
+    """
+    def __init__(self, *args, bits=None, bytes=None, le=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = Integer(bits=bits, bytes=bytes, le=le)
+    def read(self, stream, data):
+        return self.read_body(stream, stream.read(self.count.format), data)
+    def write(self, val, stream, data):
+        assert len(val) <= self.count.max
+        self.count.write(len(val), stream, data)
+        self.write_body(val, stream, data)
+    @_abc.abstractmethod
+    def read_body(self, stream, count, data):
+        pass
+    @_abc.abstractmethod
+    def write_body(self, val, stream, data):
+        pass
+
+class LengthPrefixedBytes(LengthPrefixed):
+    """Length prefixed `Bytes`; `view` is as for `Bytes`."""
+    representation = bytes
+    def __init__(self, *args, view=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.view = view
+    def read_body(self, stream, count, data):
+        if self.view:
+            return _read_view(stream, count)
+        return stream.read('bytes:{}'.format(count))
+    def write_body(self, val, stream, data):
+        stream.insert(bytes(val))
+
+class LengthPrefixedString(LengthPrefixedBytes):
+    """Length prefixed `String`; the count is of encoded bytes."""
+    representation = str
+    def __init__(self, *args, encoding='ascii', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.encoding = encoding
+    def read_body(self, stream, count, data):
+        return stream.read('bytes:{}'.format(count)).decode(encoding=self.encoding)
+    def write(self, val, stream, data):
+        super().write(val.encode(encoding=self.encoding), stream, data)
+
+class LengthPrefixedRepeat(LengthPrefixed):
+    """Length prefixed `Repeat`; the count is of elements."""
+    def __init__(self, *args, specification, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.specification = specification
+    def read_body(self, stream, count, data):
+        return [self.specification._read(stream) for i in range(count)]
+    def write_body(self, val, stream, data):
+        for v in val:
+            v._write(stream)
+    def write_iter(self, val, stream, data):
+        if not hasattr(val, '__len__'):
+            val = list(val)
+        assert len(val) <= self.count.max
+        self.count.write(len(val), stream, data)
+        for v in val:
+            yield from v._encode_iter(stream)
+            yield
+
 class Enum(Integer):
     def __init__(self, *args, enum, **kwargs):
         super().__init__(*args, **kwargs)
@@ -341,6 +759,8 @@ class Instance(Record):
         return self.specification._read(stream)
     def write(self, val, stream, data):
         val._write(stream)
+    def write_iter(self, val, stream, data):
+        yield from val._encode_iter(stream)
 
 class Repeat(Instance):
     def __init__(self, *args, count, **kwargs):
@@ -351,6 +771,10 @@ class Repeat(Instance):
     def write(self, val, stream, data):
         for v in val:
             super().write(v, stream, data)
+    def write_iter(self, val, stream, data):
+        for v in val:
+            yield from super().write_iter(v, stream, data)
+            yield
 
 class Consume(Instance):
     def __init__(self, *args, **kwargs):
@@ -363,6 +787,29 @@ class Consume(Instance):
     def write(self, val, stream, data):
         for v in val:
             super().write(v, stream, data)
+    def write_iter(self, val, stream, data):
+        for v in val:
+            yield from super().write_iter(v, stream, data)
+            yield
+
+class _Encoding:
+    """
+    Where a compact `_encode_once` instance keeps its encoding; all equal,
+    so that instances compare and hash on their fields alone.
+    """
+    __slots__ = ('encoded',)
+    def __init__(self):
+        self.encoded = None
+    def __eq__(self, other):
+        return isinstance(other, _Encoding)
+    def __hash__(self):
+        return 0
+
+def _get_encoded(self):
+    return tuple.__getitem__(self, -1).encoded
+
+def _set_encoded(self, encoded):
+    tuple.__getitem__(self, -1).encoded = encoded
 
 def transform(val, fn):
     if val is not NotImplemented:
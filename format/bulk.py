@@ -0,0 +1,116 @@
+"""
+Bulk decoding of captures and logs across a pool of worker processes.
+
+Records are expected to be length framed: each one is preceded by its length
+as an unsigned integer of `count_bytes` bytes. A JUDP `Payload` consumes the
+rest of its stream, so concatenated payloads can't be split without framing
+them first (see `frame`).
+
+`decode` spreads the work over processes and `decode_threads` over threads.
+Decoding only shares the class level caches of `format`, which are safe to
+use from many threads, so on a free-threaded build of Python the thread
+version uses every core without pickling records or results.
+"""
+import collections as _collections
+import concurrent.futures as _futures
+import mmap as _mmap
+import os as _os
+
+
+def frame(record, count_bytes=4, le=True):
+    """Prefix `record` with its length."""
+    return len(record).to_bytes(count_bytes, 'little' if le else 'big') + bytes(record)
+
+def _frame_offsets(buffer, count_bytes, le):
+    byteorder = 'little' if le else 'big'
+    pos = 0
+    end = len(buffer)
+    while pos < end:
+        start = pos + count_bytes
+        if start > end:
+            raise ValueError('truncated frame header at offset {}'.format(pos))
+        length = int.from_bytes(buffer[pos:start], byteorder)
+        pos = start + length
+        if pos > end:
+            raise ValueError('truncated frame at offset {}'.format(start - count_bytes))
+        yield start, pos
+
+def frames(buffer, count_bytes=4, le=True):
+    """Split a buffer of length framed records into memoryview slices of it."""
+    view = memoryview(buffer)
+    for start, end in _frame_offsets(view, count_bytes, le):
+        yield view[start:end]
+
+def _batches(buffer, count_bytes, le, batch_size):
+    batch = []
+    for start, end in _frame_offsets(buffer, count_bytes, le):
+        batch.append(bytes(buffer[start:end]))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _decode_batch(specification, batch):
+    return [specification._read(record) for record in batch]
+
+def _decode_buffer(executor, specification, buffer, count_bytes, le, workers, batch_size, ordered):
+    batches = _batches(buffer, count_bytes, le, batch_size)
+    with executor(workers) as pool:
+        # keep a bounded number of batches in flight so huge inputs are
+        # never held in memory all at once
+        window = 2 * (workers or _os.cpu_count() or 1)
+        pending = _collections.deque()
+        for batch in batches:
+            pending.append(pool.submit(_decode_batch, specification, batch))
+            if len(pending) < window:
+                continue
+            if ordered:
+                yield from pending.popleft().result()
+            else:
+                done, _ = _futures.wait(pending, return_when=_futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+        if ordered:
+            for future in pending:
+                yield from future.result()
+        else:
+            for future in _futures.as_completed(pending):
+                yield from future.result()
+
+def _decode(executor, specification, source, count_bytes, le, workers, batch_size, ordered):
+    args = (count_bytes, le, workers, batch_size, ordered)
+    if isinstance(source, (str, _os.PathLike)):
+        with open(source, 'rb') as f:
+            if _os.fstat(f.fileno()).st_size == 0:
+                return
+            with _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) as buffer:
+                yield from _decode_buffer(executor, specification, buffer, *args)
+    else:
+        yield from _decode_buffer(executor, specification, source, *args)
+
+def decode(specification, source, count_bytes=4, le=True, workers=None, batch_size=256, ordered=True):
+    """
+    Decode every length framed record in `source` with `specification`.
+
+    `source` is a bytes-like object or the path of a file, which is memory
+    mapped rather than read. Records are sent to a `ProcessPoolExecutor` of
+    `workers` processes in batches of `batch_size`, and the decoded instances
+    are streamed back in input order, or as batches finish if `ordered` is
+    false. `specification` has to be importable by the workers.
+    """
+    yield from _decode(
+        _futures.ProcessPoolExecutor,
+        specification, source, count_bytes, le, workers, batch_size, ordered)
+
+def decode_threads(specification, source, count_bytes=4, le=True, workers=None, batch_size=256, ordered=True):
+    """
+    `decode` on a `ThreadPoolExecutor` of `workers` threads.
+
+    Only worth it where threads run in parallel (a free-threaded build), or
+    for small inputs where starting processes would dominate.
+    """
+    yield from _decode(
+        _futures.ThreadPoolExecutor,
+        specification, source, count_bytes, le, workers, batch_size, ordered)
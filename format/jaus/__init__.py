@@ -1,16 +1,19 @@
 import abc as _abc
 import enum as _enum
-import asyncio as _asyncio
-import bitstring as _bitstring
 from functools import wraps
-import traceback as _traceback
 import collections.abc as _abcc
 import datetime as _datetime
 
 import format as _format
 
+# asyncio and traceback are imported where they are used: asyncio is most of
+# the import time of this module, and decoding messages doesn't need it
+
 
 class Id(_format.Specification):
+    _encode_once = True
+    _traced = True
+    _compact = True
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
@@ -34,6 +37,7 @@ def is_command(fn):
     Wraps a coroutine with another coroutine, and requires a component with
     an access_control service. Makes no sense otherwise.
     """
+    import asyncio as _asyncio
     @wraps(fn)
     @_asyncio.coroutine
     def wrapper(self, message, source_id):
@@ -75,7 +79,10 @@ class Component:
         self.name = name
         self.node_name = node_name
         self.subsystem_name = subsystem_name
-        self.loop = loop if loop is not None else _asyncio.get_event_loop()
+        if loop is None:
+            import asyncio as _asyncio
+            loop = _asyncio.get_event_loop()
+        self.loop = loop
 
         self._listener = None
         self._connection = None
@@ -102,8 +109,12 @@ class Component:
         else:
             print('Message with no registered handler: {}'.format(message))
 
-    async def send_message(self, message, destination_id, **kwargs):
+    async def send_message(self, message, destination_id, priority=None, **kwargs):
         print('Sending message to {}: {}'.format(destination_id, message))
+        if priority is None:
+            priority = message._priority
+        if priority is not None:
+            kwargs['priority'] = priority
         await self._connection.send_message(message._write(), destination_id=destination_id, **kwargs)
 
     async def _listener_fn(self, connection, loop=None):
@@ -118,10 +129,12 @@ class Component:
                     await self.send_message(result, destination_id=source_id)
             except Exception as ex:
                 print('Message processing from {} failed: {}'.format(source_id, message_bytes))
+                import traceback as _traceback
                 _traceback.print_exc()
 
     def listen(self, connection, *, loop=None):
         if loop is None:
+            import asyncio as _asyncio
             loop = _asyncio.get_event_loop()
         assert self._listener is None
         self._listener = loop.create_task(self._listener_fn(connection, loop=loop))
@@ -148,6 +161,7 @@ class ServiceState(_abcc.MutableMapping):
             s.add(fn)
     
     def _defer(self, props):
+        import asyncio as _asyncio
         self._changed.update(props)
         if self._deferred_reaction is not None:
             return
@@ -179,6 +193,12 @@ class ServiceState(_abcc.MutableMapping):
 
 class Message(_format.Specification):
     _variant_key_name = 'message_code'
+    # message layouts only vary with their presence vectors
+    _traced = True
+    # filled in below, once Code exists
+    _registry = _format.LazyRegistry()
+    # the judp.Packet.Priority to send with, if not the protocol's default
+    _priority = None
 
     class Code(_enum.Enum):
         ## Liveness
@@ -278,6 +298,12 @@ class Message(_format.Specification):
         ReportActiveElement = 0x441E
 
     @classmethod
+    def _peek_code(cls, buf):
+        """The `Code` of an encoded message, without decoding the rest of it."""
+        if len(buf) < 2:
+            raise ValueError('message is too short to have a code')
+        return cls.Code(int.from_bytes(buf[:2], 'little'))
+    @classmethod
     @_abc.abstractmethod
     def _data(cls, data):
         super()._data(data)
@@ -287,15 +313,47 @@ class Message(_format.Specification):
             bytes=2, le=True,
             default=getattr(cls, 'message_code', NotImplemented))
 
-def counted_bytes(name, *args, **kwargs):
-    bytes = yield _format.Query(name)
-    default_count = NotImplemented
-    if bytes is not NotImplemented:
-        default_count = len(bytes)
+# Reading a message imports only the module that defines it
+for _module, _codes in {
+        'format.jaus.core.liveness': [
+            'QueryHeartbeatPulse', 'ReportHeartbeatPulse'],
+        'format.jaus.core.events': [
+            'CreateEvent', 'UpdateEvent', 'CancelEvent', 'CreateCommandEvent',
+            'QueryEvents', 'QueryEventTimeout', 'ConfirmEventRequest',
+            'RejectEventRequest', 'ReportEvents', 'Event', 'ReportEventTimeout',
+            'CommandEvent'],
+        'format.jaus.core.access_control': [
+            'RequestControl', 'ReleaseControl', 'QueryControl', 'QueryAuthority',
+            'SetAuthority', 'QueryTimeout', 'ReportControl', 'RejectControl',
+            'ConfirmControl', 'ReportAuthority', 'ReportTimeout'],
+        'format.jaus.core.management': [
+            'Shutdown', 'Standby', 'Resume', 'Reset', 'SetEmergency',
+            'ClearEmergency', 'QueryStatus', 'ReportStatus'],
+        'format.jaus.core.list_manager': [
+            'SetElement', 'DeleteElement', 'QueryElement', 'QueryElementList',
+            'QueryElementCount', 'ConfirmElementRequest', 'RejectElementRequest',
+            'ReportElement', 'ReportElementList', 'ReportElementCount'],
+        'format.jaus.core.discovery': [
+            'RegisterServices', 'QueryIdentification', 'QueryConfiguration',
+            'QuerySubsystemList', 'QueryServices', 'QueryServiceList',
+            'ReportIdentification', 'ReportConfiguration', 'ReportSubsystemList',
+            'ReportServices', 'ReportServiceList'],
+        'format.jaus.mobility.local_pose_sensor': [
+            'QueryLocalPose', 'ReportLocalPose'],
+        'format.jaus.mobility.velocity_state_sensor': [
+            'QueryVelocityState', 'ReportVelocityState'],
+        'format.jaus.mobility.local_waypoint_driver': [
+            'SetTravelSpeed', 'SetLocalWaypoint', 'QueryTravelSpeed',
+            'QueryLocalWaypoint', 'ReportTravelSpeed', 'ReportLocalWaypoint'],
+        'format.jaus.mobility.local_waypoint_list_driver': [
+            'QueryActiveElement', 'ReportActiveElement'],
+        }.items():
+    for _code in _codes:
+        Message._registry.modules[Message.Code[_code]] = _module
+del _module, _codes, _code
 
-    count_name = name + '_count'
-    count = (yield _format.Integer(count_name, default=default_count, **kwargs))
-    yield _format.Bytes(name, length=count)
+def counted_bytes(name, *args, **kwargs):
+    return (yield _format.LengthPrefixedBytes(name, *args, **kwargs))
 
 class ScaledFloat(_format.Integer):
     def __init__(self, name, lower_limit, upper_limit, *args, **kwargs):
@@ -317,11 +375,11 @@ class Timestamp(_format.Specification):
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
-        yield _jaus.Integer('ms', bits=10)
-        yield _jaus.Integer('sec', bits=6)
-        yield _jaus.Integer('min', bits=6)
-        yield _jaus.Integer('hr', bits=5)
-        yield _jaus.Integer('day', bits=5)
+        yield _format.Integer('ms', bits=10)
+        yield _format.Integer('sec', bits=6)
+        yield _format.Integer('min', bits=6)
+        yield _format.Integer('hr', bits=5)
+        yield _format.Integer('day', bits=5)
     def from_datetime(self, datetime):
         return Timestamp(
             day=datetime.day,
@@ -337,48 +395,92 @@ class DumbRecord(_format.Record):
         pass
 
 def with_presence_vector(*, name='presence_vector', optional, required=[], **kwargs):
-    default_presence_vector = set()
-    for opt in optional:
-        if (yield _format.Query(opt.name)) is not NotImplemented:
-            default_presence_vector.add(opt.name)
-    presence_vector = yield PresenceVector(
+    presence_vector = PresenceVector(
             name,
             fields=[opt.name for opt in optional],
-            default=default_presence_vector,
+            default=0,
             **kwargs)
+    bits = presence_vector.table
+    for opt in optional:
+        if (yield _format.Query(opt.name)) is not NotImplemented:
+            presence_vector.default |= bits[opt.name]
+    mask = presence_vector.mask((yield presence_vector))
     for req in required:
         yield req
     for opt in optional:
-        if opt.name in presence_vector:
+        if mask & bits[opt.name]:
             yield opt
         else:
             yield DumbRecord(opt.name, default=None)
 
+class Presence(_abcc.Set):
+    """
+    Set-like view of a decoded presence vector.
+
+    The vector itself is kept as the integer `mask`, so membership tests are a
+    single AND against the owning `PresenceVector`'s name->bit table.
+    """
+    __slots__ = ('mask', '_bits')
+    def __init__(self, mask, bits):
+        self.mask = mask
+        self._bits = bits
+    def __contains__(self, name):
+        return bool(self.mask & self._bits.get(name, 0))
+    def __iter__(self):
+        mask = self.mask
+        return (name for name, bit in self._bits.items() if mask & bit)
+    def __len__(self):
+        return sum(1 for name in self)
+    def __int__(self):
+        return self.mask
+    def __eq__(self, other):
+        if isinstance(other, Presence) and other._bits is self._bits:
+            return self.mask == other.mask
+        return super().__eq__(other)
+    def __hash__(self):
+        return hash(frozenset(self))
+    def __repr__(self):
+        return '{{{}}}'.format(', '.join(repr(name) for name in self))
+
 class PresenceVector(_format.Bits):
-    representation = set
-    def __init__(self, name, fields, *args, **kwargs):
+    # values are coerced to `Presence` by instantiate instead
+    representation = NotImplemented
+    # (fields, bits) -> {name: bit}, shared by every record with the same layout
+    _tables = {}
+    def __init__(self, name, fields, *args, branch=True, **kwargs):
         super().__init__(name, *args, **kwargs)
+        # the optional fields that follow depend on the mask
+        self.branch = self.mask if branch is True else branch
         self.fields = fields
-    def read(self, *args, **kwargs):
-        mask = super().read(*args, **kwargs)
-        return {field for field, present in zip(self.fields, mask) if present}
+        self.format = 'uint:{}'.format(self.bits)
+        key = (tuple(fields), self.bits)
+        table = PresenceVector._tables.get(key)
+        if table is None:
+            table = {}
+            # the first field is the most significant bit
+            for i, field in enumerate(fields):
+                table[field] = table.get(field, 0) | (1 << (self.bits - 1 - i))
+            table = PresenceVector._tables.setdefault(key, table)
+        self.table = table
+    def mask(self, val):
+        """Integer mask for a mask, a `Presence` or an iterable of field names."""
+        if isinstance(val, int):
+            return val
+        if isinstance(val, Presence) and val._bits is self.table:
+            return val.mask
+        mask = 0
+        for field in val:
+            mask |= self.table.get(field, 0)
+        return mask
+    def instantiate(self, dct):
+        return Presence(self.mask(super().instantiate(dct)), self.table)
+    def read(self, stream, data):
+        return Presence(stream.read(self.format), self.table)
     def write(self, val, stream, data):
-        output = _bitstring.BitArray(length=self.bits)
-        for i, field in enumerate(self.fields):
-            if field in val:
-                output[i] = 1
-        super().write(output, stream, data)
+        stream.insert('{}={}'.format(self.format, self.mask(val)))
 
 def counted_list(name, specification, *args, **kwargs):
-    lst = yield _format.Query(name)
-    count = yield _format.Integer(
-        default=len(lst) if lst is not NotImplemented else NotImplemented,
-        *args, **kwargs)
-    return (yield _format.Repeat(name, specification=specification, count=count))
+    return (yield _format.LengthPrefixedRepeat(name, *args, specification=specification, **kwargs))
 
 def counted_string(name, *args, **kwargs):
-    s = yield _format.Query(name)
-    count = yield _format.Integer(
-        default=len(s) if s is not NotImplemented else NotImplemented,
-        *args, **kwargs)
-    return (yield _format.String(name, length=count))
+    return (yield _format.LengthPrefixedString(name, *args, **kwargs))
@@ -5,6 +5,7 @@ import format as _format
 import format.jaus as _jaus
 
 class ServiceRecord(_format.Specification):
+    _encode_once = True
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
@@ -77,7 +78,7 @@ class ComponentListRequest(_format.Specification):
                 _format.Integer('id', bytes=1),
             ],
             optional=[
-                _format.Composite('search_filter', gen=_jaus.counted_string, bytes=1),
+                _format.LengthPrefixedString('search_filter', bytes=1),
             ])
 
 class NodeListRequest(_format.Specification):
@@ -144,7 +145,7 @@ class ReportSubsystemList(_jaus.Message):
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
-        yield from _jaus.counted_list('subsystems', Id, bytes=1)
+        yield from _jaus.counted_list('subsystems', _jaus.Id, bytes=1)
 
 class ComponentServiceListReport(_format.Specification):
     @classmethod
@@ -32,14 +32,14 @@ class CreateEvent(_jaus.Message):
             le=True,
             lower_limit=0,
             upper_limit=1092)
-        yield from _jaus.counted_bytes('query_message', bytes=4, le=True)
+        yield from _jaus.counted_bytes('query_message', bytes=4, le=True, view=True)
 
 class UpdateEvent(_jaus.Message):
     message_code = _jaus.Message.Code.UpdateEvent
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
-        yield _format.Int('request_id', bytes=1)
+        yield _format.Integer('request_id', bytes=1)
         yield _format.Enum('event_type', enum=EventType, bytes=1)
         yield _jaus.ScaledFloat(
             'requested_periodic_rate',
@@ -48,7 +48,7 @@ class UpdateEvent(_jaus.Message):
             lower_limit=0,
             upper_limit=1092)
         yield _format.Integer('event_id', bytes=1)
-        yield from _jaus.counted_bytes('query_message', bytes=4, le=True)
+        yield from _jaus.counted_bytes('query_message', bytes=4, le=True, view=True)
 
 class CancelEvent(_jaus.Message):
     message_code = _jaus.Message.Code.CancelEvent
@@ -63,9 +63,9 @@ class CreateCommandEvent(_jaus.Message):
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
-        yield _format.Integer('request_id', bytes=1),
+        yield _format.Integer('request_id', bytes=1)
         yield _format.Integer('maximum_allowed_duration', bytes=4, le=True)
-        yield from _jaus.counted_bytes('command_message', bytes=4, le=True)
+        yield from _jaus.counted_bytes('command_message', bytes=4, le=True, view=True)
 
 
 class QueryEvents(_jaus.Message):
@@ -149,7 +149,7 @@ class RejectEventRequest(_jaus.Message):
             bytes=1,
             required=[
                 _format.Integer('request_id', bytes=1),
-                _format.Enum('response_code', enum=ResponseCode, bytes=1),
+                _format.Enum('response_code', enum=cls.ResponseCode, bytes=1),
             ],
             optional=[
                 _format.Bytes('error_message', length=80),
@@ -163,7 +163,7 @@ class ReportEvents(_jaus.Message):
             yield from super()._data(data)
             yield _format.Enum('type', enum=EventType, bytes=1)
             yield _format.Integer('id', bytes=1)
-            yield from _jaus.counted_bytes('query_message', bytes=4, le=True)
+            yield from _jaus.counted_bytes('query_message', bytes=4, le=True, view=True)
 
     @classmethod
     def _data(cls, data):
@@ -177,7 +177,7 @@ class Event(_jaus.Message):
         yield from super()._data(data)
         yield _format.Integer('event_id', bytes=1)
         yield _format.Integer('sequence_number', bytes=1)
-        yield from _jaus.counted_bytes('report_message', bytes=4, le=True)
+        yield from _jaus.counted_bytes('report_message', bytes=4, le=True, view=True)
 
 class ReportEventTimeout(_jaus.Message):
     message_code = _jaus.Message.Code.ReportEventTimeout
@@ -195,7 +195,7 @@ class CommandEvent(_jaus.Message):
     def _data(cls, data):
         yield from super()._data(data)
         yield _format.Integer('event_id', bytes=1)
-        yield _format.Enum('command_result', enum=CommandResult, bytes=1)
+        yield _format.Enum('command_result', enum=cls.Result, bytes=1)
 
 
 class EventRecord:
@@ -4,6 +4,7 @@ import asyncio as _asyncio
 import format as _format
 import format.jaus as _jaus
 import format.jaus.core.events as _events
+import format.jaus.judp as _judp
 
 
 class ManagementStatus(_enum.Enum):
@@ -43,6 +44,7 @@ class Reset(_jaus.Message):
 
 class SetEmergency(_jaus.Message):
     message_code = _jaus.Message.Code.SetEmergency
+    _priority = _judp.Packet.Priority.SAFETY
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
@@ -50,6 +52,7 @@ class SetEmergency(_jaus.Message):
 
 class ClearEmergency(_jaus.Message):
     message_code = _jaus.Message.Code.ClearEmergency
+    _priority = _judp.Packet.Priority.SAFETY
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
@@ -0,0 +1,165 @@
+"""
+Memory diagnostics for long running components.
+
+`report` walks a `Component` and its `JUDPProtocol` and measures every piece
+of state they hold (partial messages, pending acknowledgements, events,
+list elements, ...) as an object count and a deep size in bytes. Anything a
+service or protocol keeps as an instance attribute is picked up, so new
+state shows up without changes here.
+
+`take_snapshot` and `compare` track what changed between two points in time:
+live `Specification` instances by class, and, if `tracemalloc` is tracing,
+the lines in the `format` package that allocated the difference.
+`log_periodically` does both on a timer and logs the results.
+"""
+import asyncio as _asyncio
+import collections as _collections
+import gc as _gc
+import logging as _logging
+import os as _os
+import sys as _sys
+import tracemalloc as _tracemalloc
+import types as _types
+
+import format as _format
+import format.jaus as _jaus
+import format.jaus.judp as _judp
+
+_logger = _logging.getLogger(__name__)
+
+Usage = _collections.namedtuple('Usage', ['objects', 'bytes'])
+
+# shared or owning objects a structure refers to, but doesn't hold on its own
+_SHARED = (
+    type,
+    _types.ModuleType,
+    _types.FunctionType,
+    _types.BuiltinFunctionType,
+    _types.MethodType,
+    _types.CodeType,
+    _types.FrameType,
+    _asyncio.AbstractEventLoop,
+    _asyncio.BaseTransport,
+    _jaus.Component,
+    _jaus.Service,
+    _judp.JUDPProtocol,
+)
+
+def deep_size(obj, exclude=()):
+    """
+    `Usage` of `obj` and everything reachable from it, except the objects in
+    `exclude` and shared things like classes, functions and event loops.
+    """
+    seen = set(id(o) for o in exclude)
+    objects = size = 0
+    pending = [obj]
+    while pending:
+        o = pending.pop()
+        if id(o) in seen or isinstance(o, _SHARED):
+            continue
+        seen.add(id(o))
+        objects += 1
+        size += _sys.getsizeof(o)
+        pending.extend(_gc.get_referents(o))
+    return Usage(objects, size)
+
+def _attributes(obj):
+    # instance attributes, for both __dict__ and __slots__ classes
+    names = list(getattr(obj, '__dict__', ()))
+    for klass in type(obj).__mro__:
+        names.extend(getattr(klass, '__slots__', ()))
+    for name in names:
+        try:
+            yield name, getattr(obj, name)
+        except AttributeError:
+            pass
+
+def report(component=None, protocol=None):
+    """
+    {structure: Usage} for the state of `component` and `protocol`, named
+    like `protocol._reassembly` or `events.events`.
+    """
+    owners = [o for o in (component, protocol) if o is not None]
+    if component is not None:
+        owners.extend(component.services.values())
+    result = _collections.OrderedDict()
+    def add(prefix, owner):
+        for name, value in _attributes(owner):
+            if not isinstance(value, _SHARED):
+                result['{}.{}'.format(prefix, name)] = deep_size(value, exclude=owners)
+    if protocol is not None:
+        add('protocol', protocol)
+    if component is not None:
+        add('component', component)
+        for name, service in component.services.items():
+            add(name, service)
+    return result
+
+def format_report(usage):
+    """`report` (or `compare`'s class changes) as a table, largest first."""
+    lines = []
+    for name, (objects, size) in sorted(usage.items(), key=lambda item: -abs(item[1].bytes)):
+        lines.append('{:>12} B {:>8} objects  {}'.format(size, objects, name))
+    return '\n'.join(lines)
+
+def specification_usage():
+    """{class name: Usage} of the live `Specification` instances."""
+    usage = _collections.defaultdict(lambda: Usage(0, 0))
+    for o in _gc.get_objects():
+        if isinstance(type(o), _format.SpecificationMeta):
+            # instances are of cached subclasses, named after their specification
+            klass = getattr(type(o), '_specification', type(o))
+            name = '{}.{}'.format(klass.__module__, klass.__qualname__)
+            size = _sys.getsizeof(o)
+            objects, total = usage[name]
+            usage[name] = Usage(objects + 1, total + size)
+    return dict(usage)
+
+Snapshot = _collections.namedtuple('Snapshot', ['specifications', 'tracemalloc'])
+
+def take_snapshot():
+    """The live `Specification` instances, and a tracemalloc snapshot if tracing."""
+    _gc.collect()
+    return Snapshot(
+        specifications=specification_usage(),
+        tracemalloc=_tracemalloc.take_snapshot() if _tracemalloc.is_tracing() else None)
+
+def compare(old, new, limit=10):
+    """
+    The changes from the `old` to the `new` snapshot: ({class name: Usage}
+    for the classes whose instances changed, and the `limit` largest
+    tracemalloc differences by line in the format package).
+    """
+    classes = {}
+    for name in set(old.specifications) | set(new.specifications):
+        before = old.specifications.get(name, Usage(0, 0))
+        after = new.specifications.get(name, Usage(0, 0))
+        if before != after:
+            classes[name] = Usage(after.objects - before.objects, after.bytes - before.bytes)
+    lines = []
+    if old.tracemalloc is not None and new.tracemalloc is not None:
+        only_format = [_tracemalloc.Filter(True, _os.path.join(_os.path.dirname(_format.__file__), '*'))]
+        lines = new.tracemalloc.filter_traces(only_format).compare_to(
+            old.tracemalloc.filter_traces(only_format), 'lineno')[:limit]
+    return classes, lines
+
+def log_periodically(component=None, protocol=None, interval=60, logger=_logger, loop=None):
+    """
+    Log `report`, and what changed since the last time, every `interval`
+    seconds. Returns the task; cancel it to stop.
+    """
+    if loop is None:
+        loop = _asyncio.get_event_loop()
+    async def run():
+        last = take_snapshot()
+        while True:
+            await _asyncio.sleep(interval, loop=loop)
+            logger.info('memory report:\n%s', format_report(report(component, protocol)))
+            snapshot = take_snapshot()
+            classes, lines = compare(last, snapshot)
+            if classes:
+                logger.info('specification instances since last report:\n%s', format_report(classes))
+            for line in lines:
+                logger.info('%s', line)
+            last = snapshot
+    return _asyncio.ensure_future(run(), loop=loop)
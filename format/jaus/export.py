@@ -0,0 +1,275 @@
+"""
+Columnar export of recorded JAUS messages to NumPy arrays.
+
+`export` turns (timestamp, encoded message) pairs into a table of columns
+for each message type: `{Message.Code: {field: masked array}}`, with a
+`timestamp` column, and optional fields that a message's presence vector
+leaves out masked (fields that no message had are left out). Enum fields
+become their integer values and presence vectors their integer masks;
+fields that are not numbers (ids, lists, strings) become object arrays.
+
+Messages are grouped by type and layout before decoding. Where a layout is
+nothing but whole byte integers, which covers the usual sensor reports, the
+whole group is decoded with one `numpy.frombuffer`; anything else is decoded
+message by message.
+
+NumPy is an optional dependency: `pip install format[export]`.
+"""
+import collections as _collections
+import enum as _enum
+import numbers as _numbers
+import os as _os
+import re as _re
+
+import format as _format
+import format.jaus as _jaus
+import format.jaus.judp as _judp
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+def _require_numpy():
+    if _numpy is None:
+        raise ImportError('exporting to arrays needs numpy, install format[export]')
+
+_INTEGER_FORMAT = _re.compile(r'(u?)int(le|be)?:(8|16|32|64)$')
+
+def messages_from_log(reader, start=None, end=None, codes=None, skipped=None):
+    """
+    (timestamp, message) pairs for the messages in the JUDP datagrams of a
+    `format.log.Reader`, reassembling messages that were split into several
+    packets.
+
+    `codes` only picks out the datagrams in which those messages start, so
+    messages continued in later datagrams, and those sent with header
+    compression, are only found without it.
+
+    Packets sent with header compression are expanded with the prefix from
+    the request for their HC number; those whose request isn't in the log
+    can't be read. Fragments sent again are left out, and messages with a
+    fragment missing are dropped, as when receiving them. Give `skipped`, a
+    `collections.Counter`, to count the packets left out for each reason.
+    """
+    if skipped is None:
+        skipped = _collections.Counter()
+    # key: (fragments, sequence number of the first)
+    partial = {}
+    # key: {HC number: prefix}
+    prefixes = {}
+    for entry in reader.select(start, end, codes):
+        try:
+            headers = list(_judp.peek_packet_headers(entry.data))
+        except ValueError:
+            continue
+        for header in headers:
+            if (header.ack_nack in (_judp.Packet.ACKNACKFlags.ACK, _judp.Packet.ACKNACKFlags.NACK)
+                    or header.HC_flags is _judp.Packet.HCFlags.HC_LENGTH):
+                continue
+            key = (header.source_id, header.destination_id)
+            contents = bytes(header.contents)
+            if header.HC_flags is _judp.Packet.HCFlags.REQUESTED:
+                if header.HC_length <= len(contents):
+                    prefixes.setdefault(key, {})[header.HC_number] = contents[:header.HC_length]
+            elif header.HC_flags is _judp.Packet.HCFlags.COMPRESSED:
+                prefix = prefixes.get(key, {}).get(header.HC_number)
+                if prefix is None or len(prefix) != header.HC_length:
+                    skipped['compressed'] += 1
+                    continue
+                contents = prefix + contents
+            data_flags = header.data_flags
+            if data_flags is _judp.Packet.DataFlags.SINGLE_PACKET:
+                yield entry.timestamp, contents
+            elif data_flags is _judp.Packet.DataFlags.FIRST_PACKET:
+                if key not in partial or partial[key][1] != header.sequence_number:
+                    partial[key] = ([contents], header.sequence_number)
+            elif key not in partial:
+                skipped['fragment'] += 1
+            else:
+                fragments, first = partial[key]
+                index = (header.sequence_number - first) % _judp.SEQUENCE_NUMBERS
+                if index < len(fragments):
+                    continue
+                if index > len(fragments):
+                    del partial[key]
+                    skipped['fragment'] += len(fragments) + 1
+                    continue
+                fragments.append(contents)
+                if data_flags is _judp.Packet.DataFlags.LAST_PACKET:
+                    del partial[key]
+                    yield entry.timestamp, b''.join(fragments)
+        del entry, headers
+
+def _layout(cls, sample):
+    # the records every message read like `sample` goes through
+    trace = cls._trace
+    while trace is not None and trace.branches is not None:
+        record = trace.records[-1]
+        trace = trace.branches.get(_format._branch_key(record, getattr(sample, record.name)))
+    return None if trace is None else trace.path
+
+def _raw(value):
+    if isinstance(value, _enum.Enum):
+        return value.value
+    if isinstance(value, _jaus.Presence):
+        return int(value)
+    return value
+
+def _structured(cls, sample):
+    """
+    (dtype, {name: record}, {name: raw value}) reading every message laid
+    out like `sample` with numpy, or None if the layout can't be.
+    """
+    path = _layout(cls, sample)
+    if path is None:
+        return None
+    fields = []
+    records = {}
+    branches = {}
+    for i, record in enumerate(path):
+        if isinstance(record, (_format.Query, _jaus.DumbRecord)):
+            continue
+        if not isinstance(record, (_format.Integer, _jaus.PresenceVector)):
+            return None
+        match = _INTEGER_FORMAT.match(record.format)
+        if match is None:
+            return None
+        unsigned, endianness, bits = match.groups()
+        name = record.name if record.name is not None else '_{}'.format(i)
+        if name in records:
+            return None
+        fields.append((name, '{}{}{}'.format(
+            '<' if endianness == 'le' else '>',
+            'u' if unsigned else 'i',
+            int(bits) // 8)))
+        records[name] = record
+        if record.branch:
+            branches[name] = _raw(getattr(sample, name))
+    return _numpy.dtype(fields), records, branches
+
+def _columns(array, records):
+    columns = {}
+    for name, record in records.items():
+        if name.startswith('_'):
+            continue
+        column = array[name]
+        if isinstance(record, _jaus.ScaledFloat):
+            column = column / record.max * record.range + record.lower_limit
+        else:
+            column = column.astype(_numpy.int64)
+        columns[name] = column
+    return columns
+
+def _column(values):
+    if all(isinstance(v, _numbers.Number) for v in values):
+        return _numpy.array(values)
+    column = _numpy.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        column[i] = v
+    return column
+
+def _decode(cls, messages):
+    """Decode `messages`, all of type `cls`, to {field: (rows, values)} pieces."""
+    pieces = _collections.defaultdict(list)
+    by_length = _collections.defaultdict(list)
+    for row, message in enumerate(messages):
+        by_length[len(message)].append(row)
+    for length, rows in by_length.items():
+        slow = rows
+        sample = cls._read(messages[rows[0]])
+        structured = _structured(cls, sample) if len(rows) > 1 else None
+        if structured is not None and structured[0].itemsize == length:
+            dtype, records, branches = structured
+            array = _numpy.frombuffer(b''.join(messages[row] for row in rows), dtype=dtype)
+            rows = _numpy.array(rows)
+            # messages of the same length can still take other branches
+            same = _numpy.ones(len(rows), dtype=bool)
+            for name, value in branches.items():
+                same &= array[name] == value
+            for name, column in _columns(array[same], records).items():
+                pieces[name].append((rows[same], column))
+            slow = rows[~same].tolist()
+        values = _collections.defaultdict(list)
+        for row in slow:
+            message = cls._read(messages[row])
+            for name in message._fields:
+                value = _raw(getattr(message, name))
+                if value is not None:
+                    values[name].append((row, value))
+        for name, found in values.items():
+            pieces[name].append((
+                _numpy.array([row for row, value in found], dtype=_numpy.intp),
+                _column([value for row, value in found])))
+    return pieces
+
+def export(messages, codes=None):
+    """
+    Columns for each type of message in `messages`, an iterable of
+    (timestamp, encoded message) pairs, keeping only `codes` if given.
+    Messages with unknown codes are skipped.
+    """
+    _require_numpy()
+    if codes is not None:
+        codes = set(codes)
+    grouped = _collections.OrderedDict()
+    for timestamp, message in messages:
+        try:
+            code = _jaus.Message._peek_code(message)
+        except ValueError:
+            continue
+        if codes is not None and code not in codes:
+            continue
+        timestamps, group = grouped.setdefault(code, ([], []))
+        timestamps.append(timestamp)
+        group.append(bytes(message))
+    tables = _collections.OrderedDict()
+    for code, (timestamps, group) in grouped.items():
+        cls = _jaus.Message._registry[code]
+        table = {'timestamp': _numpy.array(timestamps, dtype=_numpy.float64)}
+        for name, pieces in _decode(cls, group).items():
+            dtype = _numpy.result_type(*(values for rows, values in pieces))
+            column = _numpy.ma.masked_all(len(group), dtype=dtype)
+            for rows, values in pieces:
+                column[rows] = values
+            table[name] = column
+        tables[code] = table
+    return tables
+
+def _arrays(tables):
+    for code, table in tables.items():
+        for name, column in table.items():
+            key = '{}.{}'.format(code.name, name)
+            yield key, _numpy.ma.getdata(column)
+            mask = _numpy.ma.getmaskarray(column)
+            if mask.any():
+                yield key + '.mask', mask
+
+def save_npz(path, tables, compressed=False):
+    """
+    Save the tables from `export` to one `.npz` file, as arrays named
+    `<message>.<field>`, plus `<message>.<field>.mask` where some values are
+    missing.
+    """
+    _require_numpy()
+    save = _numpy.savez_compressed if compressed else _numpy.savez
+    save(path, **dict(_arrays(tables)))
+
+def save_npy(directory, tables):
+    """
+    Save the tables from `export` as one `.npy` file per array in
+    `directory`, named as for `save_npz`, so that they can be opened with
+    `numpy.load(..., mmap_mode='r')`. Object columns can't be mapped and
+    need `allow_pickle`.
+    """
+    _require_numpy()
+    _os.makedirs(directory, exist_ok=True)
+    for key, array in _arrays(tables):
+        path = _os.path.join(directory, key + '.npy')
+        if array.dtype.hasobject:
+            _numpy.save(path, array, allow_pickle=True)
+        else:
+            out = _numpy.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+            out[...] = array
+            out.flush()
+            del out
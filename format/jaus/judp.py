@@ -1,6 +1,10 @@
+import collections as _collections
 import enum as _enum
 import format as _format
 import asyncio as _asyncio
+import bisect as _bisect
+import itertools as _itertools
+import math as _math
 import socket as _socket
 import struct as _struct
 
@@ -9,10 +13,16 @@ from . import Id as _Id
 MULTICAST_ADDR = '239.255.0.1'
 PORT = 3794
 MAX_PAYLOAD_SIZE = 512
+# sequence numbers are 16 bit, and wrap around
+SEQUENCE_NUMBERS = 1 << 16
 
 BROADCAST_ID = _Id(subsystem=65535, node=255, component=255)
 
 class Packet(_format.Specification):
+    # retransmissions reuse the first encoding
+    _encode_once = True
+    _traced = True
+    _compact = True
 
     class DataFlags(_enum.Enum):
         """
@@ -35,9 +45,10 @@ class Packet(_format.Specification):
         Indicates the type of Header Compression protocol
 
         NONE: No header compression used
-        REQUESTED: Sender requests receiver to engage in header compression
-        HC_LENGTH: Meaning of a message?
-        COMPRESSED: Sender is sending compressed data; HC header number and HC_LENGTH will also be present
+        REQUESTED: Sender requests receiver to engage in header compression, remembering the
+            first HC_LENGTH bytes of the (uncompressed) contents as HC_NUMBER
+        HC_LENGTH: Receiver accepts the request, repeating its HC_NUMBER, HC_LENGTH and sequence number
+        COMPRESSED: Sender is sending compressed data, without the HC_LENGTH bytes remembered as HC_NUMBER
 
         If there is no compression, the HC_NUMBER and HC_LENGTH will be removed from the General Transport Header
         """
@@ -79,10 +90,10 @@ class Packet(_format.Specification):
     @classmethod
     def _data(cls, data):
         yield from super()._data(data)
-        message_type = yield _format.Integer('message_type', bits=6, default=0)
+        message_type = yield _format.Integer('message_type', bits=6, default=0, branch=True)
         assert message_type == 0
 
-        HC_flags = yield _format.Enum('HC_flags', enum=Packet.HCFlags, bits=2, default=Packet.HCFlags.NONE)
+        HC_flags = yield _format.Enum('HC_flags', enum=Packet.HCFlags, bits=2, default=Packet.HCFlags.NONE, branch=True)
         packet_overhead = 14 if HC_flags is Packet.HCFlags.NONE else 16
 
         default_data_size = yield _format.Query(
@@ -103,19 +114,492 @@ class Packet(_format.Specification):
         yield _format.Instance('source_id', specification=_format.jaus.Id)
         yield _format.Bytes(
             'contents',
-            length=data_size-packet_overhead)
+            length=lambda data: data['data_size'] - packet_overhead,
+            view=True)
         yield _format.Integer('sequence_number', bytes=2, le=True)
 
+    def _replace(self, **changes):
+        # keep data_size in step with the contents
+        if 'contents' in changes and 'data_size' not in changes:
+            changes['data_size'] = self.data_size - len(self.contents) + len(changes['contents'])
+        return super()._replace(**changes)
+
 
 class Payload(_format.Specification):
+    _traced = True
     @classmethod
     def _data(self, data):
-        version = yield _format.Integer('transport_version', bytes=1, default=2)
+        version = yield _format.Integer('transport_version', bytes=1, default=2, branch=True)
         # We only support transport version 2
         assert version == 2
         yield _format.Consume('packets', specification=Packet)
 
 
+PacketHeader = _collections.namedtuple('PacketHeader', [
+    'HC_flags', 'data_size', 'HC_number', 'HC_length',
+    'data_flags', 'ack_nack', 'broadcast', 'priority',
+    'destination_id', 'source_id', 'contents', 'sequence_number'])
+
+_PAYLOAD_START = b'\x02' # transport version
+_SMALLEST_PACKET = 14
+_PACKET_START = _struct.Struct('<BH')
+_PACKET_FLAGS_AND_IDS = _struct.Struct('<BBBHBBH')
+_SEQUENCE_NUMBER = _struct.Struct('<H')
+
+def peek_packet_headers(datagram):
+    """
+    Yield a `PacketHeader` for each packet of a datagram, read straight from
+    its bytes without decoding the packets.
+
+    The ids are (subsystem, node, component) tuples rather than `Id`s, the
+    HC fields are None without header compression, and `contents` is a
+    memoryview of the datagram. Raises ValueError if the datagram is not a
+    version 2 payload or a packet runs past its end.
+    """
+    view = memoryview(datagram)
+    end = len(view)
+    if end == 0 or view[0] != 2:
+        raise ValueError('not a JUDP version 2 payload')
+    pos = 1
+    while pos < end:
+        if pos + _PACKET_START.size > end:
+            raise ValueError('truncated packet at offset {}'.format(pos))
+        first, data_size = _PACKET_START.unpack_from(view, pos)
+        HC_flags = Packet.HCFlags(first & 0b11)
+        header = pos + _PACKET_START.size
+        packet_overhead = 14 if HC_flags is Packet.HCFlags.NONE else 16
+        if first >> 2 != 0 or data_size < packet_overhead or pos + data_size > end:
+            raise ValueError('bad packet at offset {}'.format(pos))
+        if HC_flags is Packet.HCFlags.NONE:
+            HC_number = HC_length = None
+        else:
+            HC_number, HC_length = view[header], view[header+1]
+            header += 2
+        flags, dst_component, dst_node, dst_subsystem, src_component, src_node, src_subsystem = \
+            _PACKET_FLAGS_AND_IDS.unpack_from(view, header)
+        sequence_number, = _SEQUENCE_NUMBER.unpack_from(view, pos + data_size - 2)
+        yield PacketHeader(
+            HC_flags=HC_flags,
+            data_size=data_size,
+            HC_number=HC_number,
+            HC_length=HC_length,
+            data_flags=Packet.DataFlags(flags >> 6),
+            ack_nack=Packet.ACKNACKFlags((flags >> 4) & 0b11),
+            broadcast=Packet.BroadcastFlags((flags >> 2) & 0b11),
+            priority=Packet.Priority(flags & 0b11),
+            destination_id=(dst_subsystem, dst_node, dst_component),
+            source_id=(src_subsystem, src_node, src_component),
+            contents=view[header+_PACKET_FLAGS_AND_IDS.size:pos+data_size-2],
+            sequence_number=sequence_number)
+        pos += data_size
+
+def datagram_codes(datagram):
+    """
+    The codes of the messages that start in a datagram, as integers, for
+    indexing a `format.log`. Malformed datagrams have no codes.
+    """
+    codes = []
+    try:
+        for header in peek_packet_headers(datagram):
+            if (header.data_flags in (Packet.DataFlags.SINGLE_PACKET, Packet.DataFlags.FIRST_PACKET)
+                    and header.HC_flags is not Packet.HCFlags.COMPRESSED
+                    and len(header.contents) >= 2):
+                codes.append(int.from_bytes(header.contents[:2], 'little'))
+    except ValueError:
+        pass
+    return codes
+
+
+class AckMode(_enum.Enum):
+    """
+    How packets sent with RESPONSE_REQUIRED are acknowledged.
+
+    ECHO: an ACK for each packet, repeating its contents, as peers that
+    know nothing else expect
+    EMPTY: an ACK for each packet, without contents
+    RANGE: one ACK for the packets a source sent in the last `ack_delay`
+    seconds, listing the ranges of their sequence numbers; only peers that
+    understand these resolve more than the first packet
+
+    Acknowledgements in every mode are understood when received.
+    """
+    ECHO = 0
+    EMPTY = 1
+    RANGE = 2
+
+# starts the contents of RANGE ACKs and of NACKs for missing fragments
+_RANGE_ACK = b'\xff\xffAR' # not a message code
+_SEQUENCE_RANGE = _struct.Struct('<HH')
+_MAX_RANGES = (MAX_PAYLOAD_SIZE - 15 - len(_RANGE_ACK)) // _SEQUENCE_RANGE.size
+
+def _sequence_ranges(sequence_numbers):
+    """Inclusive (first, last) ranges of `sequence_numbers`, joined across the wrap around."""
+    ranges = []
+    for n in sorted(set(sequence_numbers)):
+        if ranges and ranges[-1][1] == n - 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    if len(ranges) > 1 and ranges[0][0] == 0 and ranges[-1][1] == SEQUENCE_NUMBERS - 1:
+        ranges[0][0] = ranges.pop()[0]
+    return [tuple(r) for r in ranges]
+
+def _acknowledged(packet):
+    """The sequence numbers an ACK or NACK packet is for."""
+    contents = packet.contents
+    if (len(contents) > len(_RANGE_ACK)
+            and (len(contents) - len(_RANGE_ACK)) % _SEQUENCE_RANGE.size == 0
+            and bytes(contents[:len(_RANGE_ACK)]) == _RANGE_ACK):
+        for first, last in _SEQUENCE_RANGE.iter_unpack(contents[len(_RANGE_ACK):]):
+            for i in range((last - first) % SEQUENCE_NUMBERS + 1):
+                yield (first + i) % SEQUENCE_NUMBERS
+    else:
+        yield packet.sequence_number
+
+
+class _Run:
+    # consecutive fragments of a message, from lo to hi (which is less
+    # than lo if the sequence numbers wrapped around); first and last
+    # say whether they include its FIRST_PACKET and LAST_PACKET; seen is
+    # how far the key's sequence numbers had got when it was last added to
+    __slots__ = ('key', 'lo', 'hi', 'first', 'last', 'parts', 'size', 'deadline', 'seen')
+    def __init__(self, key, sequence_number, data_flags, contents, seen):
+        self.key = key
+        self.lo = self.hi = sequence_number
+        self.first = data_flags is Packet.DataFlags.FIRST_PACKET
+        self.last = data_flags is Packet.DataFlags.LAST_PACKET
+        self.parts = {sequence_number: contents}
+        self.size = len(contents)
+        self.deadline = None
+        self.seen = seen
+
+    def flags(self, sequence_number):
+        if self.first and sequence_number == self.lo:
+            return Packet.DataFlags.FIRST_PACKET
+        if self.last and sequence_number == self.hi:
+            return Packet.DataFlags.LAST_PACKET
+        return Packet.DataFlags.NORMAL_PACKET
+
+class _Reassembly:
+    """
+    Fragments of messages being put back together.
+
+    Each fragment is indexed by (key, sequence number) and joined to the
+    runs of fragments just before and after it (modulo `SEQUENCE_NUMBERS`),
+    so that an arriving fragment costs about the same however many are
+    waiting. A run from a FIRST_PACKET to a LAST_PACKET is a whole message.
+    Runs not added to for `timeout` seconds are dropped, and so are the
+    stalest runs while more than `max_size` bytes are waiting.
+
+    As sequence numbers wrap around, runs left more than half of them
+    behind the furthest a key has got are from before the wrap, and are
+    dropped rather than joined to fragments of newer messages; so are runs
+    that a different fragment for one of their sequence numbers arrives for.
+    """
+    def __init__(self, timeout=5.0, max_size=1 << 20, clock=None):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.clock = clock
+        self.size = 0
+        self.evicted = 0
+        self._runs = {}
+        self._keys = {}
+        # key: (furthest sequence number, how far that is, not wrapped around)
+        self._furthest = {}
+        # runs by deadline
+        self._pending = _collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, key, sequence_number, data_flags, contents):
+        """Add a fragment, returning the whole message if it is now complete."""
+        now = self.clock()
+        self.expire(now)
+        furthest, seen = self._furthest.get(key, (sequence_number, 0))
+        ahead = (sequence_number - furthest) % SEQUENCE_NUMBERS
+        if ahead < SEQUENCE_NUMBERS // 2:
+            furthest, seen = sequence_number, seen + ahead
+        same = self._current(key, sequence_number, seen)
+        if same is not None:
+            if same.flags(sequence_number) is data_flags and same.parts[sequence_number] == contents:
+                self._furthest[key] = (furthest, seen)
+                return None
+            # from another message
+            self._evict(same)
+        run = _Run(key, sequence_number, data_flags, contents, seen)
+        self._runs[key, sequence_number] = run
+        self._keys.setdefault(key, set()).add(run)
+        self._furthest[key] = (furthest, seen)
+        self.size += run.size
+        if not run.first:
+            before = self._current(key, (run.lo - 1) % SEQUENCE_NUMBERS, seen)
+            if before is not None and not before.last:
+                run = self._join(before, run)
+        if not run.last:
+            after = self._current(key, (run.hi + 1) % SEQUENCE_NUMBERS, seen)
+            if after is not None and not after.first:
+                run = self._join(run, after)
+        run.seen = seen
+        if run.first and run.last:
+            self._remove(run)
+            return b''.join(
+                run.parts[(run.lo + i) % SEQUENCE_NUMBERS]
+                for i in range(len(run.parts)))
+        run.deadline = now + self.timeout
+        self._pending[run] = None
+        self._pending.move_to_end(run)
+        while self.size > self.max_size:
+            self._evict(next(iter(self._pending)))
+        return None
+
+    def expire(self, now=None):
+        """Drop the runs that timed out."""
+        if now is None:
+            now = self.clock()
+        while self._pending:
+            run = next(iter(self._pending))
+            if run.deadline > now:
+                break
+            self._evict(run)
+
+    def next_deadline(self):
+        return next(iter(self._pending)).deadline if self._pending else None
+
+    def missing(self, key):
+        """
+        Inclusive (first, last) ranges of the sequence numbers missing
+        between the runs of `key` that are parts of the same message.
+        """
+        runs = sorted(self._keys.get(key, ()), key=lambda run: run.lo)
+        gaps = []
+        for before, after in zip(runs, runs[1:] + runs[:1]):
+            gap = (after.lo - before.hi - 1) % SEQUENCE_NUMBERS
+            if (before is not after and not before.last and not after.first
+                    and 0 < gap < SEQUENCE_NUMBERS // 2):
+                gaps.append(((before.hi + 1) % SEQUENCE_NUMBERS, (after.lo - 1) % SEQUENCE_NUMBERS))
+        return gaps
+
+    def _current(self, key, sequence_number, seen):
+        # the run with sequence_number, unless it's from before a wrap around
+        run = self._runs.get((key, sequence_number))
+        if run is not None and seen - run.seen > SEQUENCE_NUMBERS // 2:
+            self._evict(run)
+            return None
+        return run
+
+    def _join(self, before, after):
+        # move the smaller run's fragments into the larger one
+        run, other = (before, after) if len(before.parts) >= len(after.parts) else (after, before)
+        for n in other.parts:
+            self._runs[other.key, n] = run
+        run.parts.update(other.parts)
+        run.size += other.size
+        run.lo, run.first = before.lo, before.first
+        run.hi, run.last = after.hi, after.last
+        self._pending.pop(other, None)
+        self._keys[other.key].discard(other)
+        return run
+
+    def _remove(self, run):
+        for n in run.parts:
+            del self._runs[run.key, n]
+        runs = self._keys[run.key]
+        runs.discard(run)
+        if not runs:
+            del self._keys[run.key]
+            self._furthest.pop(run.key, None)
+        self._pending.pop(run, None)
+        self.size -= run.size
+
+    def _evict(self, run):
+        self._remove(run)
+        self.evicted += 1
+
+
+class RTTEstimator:
+    """
+    The smoothed round trip time to a destination and its variation, from
+    how long acknowledgements take, and the retransmission timeout they
+    give, as in RFC 6298 (with a configurable lower bound, as the RFC's one
+    second is a long time on a LAN).
+
+    Only acknowledgements of packets sent once are timed (Karn's rule), and
+    every timeout doubles the retransmission timeout until the next one is.
+    """
+    alpha = 1 / 8
+    beta = 1 / 4
+    def __init__(self, initial_rto=1.0, min_rto=0.2, max_rto=60.0, granularity=0.001):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.samples = 0
+        self.retransmits = 0
+        self.failures = 0
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.rto = min(max(self.srtt + max(self.granularity, 4 * self.rttvar), self.min_rto), self.max_rto)
+        self.samples += 1
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, self.max_rto)
+
+    def metrics(self):
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'rto': self.rto,
+            'samples': self.samples,
+            'retransmits': self.retransmits,
+            'failures': self.failures,
+        }
+
+
+# shortest prefix worth compressing, as the HC fields take 2 bytes; and longest
+_HC_MIN_LENGTH = 4
+_HC_MAX_LENGTH = 255
+_HC_NUMBERS = 256
+# the most contents a request, with its HC number and length, has room for
+_HC_MAX_REQUEST = MAX_PAYLOAD_SIZE - 15 - 2
+
+def _common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    for i in range(n):
+        if a[i] != b[i]:
+            return i
+    return n
+
+class _CompressionFlow:
+    """
+    Header compression of the messages one component sends another.
+
+    Each message code gets an HC number, requested with the bytes that
+    messages of that code had in common so far, and used for the messages
+    that start with them once the receiver accepts. A message that doesn't
+    asks again with what it has in common with the last one. A request
+    that isn't accepted within `timeout` seconds is made again, and after
+    `max_requests` of those the receiver is taken not to support header
+    compression.
+
+    Every request takes a new HC number, so that packets compressed with
+    an old prefix and overtaken by a request for a new one still decompress
+    to what was sent. A number isn't used again until `timeout` seconds
+    after it was last used, by when those packets have arrived or are lost.
+    """
+    def __init__(self, timeout=1.0, max_requests=3, clock=None):
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.clock = clock
+        self.failed = 0
+        # message code: HC number
+        self._numbers = {}
+        # HC number: prefix, for those requested or engaged
+        self._prefixes = {}
+        self._engaged = set()
+        # HC number: (time, sequence number) of the last request
+        self._requests = {}
+        # HC number: when it was last used, for those no longer used
+        self._retired = {}
+        self._next_number = 0
+        # message code: the start of the last message sent in full
+        self._last = {}
+
+    @property
+    def supported(self):
+        return self.failed < self.max_requests
+
+    def compress(self, packet):
+        """`packet`, compressed or with a request to be, if it should be."""
+        contents = packet.contents
+        code = bytes(contents[:2])
+        number = self._numbers.get(code)
+        if number in self._engaged:
+            prefix = self._prefixes[number]
+            if contents[:len(prefix)] == prefix:
+                return _with_header_compression(
+                    packet, Packet.HCFlags.COMPRESSED, number, len(prefix), contents[len(prefix):])
+        last = self._last.get(code)
+        self._last[code] = bytes(contents[:_HC_MAX_LENGTH])
+        if last is None or not self.supported or len(contents) > _HC_MAX_REQUEST:
+            return packet
+        now = self.clock()
+        if number in self._requests:
+            if now < self._requests[number][0] + self.timeout:
+                return packet
+            self.failed += 1
+            self._retire(number, now)
+            if not self.supported:
+                return packet
+        length = _common_prefix_length(last, contents)
+        if length < _HC_MIN_LENGTH:
+            return packet
+        new = self._new_number(now)
+        if new is None:
+            return packet
+        if number in self._prefixes:
+            self._retire(number, now)
+        self._numbers[code] = new
+        self._prefixes[new] = bytes(contents[:length])
+        self._requests[new] = (now, packet.sequence_number)
+        return _with_header_compression(packet, Packet.HCFlags.REQUESTED, new, length, contents)
+
+    def _new_number(self, now):
+        for i in range(_HC_NUMBERS):
+            number = (self._next_number + i) % _HC_NUMBERS
+            if number not in self._prefixes and now >= self._retired.get(number, -_math.inf) + self.timeout:
+                self._retired.pop(number, None)
+                self._next_number = (number + 1) % _HC_NUMBERS
+                return number
+        return None
+
+    def _retire(self, number, now):
+        del self._prefixes[number]
+        self._engaged.discard(number)
+        self._requests.pop(number, None)
+        self._retired[number] = now
+
+    def accepted(self, packet):
+        """Engage the HC number of an HC_LENGTH packet, if it answers the last request for it."""
+        number = packet.HC_number
+        request = self._requests.get(number)
+        if (request is not None and request[1] == packet.sequence_number
+                and len(self._prefixes[number]) == packet.HC_length):
+            del self._requests[number]
+            self._engaged.add(number)
+            self.failed = 0
+
+    def forget(self, number):
+        """
+        Stop using an HC number the receiver doesn't know; the next message
+        of its code is sent in full, with a request for a new number.
+        """
+        if number in self._prefixes:
+            self._retire(number, self.clock())
+
+def _with_header_compression(packet, HC_flags, HC_number, HC_length, contents):
+    fields = dict(
+        data_flags=packet.data_flags,
+        ack_nack=packet.ack_nack,
+        broadcast=packet.broadcast,
+        priority=packet.priority,
+        destination_id=packet.destination_id,
+        source_id=packet.source_id,
+        contents=contents,
+        sequence_number=packet.sequence_number)
+    if HC_flags is not Packet.HCFlags.NONE:
+        fields.update(HC_flags=HC_flags, HC_number=HC_number, HC_length=HC_length)
+    return Packet(**fields)
+
+
 def make_multicast_socket(port=PORT, mgroup=MULTICAST_ADDR):
     s = _socket.socket(_socket.AF_INET, _socket.SOCK_DGRAM, _socket.IPPROTO_IP)
     s.setsockopt(_socket.IPPROTO_IP, _socket.SO_REUSEADDR, 1)
@@ -131,33 +615,88 @@ def make_multicast_socket(port=PORT, mgroup=MULTICAST_ADDR):
     return s
 
 
+# packets of each priority sent per round, after all the SAFETY ones
+PRIORITY_WEIGHTS = _collections.OrderedDict([
+    (Packet.Priority.HIGH, 4),
+    (Packet.Priority.STANDARD, 2),
+    (Packet.Priority.LOW, 1),
+])
+
 class JUDPProtocol(_asyncio.DatagramProtocol):
 
-    def __init__(self, loop=None, multicast_addr=MULTICAST_ADDR, multicast_port=PORT):
+    def __init__(self, loop=None, multicast_addr=MULTICAST_ADDR, multicast_port=PORT, log=None, flush_delay=0, max_batch=32,
+            reassembly_timeout=5.0, reassembly_max_size=1 << 20,
+            initial_rto=1.0, min_rto=0.2, max_rto=60.0, ack_mode=AckMode.ECHO, ack_delay=0.005,
+            nack_gaps=True, nack_rtt=0.05, retain_size=1 << 18, priority_weights=PRIORITY_WEIGHTS,
+            header_compression=True, compression_timeout=1.0, compression_requests=3):
         super().__init__()
         if loop is None:
             loop = _asyncio.get_event_loop()
-        self._accumulators = {}
+        # fragments of incomplete messages, dropped after reassembly_timeout
+        # seconds or beyond reassembly_max_size bytes
+        self._reassembly = _Reassembly(reassembly_timeout, reassembly_max_size, loop.time)
+        self._expire_handle = None
+        # RTTEstimator arguments, and the estimators by destination
+        self._rto_parameters = dict(initial_rto=initial_rto, min_rto=min_rto, max_rto=max_rto)
+        self.rtt_estimators = {}
+        # how to acknowledge packets, see AckMode; with RANGE, the sequence
+        # numbers waiting to be, by (source, destination) of the ACK
+        self.ack_mode = ack_mode
+        self.ack_delay = ack_delay
+        self._pending_acks = {}
+        self._ack_handle = None
+        # with nack_gaps, fragments missing between ones received are asked
+        # for again a round trip (see _nack_interval) and ack_delay later,
+        # and at most that often; by (source, destination) of the fragments,
+        # when to look for gaps next, and when each was last asked for
+        self.nack_gaps = nack_gaps
+        self.nack_rtt = nack_rtt
+        self._pending_nacks = {}
+        self._nacked = {}
+        self._nack_handle = None
+        # fragments sent, to resend the ones asked for, up to retain_size
+        # bytes, and when they last were
+        self.retain_size = retain_size
+        self._retained = _collections.OrderedDict()
+        self._retained_size = 0
+        self._resent = {}
+        self.selective_retransmits = 0
+        # with header_compression, the messages sent to each destination
+        # start with what they have in common with earlier ones only once
+        # (see _CompressionFlow), by (source, destination); and the prefixes
+        # other components asked to be remembered, by (source, destination)
+        # and HC number
+        self.header_compression = header_compression
+        self._compression_parameters = dict(timeout=compression_timeout, max_requests=compression_requests)
+        self.compression_flows = {}
+        self._prefixes = {}
         self._resolvers = {}
         self._senders = {}
         self.loop = loop
         self.transport = None
         self.routings = {}
-        self._send_queue = []
+        # a queue for each priority; SAFETY packets go first, and are sent
+        # right away, the others by priority_weights
+        self._send_queues = {priority: _collections.deque() for priority in Packet.Priority}
+        self._queued = 0
+        self.priority_weights = priority_weights
+        self.max_queue_depths = {priority: 0 for priority in Packet.Priority}
+        self.sent_by_priority = {priority: 0 for priority in Packet.Priority}
         self._sequence_numbers = {}
         self.multicast_addr = multicast_addr
         self.multicast_port = multicast_port
-
-        async def sender():
-            while True:
-                self._send_packets(self._send_queue)
-                self._send_queue = []
-                await _asyncio.sleep(0.02, loop=self.loop)
-        self._sender = _asyncio.ensure_future(sender(), loop=self.loop)
+        # a format.log.Writer that every datagram sent and received goes to
+        self.log = log
+        # queued packets are sent flush_delay seconds after the first one, so
+        # that packets queued in the meantime share payloads (with 0, those
+        # queued in the same pass of the event loop), or as soon as there
+        # are max_batch of them, max_batch at a time
+        self.flush_delay = flush_delay
+        self.max_batch = max_batch
+        self._flush_handle = None
 
     def _find_destination_addr(self, packet):
         if packet.broadcast in (Packet.BroadcastFlags.LOCAL, Packet.BroadcastFlags.GLOBAL):
-            packet.destination_id = BROADCAST_ID
             return (self.multicast_addr, self.multicast_port)
         else:
             return self.routings[packet.destination_id]
@@ -165,31 +704,166 @@ class JUDPProtocol(_asyncio.DatagramProtocol):
     def _generate_next_sequence_number(self, source_id, destination_id):
         index = (source_id, destination_id)
         n = self._sequence_numbers.setdefault(index, 0)
-        self._sequence_numbers[index] = n+1
+        self._sequence_numbers[index] = (n+1) % SEQUENCE_NUMBERS
         return n
 
+    def _compress(self, packet):
+        if (not self.header_compression
+                or packet.HC_flags is not Packet.HCFlags.NONE
+                or packet.broadcast is not Packet.BroadcastFlags.NONE
+                or packet.ack_nack in (Packet.ACKNACKFlags.ACK, Packet.ACKNACKFlags.NACK)
+                or packet.data_flags not in (Packet.DataFlags.SINGLE_PACKET, Packet.DataFlags.FIRST_PACKET)):
+            return packet
+        key = (packet.source_id, packet.destination_id)
+        flow = self.compression_flows.get(key)
+        if flow is None:
+            flow = self.compression_flows[key] = _CompressionFlow(clock=self.loop.time, **self._compression_parameters)
+        return flow.compress(packet)
+
     def _send_packets(self, packets):
+        packets = [self._compress(p) for p in packets]
         for p in packets:
-            senders = self._senders.setdefault(p.destination_id, {})
+            if (p.ack_nack in (Packet.ACKNACKFlags.ACK, Packet.ACKNACKFlags.NACK)
+                    or p.HC_flags is Packet.HCFlags.HC_LENGTH):
+                continue
+            senders = self._senders.setdefault((p.source_id, p.destination_id), {})
             if p.sequence_number in senders:
-                senders[p.sequence_number].set_result(None)
-                del senders[p.sequence_number]
-        for addr, payload in self._make_payloads(packets):
-            print('Sending to {} payload {}'.format(addr, payload))
-            self.transport.sendto(payload._write(), addr)
+                sent = senders.pop(p.sequence_number)
+                if not sent.done():
+                    sent.set_result(None)
+        for addr, datagram in self._make_datagrams(packets):
+            print('Sending to {} datagram {}'.format(addr, datagram))
+            self.transport.sendto(datagram, addr)
+            self._log(datagram, self.transport.get_extra_info('sockname'), addr)
+
+    def _log(self, datagram, source, destination):
+        if self.log is not None:
+            self.log.write(
+                datagram,
+                source=source,
+                destination=destination,
+                codes=datagram_codes(datagram))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.transport is None:
+            # sent once connected
+            return
+        packets = self._dequeue(self.max_batch)
+        for safety, batch in _itertools.groupby(packets, key=lambda p: p.priority is Packet.Priority.SAFETY):
+            # SAFETY packets come first, and don't wait to be packed with others
+            self._send_packets(list(batch))
+        for p in packets:
+            self.sent_by_priority[p.priority] += 1
+        if self._queued:
+            self._flush_handle = self.loop.call_soon(self._flush)
+
+    def _enqueue(self, packet):
+        queue = self._send_queues[packet.priority]
+        queue.append(packet)
+        self._queued += 1
+        if len(queue) > self.max_queue_depths[packet.priority]:
+            self.max_queue_depths[packet.priority] = len(queue)
+
+    def _dequeue(self, limit):
+        packets = []
+        safety = self._send_queues[Packet.Priority.SAFETY]
+        while safety and len(packets) < limit:
+            packets.append(safety.popleft())
+        while len(packets) < min(limit, self._queued):
+            before = len(packets)
+            for priority, weight in self.priority_weights.items():
+                queue = self._send_queues[priority]
+                for i in range(min(weight, len(queue), limit - len(packets))):
+                    packets.append(queue.popleft())
+            if len(packets) == before:
+                raise ValueError('no weight for queued priorities')
+        self._queued -= len(packets)
+        return packets
+
+    def queue_metrics(self):
+        """{priority: {'depth', 'max_depth', 'sent'}} of the send queues."""
+        return {
+            priority: {
+                'depth': len(queue),
+                'max_depth': self.max_queue_depths[priority],
+                'sent': self.sent_by_priority[priority],
+            }
+            for priority, queue in self._send_queues.items()}
+
+    def _flush_safety(self):
+        # SAFETY packets don't wait for the others
+        if self.transport is None:
+            return
+        queue = self._send_queues[Packet.Priority.SAFETY]
+        packets = list(queue)
+        queue.clear()
+        self._queued -= len(packets)
+        self.sent_by_priority[Packet.Priority.SAFETY] += len(packets)
+        self._send_packets(packets)
+
+    def _schedule_flush(self, safety=False):
+        if safety:
+            self._flush_safety()
+        elif self._queued >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            if self.flush_delay:
+                self._flush_handle = self.loop.call_later(self.flush_delay, self._flush)
+            else:
+                self._flush_handle = self.loop.call_soon(self._flush)
+
+    def _queue_packet(self, packet):
+        self._enqueue(packet)
+        self._schedule_flush(packet.priority is Packet.Priority.SAFETY)
+
+    def _retain(self, packet):
+        key = (packet.source_id, packet.destination_id, packet.sequence_number)
+        if key in self._retained:
+            return
+        self._retained[key] = packet
+        self._retained_size += packet.data_size
+        while self._retained_size > self.retain_size:
+            key, dropped = self._retained.popitem(last=False)
+            self._retained_size -= dropped.data_size
+            self._resent.pop(key, None)
+
+    def _release(self, source_id, destination_id, sequence_number):
+        key = (source_id, destination_id, sequence_number)
+        packet = self._retained.pop(key, None)
+        if packet is not None:
+            self._retained_size -= packet.data_size
+            self._resent.pop(key, None)
+
+    def _rtt(self, peer):
+        # as timed by acknowledgements from peer, or nack_rtt until then
+        estimator = self.rtt_estimators.get(peer)
+        if estimator is None or estimator.srtt is None:
+            return self.nack_rtt
+        return estimator.srtt
+
+    def _nack_interval(self, peer):
+        return self._rtt(peer) + self.ack_delay
+
+    def _expect_response(self, packet):
+        resolvers = self._resolvers.setdefault((packet.source_id, packet.destination_id), {})
+        resp = resolvers[packet.sequence_number] = self.loop.create_future()
+        return resp
 
     def _send_packet(self, packet):
-        self._send_queue.append(packet)
+        if packet.data_flags is not Packet.DataFlags.SINGLE_PACKET:
+            self._retain(packet)
+        self._enqueue(packet)
         if packet.ack_nack is Packet.ACKNACKFlags.RESPONSE_REQUIRED:
-            resolvers = self._resolvers.setdefault(packet.destination_id, {})
-            resp = self.loop.create_future()
-            resolvers[packet.sequence_number] = resp
-            return resp
+            resp = self._expect_response(packet)
         else:
-            senders = self._senders.setdefault(packet.destination_id, {})
+            senders = self._senders.setdefault((packet.source_id, packet.destination_id), {})
             resp = self.loop.create_future()
             senders[packet.sequence_number] = resp
-            return resp
+        self._schedule_flush(packet.priority is Packet.Priority.SAFETY)
+        return resp
 
     def _split_into_packets(self, contents, **kwargs):
         SINGLE_PACKET_OVERHEAD = 14 + 1 # uncompressed packet overhead + payload overhead
@@ -202,27 +876,38 @@ class JUDPProtocol(_asyncio.DatagramProtocol):
                 sequence_number=self._generate_next_sequence_number(source_id, destination_id),
                 **kwargs)]
         else:
-            parts = []
-            while len(contents)+SINGLE_PACKET_OVERHEAD > MAX_PAYLOAD_SIZE:
-                split_point = MAX_PAYLOAD_SIZE-SINGLE_PACKET_OVERHEAD
-                parts.append(contents[:split_point])
-                contents = contents[split_point:]
-            if len(contents) > 0:
-                parts.append(contents)
-            return [
-                Packet(
+            # fragments are views of the message, and their packets copies
+            # of the first one
+            split_point = MAX_PAYLOAD_SIZE-SINGLE_PACKET_OVERHEAD
+            view = memoryview(contents)
+            parts = [view[i:i+split_point] for i in range(0, len(view), split_point)]
+            first = Packet(
+                contents=parts[0],
+                data_flags=Packet.DataFlags.FIRST_PACKET,
+                sequence_number=self._generate_next_sequence_number(source_id, destination_id),
+                **kwargs)
+            return [first] + [
+                first._replace(
                     contents=part,
                     data_flags=data_flag,
-                    sequence_number=self._generate_next_sequence_number(source_id, destination_id),
-                    **kwargs)
+                    sequence_number=self._generate_next_sequence_number(source_id, destination_id))
                 for part, data_flag in zip(
-                    parts,
+                    parts[1:],
                     (
-                        [Packet.DataFlags.FIRST_PACKET]
-                        +[Packet.DataFlags.NORMAL_PACKET]*(len(parts)-2)
+                        [Packet.DataFlags.NORMAL_PACKET]*(len(parts)-2)
                         +[Packet.DataFlags.LAST_PACKET]))]
 
-    def send_message(self, contents, source_id, destination_id, broadcast=Packet.BroadcastFlags.NONE, priority=Packet.Priority.STANDARD, require_ack=False):
+    def rtt_metrics(self):
+        """{destination id: RTTEstimator.metrics()} for the destinations sent to with acknowledgements."""
+        return {destination_id: estimator.metrics() for destination_id, estimator in self.rtt_estimators.items()}
+
+    def send_message(self, contents, source_id, destination_id, broadcast=Packet.BroadcastFlags.NONE, priority=Packet.Priority.STANDARD, require_ack=False, retries=5, deadline=None):
+        """
+        Send a message. With `require_ack`, each packet is sent up to
+        `retries` more times, after the destination's retransmission timeout
+        (see `RTTEstimator`), until it is acknowledged, for at most `deadline`
+        seconds if given.
+        """
         packets = self._split_into_packets(
             contents,
             priority=priority,
@@ -231,101 +916,293 @@ class JUDPProtocol(_asyncio.DatagramProtocol):
             destination_id=destination_id,
             source_id=source_id)
         if require_ack:
+            estimator = self.rtt_estimators.get(destination_id)
+            if estimator is None:
+                estimator = self.rtt_estimators[destination_id] = RTTEstimator(**self._rto_parameters)
+            give_up = None if deadline is None else self.loop.time() + deadline
             async def check_send(packet):
-                response = None
-                retry_count = 0
-                while response is None or response.ack_nack is not Packet.ACKNACKFlags.ACK:
-                    if retry_count > 5:
-                        raise Exception("couldn't send packet")
+                # a NACK has the packet sent again without using up a retry,
+                # unless it can't be about the last time it was sent; one for
+                # an HC number the destination doesn't know is always about it
+                timeouts = nacks = sends = 0
+                send = True
+                while timeouts <= retries:
+                    if send:
+                        sent = self.loop.time()
+                        rto = estimator.rto
+                        timeout_at = sent + rto
+                        if give_up is not None:
+                            timeout_at = min(timeout_at, give_up)
+                        if timeout_at <= sent:
+                            break
+                        if sends:
+                            estimator.retransmits += 1
+                        sends += 1
+                        response = self._send_packet(packet)
+                    else:
+                        response = self._expect_response(packet)
                     try:
                         response = await _asyncio.wait_for(
-                            self._send_packet(packet), 5,
+                            response, timeout_at - self.loop.time(),
                             loop=self.loop)
                     except _asyncio.TimeoutError:
-                        pass
-                    retry_count += 1
+                        # once for all the packets that timed out together
+                        if estimator.rto == rto:
+                            estimator.backoff()
+                        timeouts += 1
+                        send = True
+                        continue
+                    if response.ack_nack is Packet.ACKNACKFlags.ACK:
+                        if sends == 1:
+                            estimator.sample(self.loop.time() - sent)
+                        return
+                    send = nacks < retries and (
+                        response.HC_flags is Packet.HCFlags.COMPRESSED
+                        or self.loop.time() - sent >= self._rtt(destination_id))
+                    nacks += send
+                estimator.failures += 1
+                raise Exception("couldn't send packet")
+            # in order, which gather doesn't keep
             return _asyncio.ensure_future(
-                _asyncio.gather(*[check_send(packet) for packet in packets], loop=self.loop),
+                _asyncio.gather(*[
+                    _asyncio.ensure_future(check_send(packet), loop=self.loop) for packet in packets],
+                    loop=self.loop),
                 loop=self.loop)
         else:
             return _asyncio.ensure_future(
                 _asyncio.gather(*(self._send_packet(p) for p in packets), loop=self.loop),
                 loop=self.loop)
 
-    def _calculate_payload_size(self, packets):
-        return sum(packet.data_size for packet in packets) + 1
-
-    def _make_payloads(self, packets):
-        packets_by_destination_addr = {}
+    def _make_datagrams(self, packets):
+        """
+        Pack `packets` into encoded `Payload`s for each destination address,
+        putting each packet in the fullest datagram it fits in (best fit).
+        """
+        open_by_destination_addr = {}
         for packet in packets:
             addr = self._find_destination_addr(packet)
-            packets = packets_by_destination_addr.setdefault(addr, [])
-            if self._calculate_payload_size(packets + [packet]) > MAX_PAYLOAD_SIZE:
-                yield addr, Payload(packets=packets)
-                packets_by_destination_addr[addr] = [packet]
+            if (packet.broadcast in (Packet.BroadcastFlags.LOCAL, Packet.BroadcastFlags.GLOBAL)
+                    and packet.destination_id != BROADCAST_ID):
+                packet = packet._replace(destination_id=BROADCAST_ID)
+            opened = open_by_destination_addr.get(addr)
+            if opened is None:
+                # every datagram, the sorted amounts of room left in those
+                # still open, and those open by room left
+                opened = open_by_destination_addr[addr] = ([], [], {})
+            datagrams, rooms, by_room = opened
+            encoded = packet._write()
+            i = _bisect.bisect_left(rooms, len(encoded))
+            if i < len(rooms):
+                same_room = by_room[rooms[i]]
+                best = same_room.popleft()
+                if not same_room:
+                    del by_room[rooms[i]]
+                    del rooms[i]
+            else:
+                best = bytearray(_PAYLOAD_START)
+                datagrams.append(best)
+            best += encoded
+            room = MAX_PAYLOAD_SIZE - len(best)
+            if room < _SMALLEST_PACKET:
+                # nothing else fits
+                yield addr, bytes(best)
+            elif room in by_room:
+                by_room[room].append(best)
             else:
-                packets.append(packet)
-        for addr, packets in packets_by_destination_addr.items():
-            yield addr, Payload(packets=packets)
+                _bisect.insort(rooms, room)
+                by_room[room] = _collections.deque([best])
+        for addr, (datagrams, rooms, by_room) in open_by_destination_addr.items():
+            for datagram in datagrams:
+                if MAX_PAYLOAD_SIZE - len(datagram) >= _SMALLEST_PACKET:
+                    yield addr, bytes(datagram)
 
     def connection_made(self, transport):
         self.transport = transport
+        if self._queued:
+            self._flush()
 
-    def _find_first_packet(self, packet, dct):
-        while packet is not None and packet.data_flags is not Packet.DataFlags.FIRST_PACKET:
-            packet = dct.get(packet.sequence_number-1)
-        return packet
-
-    def _try_sequence_from_first_packet(self, packet, dct):
-        packets = []
-        while packet is not None and packet.data_flags is not Packet.DataFlags.LAST_PACKET:
-            packets.append(packet)
-            packet = dct.get(packet.sequence_number+1)
-        if packet is not None:
-            packets.append(packet)
-            return packets
-        else:
-            return None
-
-    def _try_reconstruct_message(self, packet, dst_id):
+    def _try_reconstruct_message(self, packet, key):
         if packet.data_flags is Packet.DataFlags.SINGLE_PACKET:
             return packet.contents
-        accumulators = self._accumulators[dst_id]
-        first = self._find_first_packet(packet, accumulators)
-        sequence = self._try_sequence_from_first_packet(first, accumulators)
-        if sequence is not None:
-            for p in sequence:
-                del accumulators[p.sequence_number]
-            return b''.join(p.contents for p in sequence)
-        else:
+        msg = self._reassembly.add(key, packet.sequence_number, packet.data_flags, packet.contents)
+        self._schedule_expire()
+        if msg is None and self.nack_gaps and key not in self._pending_nacks:
+            self._pending_nacks[key] = self.loop.time() + self._nack_interval(key[0])
+            self._schedule_nacks()
+        return msg
+
+    def _schedule_expire(self):
+        deadline = self._reassembly.next_deadline()
+        if deadline is not None and self._expire_handle is None:
+            self._expire_handle = self.loop.call_at(deadline, self._expire)
+
+    def _expire(self):
+        self._expire_handle = None
+        self._reassembly.expire()
+        self._schedule_expire()
+
+    def _decompress(self, packet):
+        """
+        `packet` without header compression, accepting requests for it, or
+        None if it was compressed with an HC number that isn't known.
+
+        Such packets can't be read, and are NACKed. Messages sent with
+        `require_ack` are then sent again in full, but the others sent with
+        that number until the sender has the NACK (after a restart, until a
+        round trip after the first one arrives) are lost.
+        """
+        prefixes = self._prefixes.setdefault((packet.source_id, packet.destination_id), {})
+        if packet.HC_flags is Packet.HCFlags.REQUESTED:
+            if self.header_compression and packet.HC_length <= len(packet.contents):
+                prefixes[packet.HC_number] = bytes(packet.contents[:packet.HC_length])
+                self._answer_compression(packet, Packet.HCFlags.HC_LENGTH, Packet.ACKNACKFlags.NO_RESPONSE_REQUIRED)
+            return _with_header_compression(packet, Packet.HCFlags.NONE, None, None, packet.contents)
+        prefix = prefixes.get(packet.HC_number)
+        if prefix is None or len(prefix) != packet.HC_length:
+            # the sender stops compressing with it; with require_ack, the
+            # NACK also makes it send the message again
+            self._answer_compression(packet, Packet.HCFlags.COMPRESSED, Packet.ACKNACKFlags.NACK)
             return None
+        return _with_header_compression(packet, Packet.HCFlags.NONE, None, None, prefix + bytes(packet.contents))
+
+    def _answer_compression(self, packet, HC_flags, ack_nack):
+        self._queue_packet(Packet(
+            HC_flags=HC_flags,
+            HC_number=packet.HC_number,
+            HC_length=packet.HC_length,
+            priority=packet.priority,
+            broadcast=Packet.BroadcastFlags.NONE,
+            ack_nack=ack_nack,
+            data_flags=Packet.DataFlags.SINGLE_PACKET,
+            destination_id=packet.source_id,
+            source_id=packet.destination_id,
+            contents=b'',
+            sequence_number=packet.sequence_number))
 
     def _packet_received(self, packet, addr):
         self.routings[packet.source_id] = addr
-        accumulators = self._accumulators.setdefault(packet.destination_id, {})
-        resolvers = self._resolvers.setdefault(packet.source_id, {})
+        if packet.HC_flags is Packet.HCFlags.HC_LENGTH:
+            flow = self.compression_flows.get((packet.destination_id, packet.source_id))
+            if flow is not None:
+                flow.accepted(packet)
+            return
+        if packet.ack_nack is Packet.ACKNACKFlags.NACK and packet.HC_flags is Packet.HCFlags.COMPRESSED:
+            flow = self.compression_flows.get((packet.destination_id, packet.source_id))
+            if flow is not None:
+                flow.forget(packet.HC_number)
+        elif packet.HC_flags is not Packet.HCFlags.NONE:
+            packet = self._decompress(packet)
+            if packet is None:
+                return
+        # acknowledgements come back from the destination
+        resolvers = self._resolvers.setdefault((packet.destination_id, packet.source_id), {})
         if packet.ack_nack in (Packet.ACKNACKFlags.ACK, Packet.ACKNACKFlags.NACK):
-            if packet.sequence_number in resolvers:
-                resolvers[packet.sequence_number].set_result(packet)
-                del resolvers[packet.sequence_number]
+            for sequence_number in _acknowledged(packet):
+                if packet.ack_nack is Packet.ACKNACKFlags.ACK:
+                    self._release(packet.destination_id, packet.source_id, sequence_number)
+                # done if the sender gave up waiting; a NACK makes it send again
+                resolver = resolvers.pop(sequence_number, None)
+                if resolver is not None and not resolver.done():
+                    resolver.set_result(packet)
+                elif packet.ack_nack is Packet.ACKNACKFlags.NACK:
+                    key = (packet.destination_id, packet.source_id, sequence_number)
+                    retained = self._retained.get(key)
+                    now = self.loop.time()
+                    # not while the last time it was resent may still arrive,
+                    # unless it couldn't be read at all
+                    if retained is not None and (
+                            packet.HC_flags is Packet.HCFlags.COMPRESSED
+                            or now - self._resent.get(key, -_math.inf) >= self._rtt(packet.source_id)):
+                        self._resent[key] = now
+                        self.selective_retransmits += 1
+                        self._queue_packet(retained)
         else:
             if packet.ack_nack is Packet.ACKNACKFlags.RESPONSE_REQUIRED:
-                ack = Packet(
-                    priority=packet.priority,
-                    broadcast=Packet.BroadcastFlags.NONE,
-                    ack_nack=Packet.ACKNACKFlags.ACK,
-                    data_flags=packet.data_flags,
-                    destination_id=packet.source_id,
-                    source_id=packet.destination_id,
-                    contents=packet.contents,
-                    sequence_number=packet.sequence_number)
-                self._send_packet(ack)
-            accumulators[packet.sequence_number] = packet
-            msg = self._try_reconstruct_message(packet, packet.destination_id)
+                self._acknowledge(packet)
+            msg = self._try_reconstruct_message(packet, (packet.source_id, packet.destination_id))
             if msg is not None:
                 self.message_received(msg, packet.source_id, packet.destination_id)
 
+    def _acknowledge(self, packet):
+        if self.ack_mode is AckMode.RANGE:
+            pending = self._pending_acks.setdefault((packet.destination_id, packet.source_id), [])
+            pending.append(packet)
+            if self._ack_handle is None:
+                self._ack_handle = self.loop.call_later(self.ack_delay, self._send_delayed_acks)
+            return
+        echo = self.ack_mode is AckMode.ECHO
+        self._queue_packet(Packet(
+            priority=packet.priority,
+            broadcast=Packet.BroadcastFlags.NONE,
+            ack_nack=Packet.ACKNACKFlags.ACK,
+            data_flags=packet.data_flags if echo else Packet.DataFlags.SINGLE_PACKET,
+            destination_id=packet.source_id,
+            source_id=packet.destination_id,
+            contents=packet.contents if echo else b'',
+            sequence_number=packet.sequence_number))
+
+    def _send_delayed_acks(self):
+        if self._ack_handle is not None:
+            self._ack_handle.cancel()
+            self._ack_handle = None
+        pending, self._pending_acks = self._pending_acks, {}
+        for (source_id, destination_id), packets in pending.items():
+            priority = max((p.priority for p in packets), key=lambda priority: priority.value)
+            self._send_ranges(
+                Packet.ACKNACKFlags.ACK, source_id, destination_id, priority,
+                _sequence_ranges(p.sequence_number for p in packets))
+
+    def _schedule_nacks(self):
+        if self._pending_nacks and self._nack_handle is None:
+            self._nack_handle = self.loop.call_at(min(self._pending_nacks.values()), self._send_nacks)
+
+    def _send_nacks(self):
+        self._nack_handle = None
+        now = self.loop.time()
+        for key, due in list(self._pending_nacks.items()):
+            if due > now:
+                continue
+            del self._pending_nacks[key]
+            # the fragments still missing, from the sender of key
+            gaps = self._reassembly.missing(key)
+            if not gaps:
+                self._nacked.pop(key, None)
+                continue
+            interval = self._nack_interval(key[0])
+            nacked = self._nacked.get(key, {})
+            still = {}
+            again = []
+            for first, last in gaps:
+                for i in range((last - first) % SEQUENCE_NUMBERS + 1):
+                    n = (first + i) % SEQUENCE_NUMBERS
+                    still[n] = nacked.get(n, -_math.inf)
+                    if now - still[n] >= interval:
+                        still[n] = now
+                        again.append(n)
+            self._nacked[key] = still
+            if again:
+                self._send_ranges(
+                    Packet.ACKNACKFlags.NACK, key[1], key[0], Packet.Priority.STANDARD, _sequence_ranges(again))
+            # asked for again if they don't arrive
+            self._pending_nacks[key] = now + interval
+        self._schedule_nacks()
+
+    def _send_ranges(self, ack_nack, source_id, destination_id, priority, ranges):
+        for i in range(0, len(ranges), _MAX_RANGES):
+            some = ranges[i:i+_MAX_RANGES]
+            self._queue_packet(Packet(
+                priority=priority,
+                broadcast=Packet.BroadcastFlags.NONE,
+                ack_nack=ack_nack,
+                data_flags=Packet.DataFlags.SINGLE_PACKET,
+                destination_id=destination_id,
+                source_id=source_id,
+                contents=_RANGE_ACK + b''.join(_SEQUENCE_RANGE.pack(*r) for r in some),
+                # so that peers without range acknowledgements resolve one
+                sequence_number=some[0][0]))
+
     def datagram_received(self, data, addr):
+        self._log(data, addr, self.transport.get_extra_info('sockname'))
         payload = Payload._read(data)
         print('Payload received from {}, {}'.format(addr, payload))
         for packet in payload.packets:
@@ -335,7 +1212,18 @@ class JUDPProtocol(_asyncio.DatagramProtocol):
         pass
 
     async def close(self):
-        self._sender.cancel()
+        self._send_delayed_acks()
+        while self._queued and self.transport is not None:
+            self._flush()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._expire_handle is not None:
+            self._expire_handle.cancel()
+            self._expire_handle = None
+        if self._nack_handle is not None:
+            self._nack_handle.cancel()
+            self._nack_handle = None
         self.transport.close()
         await _asyncio.sleep(0, loop=self.loop)
 
@@ -1,12 +1,39 @@
-from .core.access_control import Service as AccessControlService
-from .core.discovery import Service as DiscoveryService
-from .core.events import Service as EventsService
-from .core.list_manager import Service as ListManagerService
-from .core.liveness import Service as LivenessService
-from .core.management import Service as ManagementService
-from .core.transport import Service as TransportService
-
-from .mobility.local_pose_sensor import Service as LocalPoseSensorService
-from .mobility.local_waypoint_driver import Service as LocalWaypointDriverService
-from .mobility.local_waypoint_list_driver import Service as LocalWaypointListDriverService
-from .mobility.velocity_state_sensor import Service as VelocityStateSensorService
+"""
+The service classes of the core and mobility service sets.
+
+The service modules are imported when their class is first looked up
+here, so importing this module is cheap.
+"""
+import importlib as _importlib
+import sys as _sys
+import types as _types
+
+_services = {
+    'AccessControlService': '.core.access_control',
+    'DiscoveryService': '.core.discovery',
+    'EventsService': '.core.events',
+    'ListManagerService': '.core.list_manager',
+    'LivenessService': '.core.liveness',
+    'ManagementService': '.core.management',
+    'TransportService': '.core.transport',
+
+    'LocalPoseSensorService': '.mobility.local_pose_sensor',
+    'LocalWaypointDriverService': '.mobility.local_waypoint_driver',
+    'LocalWaypointListDriverService': '.mobility.local_waypoint_list_driver',
+    'VelocityStateSensorService': '.mobility.velocity_state_sensor',
+}
+
+__all__ = list(_services)
+
+class _ServicesModule(_types.ModuleType):
+    # module level __getattr__ needs Python 3.7, so swap in a module class
+    def __getattr__(self, name):
+        if name not in _services:
+            raise AttributeError('module {!r} has no attribute {!r}'.format(self.__name__, name))
+        service = _importlib.import_module(_services[name], __package__).Service
+        setattr(self, name, service)
+        return service
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_services))
+
+_sys.modules[__name__].__class__ = _ServicesModule
@@ -0,0 +1,29 @@
+"""
+Random JAUS messages, see `format.workload`.
+"""
+import format.workload as _workload
+import format.jaus as _jaus
+
+@_workload.generator(_jaus.ScaledFloat)
+def _scaled_float(workload, record, data):
+    # a value that survives encoding unchanged
+    return workload.random.randint(0, record.max) / record.max * record.range + record.lower_limit
+
+@_workload.generator(_jaus.PresenceVector, defaults=True)
+def _presence_vector(workload, record, data):
+    mask = 0
+    for bit in record.table.values():
+        if workload.random.random() < 0.5:
+            mask |= bit
+    return mask
+
+@_workload.generator(_jaus.DumbRecord)
+def _dumb_record(workload, record, data):
+    return None
+
+def messages(count=None, codes=None, seed=None, size=_workload._default_size):
+    """
+    Yield `count` (or endless) pairs of a random `Message` and its
+    encoding, of the types in `codes` or of any type.
+    """
+    return _workload.Workload(seed=seed, size=size).samples(_jaus.Message, count, keys=codes)
@@ -0,0 +1,204 @@
+"""
+Append-only logs of timestamped records, such as captured datagrams, that can
+be read back a time window or a code at a time.
+
+A log at `path` is three files:
+
+- `path` holds the records, each one being its source and destination
+  addresses as length prefixed UTF-8 text followed by the record itself.
+- `path.idx` has an entry for each record, in order: its timestamp, where
+  it starts in `path` and how long it is. Timestamps never go backwards, so
+  a time window is found by bisecting the index.
+- `path.codes` has an entry (record number, code) for each code the record
+  was written with, e.g. the message codes of a JUDP datagram.
+
+`Reader` memory maps the files, so opening a log and seeking around it only
+touches the parts that are used.
+"""
+import bisect as _bisect
+import collections as _collections
+import enum as _enum
+import heapq as _heapq
+import itertools as _itertools
+import mmap as _mmap
+import os as _os
+import struct as _struct
+import time as _time
+
+_INDEX = _struct.Struct('<dQI')
+_ADDRESSES = _struct.Struct('<BB')
+_CODE = _struct.Struct('<QI')
+
+Entry = _collections.namedtuple('Entry', ['timestamp', 'source', 'destination', 'data'])
+
+def _encode_address(address):
+    if address is None:
+        return b''
+    host, port = address[:2]
+    return '{}:{}'.format(host, port).encode('utf-8')
+
+def _decode_address(buffer):
+    if not buffer:
+        return None
+    host, _, port = bytes(buffer).decode('utf-8').rpartition(':')
+    return (host, int(port))
+
+def _code(code):
+    return code.value if isinstance(code, _enum.Enum) else code
+
+class Writer:
+    """
+    Appends records to the log at `path`, creating it if need be.
+
+    Records are buffered; call `flush` to make them visible to readers.
+    """
+    def __init__(self, path):
+        path = _os.fspath(path)
+        self.path = path
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        self._codes = open(path + '.codes', 'ab')
+        self._offset = self._data.tell()
+        self._count = self._index.tell() // _INDEX.size
+        self._last_timestamp = float('-inf')
+        if self._count:
+            with open(path + '.idx', 'rb') as f:
+                f.seek((self._count - 1) * _INDEX.size)
+                self._last_timestamp, _, _ = _INDEX.unpack(f.read(_INDEX.size))
+    def __len__(self):
+        return self._count
+    def write(self, data, timestamp=None, source=None, destination=None, codes=()):
+        """
+        Append `data`, received at `timestamp` (now by default) from the
+        `source` and to the `destination` (host, port) addresses, and index it
+        under `codes`. Returns the number of the record.
+        """
+        if timestamp is None:
+            timestamp = max(_time.time(), self._last_timestamp)
+        if timestamp < self._last_timestamp:
+            raise ValueError('timestamp {} is before the last one logged'.format(timestamp))
+        source = _encode_address(source)
+        destination = _encode_address(destination)
+        header = _ADDRESSES.pack(len(source), len(destination))
+        length = len(header) + len(source) + len(destination) + len(data)
+        self._data.write(header)
+        self._data.write(source)
+        self._data.write(destination)
+        self._data.write(data)
+        self._index.write(_INDEX.pack(timestamp, self._offset, length))
+        for code in codes:
+            self._codes.write(_CODE.pack(self._count, _code(code)))
+        self._offset += length
+        self._last_timestamp = timestamp
+        self._count += 1
+        return self._count - 1
+    def flush(self):
+        # data before index, so that a reader never indexes past the data
+        self._data.flush()
+        self._codes.flush()
+        self._index.flush()
+    def close(self):
+        self.flush()
+        self._data.close()
+        self._codes.close()
+        self._index.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if _os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+
+class _Timestamps:
+    # lazy sequence of the index's timestamps, for bisect
+    def __init__(self, index, count):
+        self._index = index
+        self._count = count
+    def __len__(self):
+        return self._count
+    def __getitem__(self, i):
+        return _INDEX.unpack_from(self._index, i * _INDEX.size)[0]
+
+class Reader:
+    """
+    Reads the log at `path`, as it was when opened.
+
+    Entries are `Entry` tuples whose `data` is a memoryview of the mapped
+    file, so nothing is copied until it is decoded. Release the views before
+    calling `close`, or it will raise `BufferError`.
+    """
+    def __init__(self, path):
+        path = _os.fspath(path)
+        self.path = path
+        self._index = _map(path + '.idx')
+        self._count = len(self._index) // _INDEX.size
+        self._data = _map(path)
+        self._view = memoryview(self._data)
+        self._timestamps = _Timestamps(self._index, self._count)
+        self._code_index = None
+    def __len__(self):
+        return self._count
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        timestamp, offset, length = _INDEX.unpack_from(self._index, i * _INDEX.size)
+        source_length, destination_length = _ADDRESSES.unpack_from(self._view, offset)
+        start = offset + _ADDRESSES.size
+        return Entry(
+            timestamp=timestamp,
+            source=_decode_address(self._view[start:start+source_length]),
+            destination=_decode_address(
+                self._view[start+source_length:start+source_length+destination_length]),
+            data=self._view[start+source_length+destination_length:offset+length])
+    def __iter__(self):
+        return (self[i] for i in range(self._count))
+    def _codes(self):
+        if self._code_index is None:
+            code_index = {}
+            codes = _map(self.path + '.codes')
+            try:
+                for offset in range(0, len(codes) - _CODE.size + 1, _CODE.size):
+                    record, code = _CODE.unpack_from(codes, offset)
+                    # entries written after the index was mapped are ignored
+                    if record < self._count:
+                        code_index.setdefault(code, []).append(record)
+            finally:
+                if codes:
+                    codes.close()
+            self._code_index = code_index
+        return self._code_index
+    def records(self, start=None, end=None, codes=None):
+        """
+        Numbers of the records logged at or after `start` and before `end`,
+        and if `codes` is given, written with one of them.
+        """
+        first = 0 if start is None else _bisect.bisect_left(self._timestamps, start)
+        last = self._count if end is None else _bisect.bisect_left(self._timestamps, end)
+        if codes is None:
+            return iter(range(first, last))
+        code_index = self._codes()
+        matches = []
+        for code in set(_code(code) for code in codes):
+            records = code_index.get(code, [])
+            matches.append(records[
+                _bisect.bisect_left(records, first):_bisect.bisect_left(records, last)])
+        # a record written with several of the codes is only given once
+        return (record for record, _ in _itertools.groupby(_heapq.merge(*matches)))
+    def select(self, start=None, end=None, codes=None):
+        """The entries of `records`."""
+        return (self[i] for i in self.records(start, end, codes))
+    def close(self):
+        self._view.release()
+        for buffer in (self._data, self._index):
+            if buffer:
+                buffer.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,148 @@
+"""
+Random, valid instances of Specifications, for benchmarks and soak tests.
+
+A `Workload` runs a specification's `_data` generator the way instantiating
+it does, but makes up a value for each record it yields: a random integer
+in range, a random enum member, random bytes of a random size, and so on.
+Records that have a default keep it, so that keys and computed fields stay
+consistent, and variants pick one of their registered subclasses.
+
+How a value is made up is looked up by record type along its MRO; modules
+that define their own records add to that with `generator`.
+"""
+import random as _random
+import string as _string
+
+import format as _format
+
+_generators = {}
+
+def generator(record_type, defaults=False):
+    """
+    Decorate `fn(workload, record, data)` to make up values for
+    `record_type`; with `defaults`, also for records that have a default.
+    """
+    def register(fn):
+        _generators[record_type] = (fn, defaults)
+        return fn
+    return register
+
+def _default_size(random):
+    # mostly short, so that lists of lists stay small
+    return int(random.expovariate(0.5))
+
+class Workload:
+    """
+    Makes up instances from a `seed`. `size` is a function of a
+    `random.Random` giving the length of variable sized fields (byte
+    strings, strings, lists), up to what the field can encode.
+    """
+    def __init__(self, seed=None, size=_default_size):
+        self.random = _random.Random(seed)
+        self._size = size
+    def size(self, limit=None):
+        size = self._size(self.random)
+        return size if limit is None else min(size, limit)
+    def _generator(self, record):
+        for klass in type(record).__mro__:
+            if klass in _generators:
+                return _generators[klass]
+        raise TypeError('no workload generator for {}'.format(type(record).__name__))
+    def value(self, record, data):
+        """A random value for `record`, given the `data` so far."""
+        return self._generator(record)[0](self, record, data)
+    def instance(self, specification, keys=None):
+        """A random instance of `specification`; a variant picks from `keys` if given."""
+        if specification._is_variant:
+            registry = specification._registry
+            if keys is None:
+                keys = set(registry) | set(getattr(registry, 'modules', ()))
+                keys = sorted(keys, key=repr)
+            return self.instance(registry[self.random.choice(list(keys))])
+        data = {}
+        kwargs = {}
+        seen = {}
+        def run(record):
+            if isinstance(record, _format.Query):
+                return kwargs.get(record.name, record.default)
+            if record.name in seen:
+                # fields that share a name are instantiated from the same argument
+                kwargs.setdefault(record.name, seen[record.name])
+                return seen[record.name]
+            fn, defaults = self._generator(record)
+            if record.default is not NotImplemented and not defaults:
+                value = record.instantiate({})
+            else:
+                value = fn(self, record, data)
+                if record.name is not None and value is not None:
+                    kwargs[record.name] = value
+            if record.name is not None:
+                seen[record.name] = value
+            return value
+        _format._run_generator(specification._data(data), data=data, fn=run)
+        return specification(**kwargs)
+    def samples(self, specification, count=None, keys=None):
+        """Yield `count` (or endless) pairs of a random instance and its encoding."""
+        n = 0
+        while count is None or n < count:
+            instance = self.instance(specification, keys)
+            yield instance, instance._write()
+            n += 1
+
+@generator(_format.Computed)
+def _computed(workload, record, data):
+    return record.value
+
+@generator(_format.Integer)
+def _integer(workload, record, data):
+    if record.format.startswith('u'):
+        return workload.random.randint(0, record.max)
+    half = (record.max + 1) // 2
+    return workload.random.randint(-half, half - 1)
+
+@generator(_format.Enum)
+def _enum(workload, record, data):
+    return workload.random.choice(list(record.enum))
+
+@generator(_format.Bits)
+def _bits(workload, record, data):
+    return _format.Bits.representation(uint=workload.random.getrandbits(record.bits), length=record.bits)
+
+def _random_bytes(workload, length):
+    return bytes(workload.random.getrandbits(8) for i in range(length))
+
+def _random_text(workload, length):
+    return ''.join(workload.random.choice(_string.ascii_letters) for i in range(length))
+
+@generator(_format.Bytes)
+def _bytes(workload, record, data):
+    length = record.length(data) if callable(record.length) else record.length
+    return _random_bytes(workload, length)
+
+@generator(_format.String)
+def _fixed_string(workload, record, data):
+    return _random_text(workload, record.length)
+
+@generator(_format.LengthPrefixedBytes)
+def _length_prefixed_bytes(workload, record, data):
+    return _random_bytes(workload, workload.size(record.count.max))
+
+@generator(_format.LengthPrefixedString)
+def _length_prefixed_string(workload, record, data):
+    return _random_text(workload, workload.size(record.count.max))
+
+@generator(_format.LengthPrefixedRepeat)
+def _length_prefixed_repeat(workload, record, data):
+    return [workload.instance(record.specification) for i in range(workload.size(record.count.max))]
+
+@generator(_format.Instance)
+def _instance(workload, record, data):
+    return workload.instance(record.specification)
+
+@generator(_format.Repeat)
+def _repeat(workload, record, data):
+    return [workload.instance(record.specification) for i in range(record.count)]
+
+@generator(_format.Consume)
+def _consume(workload, record, data):
+    return [workload.instance(record.specification) for i in range(workload.size())]
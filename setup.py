@@ -10,5 +10,8 @@ setup(
         "pytest-asyncio",
         "pytest-catchlog",
     ],
+    extras_require={
+        "export": ["numpy"],
+    },
     entry_points={}
 )
@@ -0,0 +1,76 @@
+import pickle as _pickle
+
+import pytest as _pytest
+
+import format as _format
+import format.bulk as _bulk
+from format.jaus import Message
+from format.jaus.judp import Packet, Payload
+from format.jaus.core.discovery import RegisterServices, ServiceRecord
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+class Foo(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=2, le=True)
+
+@_pytest.mark.parametrize('instance', [
+        Foo(foo=7),
+        RegisterServices(services=[ServiceRecord(uri='urn:a', major_version=1, minor_version=0)]),
+        ReportLocalPose(x=1, yaw=0.5),
+        Payload._read(bytes.fromhex('0200110009ffffffff0201e803002b020400')),
+    ])
+def test__pickle(instance):
+    copy = _pickle.loads(_pickle.dumps(instance))
+    assert copy == instance
+    assert type(copy) is type(instance)
+
+def test__pickle_detaches_views():
+    packet = Payload._read(bytes.fromhex('0200110009ffffffff0201e803002b020400')).packets[0]
+    assert isinstance(packet.contents, memoryview)
+    assert type(_pickle.loads(_pickle.dumps(packet)).contents) is bytes
+
+def test__frames():
+    buf = _bulk.frame(b'ab') + _bulk.frame(b'') + _bulk.frame(b'cde')
+    assert [bytes(f) for f in _bulk.frames(buf)] == [b'ab', b'', b'cde']
+    assert [bytes(f) for f in _bulk.frames(b'\x01a\x00', count_bytes=1)] == [b'a', b'']
+
+def test__truncated_frames():
+    with _pytest.raises(ValueError):
+        list(_bulk.frames(_bulk.frame(b'abc')[:-1]))
+    with _pytest.raises(ValueError):
+        list(_bulk.frames(b'\x01\x00'))
+
+@_pytest.fixture
+def foos():
+    return [Foo(foo=i) for i in range(1000)]
+
+@_pytest.fixture
+def capture(foos):
+    return b''.join(_bulk.frame(f._write()) for f in foos)
+
+def test__decode_ordered(foos, capture):
+    assert list(_bulk.decode(Foo, capture, workers=2, batch_size=64)) == foos
+
+def test__decode_unordered(foos, capture):
+    result = list(_bulk.decode(Foo, capture, workers=2, batch_size=64, ordered=False))
+    assert sorted(result, key=lambda f: f.foo) == foos
+
+def test__decode_file(foos, capture, tmp_path):
+    path = tmp_path / 'capture'
+    path.write_bytes(capture)
+    assert list(_bulk.decode(Foo, str(path), workers=2)) == foos
+    empty = tmp_path / 'empty'
+    empty.write_bytes(b'')
+    assert list(_bulk.decode(Foo, empty, workers=2)) == []
+
+def test__decode_variants():
+    messages = [
+        ReportLocalPose(x=1, y=2),
+        RegisterServices(services=[]),
+    ]
+    capture = b''.join(_bulk.frame(m._write()) for m in messages)
+    result = list(_bulk.decode(Message, capture, workers=1))
+    assert [type(m)._specification for m in result] == [ReportLocalPose, RegisterServices]
+    assert result[1] == messages[1]
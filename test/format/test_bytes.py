@@ -0,0 +1,81 @@
+import bitstring as _bitstring
+import pytest as _pytest
+
+import format as _format
+
+class Copied(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=1)
+        yield _format.Bytes('body', length=3)
+
+class Viewed(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=1)
+        yield _format.Bytes('body', length=3, view=True)
+
+class Nested(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Instance('inner', specification=Viewed)
+        yield _format.Bytes('tail', length=1, view=True)
+
+class Envelope(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=1)
+        yield _format.Bytes('body', length=4, view=True)
+
+def test__bytes_are_copied_by_default():
+    v = Copied._read(b'\x01abc')
+    assert type(v.body) is bytes
+    assert v.body == b'abc'
+
+def test__view_slices_the_source_buffer():
+    buf = bytearray(b'\x01abc')
+    v = Viewed._read(buf)
+    assert isinstance(v.body, memoryview)
+    assert v.body == b'abc'
+    # the view shares memory with the buffer it was read from
+    buf[1:4] = b'xyz'
+    assert v.body == b'xyz'
+
+def test__view_of_bytes_is_hashable():
+    v = Viewed._read(b'\x01abc')
+    assert hash(v.body) == hash(b'abc')
+    assert v == Viewed(foo=1, body=b'abc')
+    assert hash(v) == hash(Viewed(foo=1, body=b'abc'))
+
+def test__nested_views_share_the_outer_buffer():
+    buf = bytearray(b'\x01abcd')
+    n = Nested._read(memoryview(buf))
+    assert n.inner.body == b'abc'
+    assert n.tail == b'd'
+    buf[4:5] = b'e'
+    assert n.tail == b'e'
+
+def test__views_can_be_reparsed():
+    buf = bytearray(b'\x07\x02abc')
+    envelope = Envelope._read(buf)
+    inner = Viewed._read(envelope.body)
+    assert inner == Viewed(foo=2, body=b'abc')
+    buf[2:5] = b'xyz'
+    assert inner.body == b'xyz'
+
+def test__view_falls_back_without_a_buffer():
+    v = Viewed._read(_bitstring.ConstBitStream(b'\x01abc'))
+    assert type(v.body) is bytes
+    assert v.body == b'abc'
+
+def test__view_read_past_end():
+    with _pytest.raises(_bitstring.ReadError):
+        Viewed._read(b'\x01ab')
+
+def test__views_can_be_written():
+    v = Viewed._read(b'\x01abc')
+    assert v._write() == b'\x01abc'
@@ -0,0 +1,95 @@
+import pickle as _pickle
+import sys as _sys
+
+import pytest as _pytest
+
+import format as _format
+from format.jaus import Id
+from format.jaus.judp import Packet, Payload
+
+
+class Point(_format.Specification):
+    _compact = True
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('x', bytes=1)
+        yield _format.Integer('y', bytes=1, default=0)
+
+class CachedPoint(Point):
+    _encode_once = True
+
+class LoosePoint(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('x', bytes=1)
+        yield _format.Integer('y', bytes=1, default=0)
+
+def test__fields_are_a_tuple():
+    p = Point(x=1, y=2)
+    assert isinstance(p, tuple)
+    assert tuple.__eq__(p, (1, 2))
+    assert p._fields == ('x', 'y')
+    assert (p.x, p.y) == (1, 2)
+    assert repr(p) == 'Point(x=1, y=2)'
+
+def test__eq_and_hash():
+    assert Point(x=1, y=2) == Point._read(b'\x01\x02')
+    assert Point(x=1, y=2) != Point(x=1, y=3)
+    assert hash(Point(x=1)) == hash((1, 0))
+    assert Point(x=1) != (1, 0)
+    assert {Point(x=1): 'a'}[Point(x=1, y=0)] == 'a'
+    # the cached encoding doesn't count
+    p = CachedPoint(x=1)
+    p._write()
+    assert p == CachedPoint(x=1)
+    assert hash(p) == hash(CachedPoint(x=1))
+
+def test__not_a_sequence():
+    p = Point(x=1, y=2)
+    assert p
+    for operation in (len, list, lambda p: 1 in p, lambda p: p < (9, 9), lambda p: (9, 9) > p, lambda p: p + ()):
+        with _pytest.raises(TypeError):
+            operation(p)
+
+def test__set_field():
+    p = Point(x=1, y=2)
+    with _pytest.raises(AttributeError):
+        p.y = 5
+    p = p._replace(y=5)
+    assert (p.x, p.y) == (1, 5)
+    assert p._write() == b'\x01\x05'
+
+def test__set_field_drops_encoding():
+    p = CachedPoint(x=1, y=2)
+    assert p._write() == b'\x01\x02'
+    assert p._replace(x=3)._write() == b'\x03\x02'
+    assert p._write() == b'\x01\x02'
+
+def test__size():
+    # no object besides the tuple, and no room for attributes
+    assert _sys.getsizeof(Point(x=1, y=2)) == _sys.getsizeof((1, 2))
+    assert _sys.getsizeof(Point(x=1, y=2)) < _sys.getsizeof(LoosePoint(x=1, y=2))
+    # nor once the encoding is kept
+    for p in (Point(x=1, y=2), CachedPoint(x=1, y=2), Id(subsystem=1, node=1, component=1)):
+        p._write()
+        assert not hasattr(p, '__dict__')
+    assert _sys.getsizeof(CachedPoint(x=1, y=2)) == _sys.getsizeof((1, 2, None))
+
+@_pytest.mark.parametrize('instance', [
+        Point(x=1, y=2),
+        CachedPoint(x=3),
+        Payload._read(bytes.fromhex('0200110009ffffffff0201e803002b020400')).packets[0],
+    ])
+def test__pickle(instance):
+    copy = _pickle.loads(_pickle.dumps(instance))
+    assert copy == instance
+    assert type(copy) is type(instance)
+
+def test__transport_records_are_compact():
+    packet = Payload._read(bytes.fromhex('0200110009ffffffff0201e803002b020400')).packets[0]
+    assert isinstance(packet, tuple)
+    assert not hasattr(packet, '__dict__')
+    assert packet.source_id == Id(subsystem=1000, node=1, component=2)
+    assert hash(packet.source_id) == hash(Id(subsystem=1000, node=1, component=2))
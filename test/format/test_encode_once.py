@@ -0,0 +1,56 @@
+import bitstring as _bitstring
+
+import format as _format
+
+class Cached(_format.Specification):
+    _encode_once = True
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=1)
+        yield _format.Integer('bar', bytes=1, default=2)
+
+class Unaligned(_format.Specification):
+    _encode_once = True
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bits=3)
+
+class Outer(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Repeat('items', specification=Unaligned, count=2)
+        yield _format.Integer('pad', bits=2, default=0)
+
+def test__encoding_is_reused():
+    c = Cached(foo=1)
+    first = c._write()
+    assert first == b'\x01\x02'
+    assert c._write() is first
+
+def test__assignment_invalidates():
+    c = Cached(foo=1)
+    c._write()
+    c.foo = 3
+    assert c._write() == b'\x03\x02'
+    assert c == Cached(foo=3)
+
+def test__written_into_streams():
+    c = Cached(foo=1)
+    s = _bitstring.BitStream('0b1')
+    s.pos = 1
+    c._write(s)
+    c._write(s)
+    assert s == _bitstring.Bits('0b1, 0x01020102')
+
+def test__unaligned_encodings():
+    o = Outer(items=[Unaligned(foo=1), Unaligned(foo=7)])
+    assert o._write() == b'\x3c'
+    assert o._write() == b'\x3c'
+
+def test__read_instances_cache_too():
+    c = Cached._read(b'\x05\x06')
+    assert c._write() is c._write()
+    assert c._write() == b'\x05\x06'
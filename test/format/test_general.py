@@ -52,3 +52,11 @@ def test__constructor_raises_on_extra_argument():
     with _pytest.raises(_f.UnusedParametersError) as excinfo:
         Foo(foo=2, ping=5)
     assert excinfo.value.args == ({'ping': 5},)
+
+def test__replace(f1):
+    f2 = f1._replace(bar=7)
+    assert f2 == Foo(foo=3, bar=7)
+    assert type(f2) is type(f1)
+    assert f1.bar == 2
+    with _pytest.raises(_f.UnusedParametersError):
+        f1._replace(baz=1)
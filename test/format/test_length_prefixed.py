@@ -0,0 +1,40 @@
+import format as _format
+
+class Item(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('foo', bytes=1)
+
+class Counted(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.LengthPrefixedBytes('raw', bytes=2, le=True)
+        yield _format.LengthPrefixedString('text', bytes=1)
+        yield _format.LengthPrefixedRepeat('items', specification=Item, bytes=1)
+
+def test__write():
+    c = Counted(raw=b'ab', text='xyz', items=[Item(foo=1), Item(foo=2)])
+    assert c._write() == b'\x02\x00ab\x03xyz\x02\x01\x02'
+    assert Counted(raw=b'', text='', items=[])._write() == b'\x00\x00\x00\x00'
+
+def test__read():
+    c = Counted._read(b'\x02\x00ab\x03xyz\x02\x01\x02')
+    assert c == Counted(raw=b'ab', text='xyz', items=[Item(foo=1), Item(foo=2)])
+
+def test__count_is_not_a_field():
+    c = Counted(raw=b'ab', text='xyz', items=[])
+    assert c._fields == ('raw', 'text', 'items')
+
+def test__views():
+    class Viewed(_format.Specification):
+        @classmethod
+        def _data(cls, data):
+            yield from super()._data(data)
+            yield _format.LengthPrefixedBytes('raw', bytes=1, view=True)
+    buf = b'\x02ab'
+    v = Viewed._read(buf)
+    assert isinstance(v.raw, memoryview)
+    assert v.raw.obj is buf
+    assert v._write() == buf
@@ -0,0 +1,84 @@
+import pytest
+
+import format.log as _log
+from format.jaus import Message
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+def write_log(path, n=10):
+    with _log.Writer(path) as w:
+        for i in range(n):
+            w.write(
+                bytes([i]) * i,
+                timestamp=100.0 + i,
+                source=('10.0.0.1', 3794),
+                destination=('::1', 5000 + i),
+                codes=[i % 3] if i % 2 == 0 else [])
+
+def test__roundtrip(tmpdir):
+    path = str(tmpdir.join('log'))
+    write_log(path)
+    with _log.Reader(path) as r:
+        assert len(r) == 10
+        entry = r[3]
+        assert entry.timestamp == 103.0
+        assert entry.source == ('10.0.0.1', 3794)
+        assert entry.destination == ('::1', 5003)
+        assert bytes(entry.data) == b'\x03\x03\x03'
+        assert r[-1].timestamp == 109.0
+        assert [bytes(e.data) for e in r] == [bytes([i]) * i for i in range(10)]
+        del entry
+
+def test__time_window(tmpdir):
+    path = str(tmpdir.join('log'))
+    write_log(path)
+    with _log.Reader(path) as r:
+        assert list(r.records(start=102.5, end=105)) == [3, 4]
+        assert list(r.records(start=102)) == list(range(2, 10))
+        assert list(r.records(end=100)) == []
+        assert [e.timestamp for e in r.select(start=108.0)] == [108.0, 109.0]
+
+def test__codes(tmpdir):
+    path = str(tmpdir.join('log'))
+    write_log(path)
+    with _log.Reader(path) as r:
+        # even records have code i % 3
+        assert list(r.records(codes=[0])) == [0, 6]
+        assert list(r.records(codes=[1, 2])) == [2, 4, 8]
+        assert list(r.records(start=103, codes=[1, 2])) == [4, 8]
+        assert list(r.records(codes=[7])) == []
+
+def test__duplicate_codes(tmpdir):
+    path = str(tmpdir.join('log'))
+    code = Message.Code.ReportLocalPose
+    with _log.Writer(path) as w:
+        w.write(b'a', timestamp=1, codes=[code, code, 5])
+    with _log.Reader(path) as r:
+        assert list(r.records(codes=[code, 5])) == [0]
+
+def test__append(tmpdir):
+    path = str(tmpdir.join('log'))
+    write_log(path, 2)
+    with _log.Writer(path) as w:
+        assert len(w) == 2
+        with pytest.raises(ValueError):
+            w.write(b'x', timestamp=100.5)
+        assert w.write(b'x', timestamp=200) == 2
+    with _log.Reader(path) as r:
+        assert [bytes(e.data) for e in r] == [b'', b'\x01', b'x']
+
+def test__empty(tmpdir):
+    path = str(tmpdir.join('log'))
+    _log.Writer(path).close()
+    with _log.Reader(path) as r:
+        assert len(r) == 0
+        assert list(r.select(start=0, codes=[1])) == []
+
+def test__decode_selected(tmpdir):
+    path = str(tmpdir.join('log'))
+    with _log.Writer(path) as w:
+        w.write(ReportLocalPose(x=1)._write(), timestamp=1, codes=[Message.Code.ReportLocalPose])
+        w.write(b'\x02\x22', timestamp=2, codes=[Message.Code.QueryHeartbeatPulse])
+    with _log.Reader(path) as r:
+        [message] = [Message._read(bytes(e.data)) for e in r.select(codes=[Message.Code.ReportLocalPose])]
+        assert round(message.x) == 1
@@ -0,0 +1,64 @@
+import concurrent.futures as _futures
+import threading as _threading
+import time as _time
+
+import pytest as _pytest
+
+import format as _format
+import format.bulk as _bulk
+from format.jaus import Message
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+def make_spec():
+    # a new class each time, so every cache starts out empty
+    class Shaped(_format.Specification):
+        _traced = True
+        @classmethod
+        def _data(cls, data):
+            yield from super()._data(data)
+            kind = yield _format.Integer('kind', bytes=1, branch=True)
+            for i in range(kind):
+                yield _format.Integer('f{}'.format(i), bytes=1)
+    return Shaped
+
+def test__concurrent_cold_caches():
+    threads = 16
+    spec = make_spec()
+    records = [bytes([kind]) + bytes(range(kind)) for kind in range(8)]
+    barrier = _threading.Barrier(threads)
+    def work():
+        barrier.wait()
+        return [spec._read(r) for r in records * 50]
+    with _futures.ThreadPoolExecutor(threads) as pool:
+        results = [f.result() for f in [pool.submit(work) for i in range(threads)]]
+    for result in results:
+        assert [r._write() for r in result] == records * 50
+        # everyone got the same class for the same fields
+        assert [type(r) for r in result] == [type(r) for r in results[0]]
+    assert len(spec._slots_cache) == 8
+    assert spec._traces == 8
+
+def test__concurrent_writes():
+    threads = 8
+    messages = [ReportLocalPose(x=i, y=i, yaw=0) for i in range(50)]
+    expected = [m._write() for m in messages]
+    barrier = _threading.Barrier(threads)
+    def work():
+        barrier.wait()
+        return [Message._read(m._write())._write() for m in messages]
+    with _futures.ThreadPoolExecutor(threads) as pool:
+        for f in [pool.submit(work) for i in range(threads)]:
+            assert f.result() == expected
+
+@_pytest.mark.parametrize('workers', [1, 2, 4, 8])
+def test__decode_threads(workers, record_property):
+    records = [ReportLocalPose(x=i % 100, yaw=0.5)._write() for i in range(2000)]
+    buf = b''.join(_bulk.frame(r) for r in records)
+    start = _time.perf_counter()
+    decoded = list(_bulk.decode_threads(Message, buf, workers=workers, batch_size=100))
+    elapsed = _time.perf_counter() - start
+    assert [d._write() for d in decoded] == records
+    # throughput against the number of threads, reported (in --junitxml)
+    # rather than checked, since it depends on the machine and its load
+    record_property('records_per_second', round(len(records) / elapsed))
@@ -0,0 +1,87 @@
+import format as _format
+
+from format.jaus import Message
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+runs = []
+
+class Tagged(_format.Specification):
+    _traced = True
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        runs.append(cls)
+        kind = yield _format.Integer('kind', bytes=1, branch=True)
+        if kind == 1:
+            yield _format.Integer('a', bytes=1)
+        else:
+            length = yield _format.Integer('length', bytes=1)
+            yield _format.Bytes('b', length=lambda data: data['length'])
+        yield _format.Integer('end', bytes=1, default=0xff)
+
+class Limited(Tagged):
+    _max_traces = 1
+
+class Untraced(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        runs.append(cls)
+        yield _format.Integer('a', bytes=1)
+
+def reads(cls, buffer):
+    runs.clear()
+    result = cls._read(buffer)
+    return result, runs.count(cls)
+
+def test__read_is_replayed():
+    # the first read records the run, instantiating runs it again
+    assert reads(Tagged, b'\x01\x05\xff') == (Tagged(kind=1, a=5), 2)
+    assert reads(Tagged, b'\x01\x06\xff') == (Tagged(kind=1, a=6), 0)
+    # a new branch value goes through the generator
+    assert reads(Tagged, b'\x00\x02ab\xff') == (Tagged(kind=0, length=2, b=b'ab'), 2)
+    assert reads(Tagged, b'\x00\x03abc\xff') == (Tagged(kind=0, length=3, b=b'abc'), 0)
+    assert Tagged._traces == 2
+
+def test__replayed_instances_match():
+    Tagged._read(b'\x01\x05\xff')
+    replayed = Tagged._read(b'\x01\x05\xff')
+    generated = Tagged(kind=1, a=5)
+    assert type(replayed) is type(generated)
+    assert replayed._fields == ('kind', 'a', 'end')
+
+def test__write_is_replayed():
+    t = Tagged(kind=1, a=7)
+    assert t._write() == b'\x01\x07\xff'
+    runs.clear()
+    assert Tagged(kind=1, a=8, end=1)._write() == b'\x01\x08\x01'
+    # one run to instantiate, none to write
+    assert runs == [Tagged]
+
+def test__write_of_new_branch_falls_back():
+    Tagged._read(b'\x01\x05\xff')
+    t = Tagged(kind=2, length=1, b=b'z')
+    assert t._write() == b'\x02\x01z\xff'
+    assert Tagged._read(t._write()) == t
+
+def test__max_traces():
+    Limited._read(b'\x01\x05\xff')
+    Limited._read(b'\x00\x00\xff')
+    assert Limited._traces == 1
+    assert reads(Limited, b'\x00\x01a\xff')[1] == 2
+    assert reads(Limited, b'\x01\x05\xff')[1] == 0
+
+def test__untraced():
+    Untraced._read(b'\x01')
+    assert Untraced._trace is None
+    assert reads(Untraced, b'\x01')[1] == 2
+
+def test__presence_vector_masks_are_branches():
+    ReportLocalPose._trace, ReportLocalPose._traces = None, 0
+    for kwargs in [dict(x=1, y=2), dict(yaw=0.5), dict(x=1, y=2)]:
+        m = ReportLocalPose(**kwargs)
+        r = Message._read(m._write())
+        assert r.presence_vector == m.presence_vector
+        assert r._write() == m._write()
+    assert ReportLocalPose._traces == 2
@@ -0,0 +1,82 @@
+import enum as _enum
+
+import pytest as _pytest
+
+import format as _format
+import format.workload as _workload
+
+
+class Kind(_enum.Enum):
+    A = 1
+    B = 2
+
+class Point(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('x', bytes=1)
+        yield _format.Integer('y', bytes=2, le=True)
+        yield _format.Enum('kind', enum=Kind, bytes=1)
+        yield _format.Integer('version', bytes=1, default=3)
+
+class Shape(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.LengthPrefixedString('name', bytes=1)
+        yield _format.LengthPrefixedRepeat('points', specification=Point, bytes=1)
+
+class Blob(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Bytes('blob', length=4)
+
+def test__round_trip():
+    for shape, encoded in _workload.Workload(seed=0).samples(Shape, 200):
+        assert Shape._read(encoded) == shape
+        for point in shape.points:
+            assert 0 <= point.x < 256
+            assert point.kind in Kind
+            assert point.version == 3
+
+def test__seed():
+    first = list(_workload.Workload(seed=1).samples(Shape, 20))
+    assert first == list(_workload.Workload(seed=1).samples(Shape, 20))
+    assert first != list(_workload.Workload(seed=2).samples(Shape, 20))
+
+def test__size():
+    workload = _workload.Workload(seed=0, size=lambda random: 1000)
+    shape = workload.instance(Shape)
+    # limited to what the count can hold
+    assert len(shape.name) == len(shape.points) == 255
+    workload = _workload.Workload(seed=0, size=lambda random: 0)
+    assert workload.instance(Shape).points == []
+
+def test__generator():
+    class Constant(_format.Bytes):
+        pass
+    @_workload.generator(Constant)
+    def constant(workload, record, data):
+        return b'c' * record.length
+    class Constants(_format.Specification):
+        @classmethod
+        def _data(cls, data):
+            yield from super()._data(data)
+            yield Constant('c', length=2)
+    assert _workload.Workload().instance(Constants).c == b'cc'
+    assert len(_workload.Workload().instance(Blob).blob) == 4
+
+def test__unknown_record():
+    class Unknown(_format.Record):
+        def read(self, stream, data):
+            pass
+        def write(self, val, stream, data):
+            pass
+    class Strange(_format.Specification):
+        @classmethod
+        def _data(cls, data):
+            yield from super()._data(data)
+            yield Unknown('u')
+    with _pytest.raises(TypeError):
+        _workload.Workload().instance(Strange)
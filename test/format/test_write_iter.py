@@ -0,0 +1,80 @@
+import format as _format
+from format.jaus import Id
+from format.jaus.judp import Packet, Payload
+
+
+class Point(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('x', bytes=2)
+        yield _format.Integer('y', bytes=2)
+
+class Points(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Integer('version', bytes=1, default=1)
+        yield _format.Consume('points', specification=Point)
+
+class Polygon(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.LengthPrefixedRepeat('points', specification=Point, bytes=2)
+
+class Shapes(_format.Specification):
+    @classmethod
+    def _data(cls, data):
+        yield from super()._data(data)
+        yield _format.Repeat('corners', specification=Point, count=2)
+        yield _format.LengthPrefixedRepeat('shapes', specification=Polygon, bytes=1)
+
+def points(n):
+    return [Point(x=i % 65536, y=i // 65536) for i in range(n)]
+
+def test__chunks():
+    big = Points(points=points(10000))
+    chunks = list(big._write_iter(chunk_size=1000))
+    assert b''.join(chunks) == big._write()
+    assert all(1000 <= len(chunk) < 1004 for chunk in chunks[:-1])
+    assert len(chunks[-1]) <= 1000
+
+def test__nested():
+    shapes = Shapes(
+        corners=points(2),
+        shapes=[Polygon(points=points(i * 100)) for i in range(20)])
+    chunks = list(shapes._write_iter(chunk_size=64))
+    assert b''.join(chunks) == shapes._write()
+    assert max(len(chunk) for chunk in chunks) < 64 + 4
+    assert Shapes._read(b''.join(chunks)) == shapes
+
+def test__lazy():
+    taken = []
+    def lazy():
+        for point in points(10000):
+            taken.append(point)
+            yield point
+    chunks = Points(points=lazy())._write_iter(chunk_size=100)
+    first = next(chunks)
+    assert len(first) >= 100
+    assert len(taken) < 100
+    assert first + b''.join(chunks) == Points(points=points(10000))._write()
+
+def test__lazy_length_prefixed():
+    polygon = Polygon(points=iter(points(1000)))
+    assert b''.join(polygon._write_iter(chunk_size=100)) == Polygon(points=points(1000))._write()
+
+def test__small():
+    assert list(Point(x=1, y=2)._write_iter()) == [b'\x00\x01\x00\x02']
+
+def test__packets():
+    payload = Payload(packets=[
+        Packet(
+            contents=b'x' * 100,
+            data_flags=Packet.DataFlags.SINGLE_PACKET,
+            destination_id=Id(subsystem=1, node=1, component=1),
+            source_id=Id(subsystem=2, node=2, component=2),
+            sequence_number=i)
+        for i in range(100)])
+    assert b''.join(payload._write_iter(chunk_size=512)) == payload._write()
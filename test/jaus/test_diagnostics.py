@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import tracemalloc
+
+import pytest
+
+import format.jaus.diagnostics as _diagnostics
+from format.jaus import Id
+from format.jaus.judp import Packet
+from format.jaus.services import EventsService, LivenessService
+
+
+@pytest.fixture
+def core_service_list():
+    return [LivenessService, EventsService]
+
+def test__deep_size():
+    small = _diagnostics.deep_size([b'a'])
+    big = _diagnostics.deep_size([b'a', b'b' * 1000])
+    assert big.objects == small.objects + 1
+    assert big.bytes > small.bytes + 1000
+    shared = b'c' * 1000
+    assert _diagnostics.deep_size([shared], exclude=[shared]).objects == 1
+
+def test__report(core_component, protocol):
+    protocol._reassembly.add(Id(subsystem=1, node=1, component=1), 0, Packet.DataFlags.FIRST_PACKET, b'x' * 1000)
+    usage = _diagnostics.report(core_component, protocol)
+    assert usage['protocol._reassembly'].bytes > 1000
+    assert 'protocol._resolvers' in usage
+    assert 'protocol._senders' in usage
+    assert 'events.events' in usage
+    # back references to the owners aren't counted
+    assert 'events.component' not in usage
+    assert 'protocol._reassembly' in _diagnostics.format_report(usage)
+
+def test__compare():
+    old = _diagnostics.take_snapshot()
+    ids = [Id(subsystem=i, node=1, component=1) for i in range(10)]
+    classes, lines = _diagnostics.compare(old, _diagnostics.take_snapshot())
+    assert classes['format.jaus.Id'].objects == 10
+    del ids
+
+def test__compare_tracemalloc():
+    tracemalloc.start()
+    try:
+        old = _diagnostics.take_snapshot()
+        ids = [Id(subsystem=i, node=1, component=1) for i in range(100)]
+        classes, lines = _diagnostics.compare(old, _diagnostics.take_snapshot())
+    finally:
+        tracemalloc.stop()
+    assert lines
+    assert all('format' in str(line) for line in lines)
+    del ids
+
+@pytest.mark.asyncio
+async def test__log_periodically(event_loop, core_component, protocol, caplog):
+    caplog.set_level(logging.INFO)
+    task = _diagnostics.log_periodically(core_component, protocol, interval=0.01, loop=event_loop)
+    try:
+        await asyncio.sleep(0.1, loop=event_loop)
+    finally:
+        task.cancel()
+    assert 'protocol._reassembly' in caplog.text
@@ -0,0 +1,146 @@
+import collections as _collections
+import os as _os
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+import format.log as _log
+import format.jaus.export as _export
+import format.jaus.judp as _judp
+from format.jaus import Id, Message
+from format.jaus.judp import Packet, Payload
+from format.jaus.core.liveness import ReportHeartbeatPulse
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+def poses():
+    for i in range(20):
+        if i % 5 == 4:
+            yield float(i), ReportLocalPose(x=i, yaw=0.1)._write()
+        else:
+            yield float(i), ReportLocalPose(x=i, y=-i)._write()
+    yield 20.0, ReportHeartbeatPulse()._write()
+
+def test__export():
+    tables = _export.export(poses())
+    assert set(tables) == {Message.Code.ReportLocalPose, Message.Code.ReportHeartbeatPulse}
+    table = tables[Message.Code.ReportLocalPose]
+    assert list(table['timestamp']) == [float(i) for i in range(20)]
+    assert numpy.allclose(table['x'], range(20), atol=1e-3)
+    # y is missing wherever yaw was sent instead
+    assert list(numpy.ma.getmaskarray(table['y'])) == [i % 5 == 4 for i in range(20)]
+    assert numpy.allclose(table['y'].compressed(), [-i for i in range(20) if i % 5 != 4], atol=1e-3)
+    assert table['yaw'].count() == 4
+    assert 'z' not in table
+    assert table['message_code'][0] == Message.Code.ReportLocalPose.value
+
+def test__export_matches_decoding():
+    messages = list(poses())[:-1]
+    table = _export.export(messages)[Message.Code.ReportLocalPose]
+    for row, (timestamp, message) in enumerate(messages):
+        decoded = Message._read(message)
+        assert int(decoded.presence_vector) == table['presence_vector'][row]
+        for name in ('x', 'y', 'yaw'):
+            value = getattr(decoded, name)
+            if value is None:
+                assert table[name].mask[row]
+            else:
+                assert table[name][row] == pytest.approx(value)
+
+def test__export_codes():
+    tables = _export.export(poses(), codes=[Message.Code.ReportHeartbeatPulse])
+    assert list(tables) == [Message.Code.ReportHeartbeatPulse]
+
+def test__messages_from_log(tmpdir):
+    path = str(tmpdir.join('log'))
+    big = ReportLocalPose(x=1)._write() + b'\x00' * 600
+    def packet(contents, data_flags, sequence_number):
+        return Packet(
+            contents=contents, data_flags=data_flags,
+            destination_id=Id(subsystem=1, node=1, component=1),
+            source_id=Id(subsystem=2, node=2, component=2),
+            sequence_number=sequence_number)
+    with _log.Writer(path) as w:
+        w.write(Payload(packets=[
+            packet(ReportHeartbeatPulse()._write(), Packet.DataFlags.SINGLE_PACKET, 0),
+            packet(big[:300], Packet.DataFlags.FIRST_PACKET, 1),
+        ])._write(), timestamp=1)
+        w.write(Payload(packets=[
+            packet(big[300:], Packet.DataFlags.LAST_PACKET, 2),
+        ])._write(), timestamp=2)
+    with _log.Reader(path) as r:
+        assert list(_export.messages_from_log(r)) == [
+            (1, ReportHeartbeatPulse()._write()),
+            (2, big),
+        ]
+
+def fragments_log(path, sequence_numbers):
+    big = ReportLocalPose(x=1)._write() + bytes(range(200)) * 3
+    flags = [Packet.DataFlags.FIRST_PACKET] + [Packet.DataFlags.NORMAL_PACKET] * 2 + [Packet.DataFlags.LAST_PACKET]
+    with _log.Writer(path) as w:
+        for timestamp, i in enumerate(sequence_numbers):
+            w.write(Payload(packets=[Packet(
+                contents=big[i * 200:(i + 1) * 200], data_flags=flags[i],
+                destination_id=Id(subsystem=1, node=1, component=1),
+                source_id=Id(subsystem=2, node=2, component=2),
+                sequence_number=i)])._write(), timestamp=timestamp)
+    return big
+
+def test__messages_from_log_duplicates(tmpdir):
+    path = str(tmpdir.join('log'))
+    # sent again before the rest
+    big = fragments_log(path, [0, 1, 0, 1, 2, 1, 3, 3])
+    with _log.Reader(path) as r:
+        assert list(_export.messages_from_log(r)) == [(6, big)]
+
+def test__messages_from_log_missing(tmpdir):
+    path = str(tmpdir.join('log'))
+    fragments_log(path, [0, 1, 3])
+    with _log.Reader(path) as r:
+        assert list(_export.messages_from_log(r)) == []
+
+def test__messages_from_log_compressed(tmpdir):
+    path = str(tmpdir.join('log'))
+    A = Id(subsystem=2, node=2, component=2)
+    B = Id(subsystem=1, node=1, component=1)
+    flow = _judp._CompressionFlow(clock=lambda: 0)
+    messages = [ReportLocalPose(x=10, y=i * 0.01, z=1)._write() for i in range(10)]
+    with _log.Writer(path) as w:
+        # compressed with a number asked for before the log started
+        w.write(Payload(packets=[_judp._with_header_compression(Packet(
+            contents=messages[0][6:], data_flags=Packet.DataFlags.SINGLE_PACKET,
+            destination_id=B, source_id=A, sequence_number=0),
+            Packet.HCFlags.COMPRESSED, 7, 6, messages[0][6:])])._write(), timestamp=0)
+        for i, message in enumerate(messages):
+            packet = flow.compress(Packet(
+                contents=message, data_flags=Packet.DataFlags.SINGLE_PACKET,
+                destination_id=B, source_id=A, sequence_number=i + 1))
+            packets = [packet]
+            if packet.HC_flags is Packet.HCFlags.REQUESTED:
+                flow.accepted(packet)
+                packets.append(_judp._with_header_compression(Packet(
+                    contents=b'', data_flags=Packet.DataFlags.SINGLE_PACKET,
+                    destination_id=A, source_id=B, sequence_number=i + 1),
+                    Packet.HCFlags.HC_LENGTH, packet.HC_number, packet.HC_length, b''))
+            w.write(Payload(packets=packets)._write(), timestamp=i + 1)
+    skipped = _collections.Counter()
+    with _log.Reader(path) as r:
+        flags = [p.HC_flags for entry in r for p in Payload._read(entry.data).packets]
+        assert flags.count(Packet.HCFlags.COMPRESSED) == 9
+        assert list(_export.messages_from_log(r, skipped=skipped)) == [
+            (i + 1, message) for i, message in enumerate(messages)]
+    assert skipped == {'compressed': 1}
+
+def test__save(tmpdir):
+    tables = _export.export(poses())
+    npz = str(tmpdir.join('poses.npz'))
+    _export.save_npz(npz, tables)
+    with numpy.load(npz) as saved:
+        assert numpy.array_equal(saved['ReportLocalPose.timestamp'], tables[Message.Code.ReportLocalPose]['timestamp'])
+        assert numpy.array_equal(saved['ReportLocalPose.y.mask'], tables[Message.Code.ReportLocalPose]['y'].mask)
+    directory = str(tmpdir.join('poses'))
+    _export.save_npy(directory, tables)
+    x = numpy.load(_os.path.join(directory, 'ReportLocalPose.x.npy'), mmap_mode='r')
+    assert isinstance(x, numpy.memmap)
+    assert numpy.array_equal(x, tables[Message.Code.ReportLocalPose]['x'].data)
@@ -0,0 +1,54 @@
+import os as _os
+import subprocess as _subprocess
+import sys as _sys
+
+import pytest as _pytest
+
+import format.jaus.services as _services
+
+ROOT = _os.path.dirname(_os.path.dirname(_os.path.dirname(_os.path.abspath(__file__))))
+
+def run(*args):
+    env = dict(_os.environ, PYTHONPATH=ROOT)
+    return _subprocess.run(
+        [_sys.executable] + list(args),
+        env=env, stdout=_subprocess.PIPE, stderr=_subprocess.PIPE,
+        universal_newlines=True, check=True)
+
+def loaded_after(code):
+    out = run('-c', code + '; import sys; print(" ".join(sorted(sys.modules)))').stdout
+    return set(out.split())
+
+def test__services_are_imported_lazily():
+    modules = loaded_after('import format.jaus.services')
+    assert not any(m.startswith(('format.jaus.core.', 'format.jaus.mobility.')) for m in modules)
+    assert 'asyncio' not in modules
+
+def test__messages_are_imported_lazily():
+    modules = loaded_after(
+        'from format.jaus import Message; '
+        'Message._read(bytes.fromhex("02220000"))')
+    assert 'format.jaus.core.liveness' in modules
+    assert 'format.jaus.core.discovery' not in modules
+    assert 'format.jaus.mobility.local_pose_sensor' not in modules
+
+def test__services_module():
+    from format.jaus.core.liveness import Service
+    assert _services.LivenessService is Service
+    assert 'VelocityStateSensorService' in dir(_services)
+    with _pytest.raises(AttributeError):
+        _services.NoSuchService
+
+def import_time(*modules):
+    # the quickest of a few runs, in a fresh interpreter
+    code = 'import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)'.format(
+        ', '.join(modules))
+    return min(float(run('-c', code).stdout) for i in range(3))
+
+def test__importtime(record_property):
+    # laziness is checked by test__services_are_imported_lazily; what it
+    # saves depends on the machine and its load, so it is only reported
+    baseline = import_time('format.jaus')
+    record_property('services_import_seconds', import_time('format.jaus.services') - baseline)
+    record_property('eager_import_seconds', import_time('format.jaus.services', *(
+        'format.jaus' + module for module in _services._services.values())) - baseline)
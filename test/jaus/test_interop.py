@@ -44,3 +44,9 @@ def test__messages__parse_3rd_party(msg, expected):
 def test__id__parse():
     assert Id._read(BitStream('0x0201e803')) == Id(subsystem=1000, node=1, component=2)
 
+def test__payload_contents_are_views():
+    datagram = bytes.fromhex('0200110009ffffffff0201e803002b020400')
+    contents = Payload._read(datagram).packets[0].contents
+    assert isinstance(contents, memoryview)
+    assert contents.obj is datagram
+    assert Message._read(contents) == QueryIdentification(type=QueryIdentification.QueryType.SUBSYSTEM)
@@ -0,0 +1,21 @@
+import pytest
+
+from format.jaus.judp import Packet
+from format.jaus.core.management import SetEmergency, EmergencyCode, QueryStatus
+
+
+@pytest.mark.asyncio
+async def test__message_priority(event_loop, core_component, protocol, test_connection, test_id, test_protocol_port):
+    protocol.routings[test_id] = ('localhost', test_protocol_port)
+    await core_component.send_message(SetEmergency(emergency_code=EmergencyCode.STOP), destination_id=test_id)
+    await core_component.send_message(QueryStatus(), destination_id=test_id, priority=Packet.Priority.LOW)
+    await core_component.send_message(QueryStatus(), destination_id=test_id)
+    sent = {priority: metrics['sent'] for priority, metrics in protocol.queue_metrics().items()}
+    assert sent == {
+        Packet.Priority.SAFETY: 1,
+        Packet.Priority.HIGH: 0,
+        Packet.Priority.STANDARD: 1,
+        Packet.Priority.LOW: 1,
+    }
+    for i in range(3):
+        await test_connection.listen(timeout=2)
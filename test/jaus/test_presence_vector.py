@@ -0,0 +1,62 @@
+import pytest
+
+from format.jaus import Presence, PresenceVector
+from format.jaus.mobility.local_pose_sensor import (
+        QueryLocalPose,
+        ReportLocalPose,
+)
+from format.jaus.mobility.velocity_state_sensor import QueryVelocityState
+from format.jaus.mobility.local_waypoint_driver import SetLocalWaypoint
+
+
+def test__presence_is_a_mask():
+    pv = QueryLocalPose(presence_vector=['x', 'y']).presence_vector
+    assert isinstance(pv, Presence)
+    assert int(pv) == 0b1100000000000000
+    assert 'x' in pv
+    assert 'z' not in pv
+    assert 'timestamp' not in pv
+    assert pv == {'x', 'y'}
+    assert {'y', 'x'} == pv
+    assert len(pv) == 2
+    assert list(pv) == ['x', 'y']
+
+def test__presence_accepts_masks():
+    assert QueryLocalPose(presence_vector=0b0100000000000000).presence_vector == {'y'}
+    assert QueryLocalPose(presence_vector=0b0100000000000000) == QueryLocalPose(presence_vector={'y'})
+
+def test__presence_hash_matches_set():
+    pv = QueryLocalPose(presence_vector={'x', 'y'}).presence_vector
+    assert hash(pv) == hash(frozenset({'x', 'y'}))
+
+def test__presence_wire_format():
+    assert QueryLocalPose(presence_vector={'x', 'yaw'})._write() == b'\x03\x24\x82\x00'
+    assert QueryLocalPose._read(b'\x03\x24\x82\x00').presence_vector == {'x', 'yaw'}
+
+def test__presence_duplicate_fields():
+    # QueryVelocityState lists 'x' twice; both bits belong to it
+    b = QueryVelocityState(presence_vector={'x'})._write()
+    assert b == b'\x04\x24\xa0\x00'
+    assert QueryVelocityState._read(b'\x04\x24\x20\x00').presence_vector == {'x'}
+
+def test__presence_tables_are_shared():
+    a = PresenceVector('pv', fields=['a', 'b'], bytes=1)
+    b = PresenceVector('pv', fields=['a', 'b'], bytes=1)
+    assert a.table is b.table
+    assert a.table == {'a': 0b10000000, 'b': 0b01000000}
+
+def test__with_presence_vector_default():
+    m = ReportLocalPose(x=1, yaw=0)
+    assert m.presence_vector == {'x', 'yaw'}
+    assert m.y is None
+    r = ReportLocalPose._read(m._write())
+    assert r.presence_vector == {'x', 'yaw'}
+    assert round(r.x) == 1
+    assert r.y is None
+
+def test__with_presence_vector_explicit_mask():
+    m = SetLocalWaypoint(presence_vector=0, x=1, y=2, z=3)
+    assert m.presence_vector == set()
+    r = SetLocalWaypoint._read(m._write())
+    assert r.presence_vector == set()
+    assert r.z is None
@@ -0,0 +1,20 @@
+import format.jaus.workload as _workload
+from format.jaus import Message
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+def test__every_message_round_trips():
+    seen = set()
+    for message, encoded in _workload.messages(count=2000, seed=0):
+        assert Message._read(encoded) == message
+        seen.add(message.message_code)
+    assert seen == set(Message._registry.modules)
+
+def test__codes():
+    codes = [Message.Code.ReportLocalPose]
+    messages = list(_workload.messages(count=50, codes=codes, seed=0))
+    assert all(isinstance(message, ReportLocalPose) for message, encoded in messages)
+    # optional fields come and go with the presence vector
+    assert len(set(int(message.presence_vector) for message, encoded in messages)) > 1
+    for message, encoded in messages:
+        assert message.x is None or -100000 <= message.x <= 100000
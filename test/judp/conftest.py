@@ -0,0 +1,110 @@
+import pytest
+
+import format.jaus as jaus
+import format.jaus.judp as judp
+from format.jaus.judp import Payload
+
+SOURCE = jaus.Id(subsystem=1, node=1, component=1)
+DESTINATION = jaus.Id(subsystem=1, node=1, component=2)
+
+
+class Routes(dict):
+    """Routings sending every destination not otherwise known to `addr`."""
+    def __init__(self, addr):
+        super().__init__()
+        self.addr = addr
+    def __missing__(self, key):
+        return self.addr
+
+class Transport:
+    """Keeps the datagrams sent to it, in `sent`."""
+    def __init__(self, sockname=('localhost', 5001)):
+        self.sockname = sockname
+        self.sent = []
+    def sendto(self, datagram, addr):
+        self.sent.append(datagram)
+    def get_extra_info(self, name):
+        return self.sockname
+    def close(self):
+        pass
+
+class Link(Transport):
+    """
+    A `Transport` that also delivers datagrams to the protocol `peer` after
+    `delay`, losing the ones `lose` says to: either a function of how many
+    datagrams have been sent, or a list of (ack_nack, sequence number) of
+    packets, each lost as many times as it is listed.
+    """
+    def __init__(self, loop, sockname, delay=0.001, lose=()):
+        super().__init__(sockname)
+        self.loop = loop
+        self.delay = delay
+        self.lose = lose if callable(lose) else list(lose)
+        self.peer = None
+        # datagrams on their way
+        self.in_flight = 0
+    def sendto(self, datagram, addr):
+        super().sendto(datagram, addr)
+        if callable(self.lose):
+            if self.lose(len(self.sent)):
+                return
+        elif self.lose:
+            packets = Payload._read(datagram).packets
+            kept = [p for p in packets if not self._lost(p)]
+            if not kept:
+                return
+            if len(kept) < len(packets):
+                datagram = Payload(packets=kept)._write()
+        self.in_flight += 1
+        self.loop.call_later(self.delay, self.deliver, datagram)
+    def _lost(self, packet):
+        key = (packet.ack_nack, packet.sequence_number)
+        if key in self.lose:
+            self.lose.remove(key)
+            return True
+        return False
+    def deliver(self, datagram):
+        self.in_flight -= 1
+        self.peer.datagram_received(datagram, self.sockname)
+
+@pytest.fixture
+def transport():
+    return Transport()
+
+@pytest.fixture
+def make_protocol(event_loop):
+    """
+    Makes protocols sending to a `Transport` (unless not `connected`),
+    with everything routed to port 5002.
+    """
+    def make(sockname=('localhost', 5001), connected=True, **kwargs):
+        protocol = judp.ConnectedJUDPProtocol(loop=event_loop, **kwargs)
+        if connected:
+            protocol.connection_made(Transport(sockname))
+        protocol.routings = Routes(('localhost', 5002))
+        return protocol
+    return make
+
+@pytest.fixture
+def send():
+    """Sends a message from SOURCE to DESTINATION."""
+    def send(protocol, contents, **kwargs):
+        return protocol.send_message(contents, source_id=SOURCE, destination_id=DESTINATION, **kwargs)
+    return send
+
+@pytest.fixture
+def connect(event_loop):
+    """
+    Makes two protocols linked to each other, (a, b), with a's keyword
+    arguments, and b's in `b_kwargs`. Everything a sends is routed to b,
+    over a `Link` with `delay` and `lose`.
+    """
+    def connect(delay=0.001, lose=(), b_kwargs={}, **kwargs):
+        a = judp.ConnectedJUDPProtocol(loop=event_loop, **kwargs)
+        b = judp.ConnectedJUDPProtocol(loop=event_loop, **b_kwargs)
+        a.connection_made(Link(event_loop, ('localhost', 5001), delay, lose))
+        b.connection_made(Link(event_loop, ('localhost', 5002), delay))
+        a.transport.peer, b.transport.peer = b, a
+        a.routings = Routes(('localhost', 5002))
+        return a, b
+    return connect
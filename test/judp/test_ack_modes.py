@@ -0,0 +1,55 @@
+import pytest
+
+import format.jaus as jaus
+import format.jaus.judp as judp
+from format.jaus.judp import AckMode, Packet, Payload
+
+A = jaus.Id(subsystem=1, node=1, component=1)
+B = jaus.Id(subsystem=1, node=1, component=2)
+
+
+def acks(protocol):
+    return [p for d in protocol.transport.sent for p in Payload._read(d).packets
+            if p.ack_nack is Packet.ACKNACKFlags.ACK]
+
+@pytest.mark.asyncio
+async def test__echo(connect):
+    a, b = connect()
+    await a.send_message(b'x' * 100, source_id=A, destination_id=B, require_ack=True)
+    [ack] = acks(b)
+    assert bytes(ack.contents) == b'x' * 100
+
+@pytest.mark.asyncio
+async def test__empty(connect):
+    a, b = connect(b_kwargs=dict(ack_mode=AckMode.EMPTY))
+    await a.send_message(b'x' * 1200, source_id=A, destination_id=B, require_ack=True)
+    sent = acks(b)
+    assert len(sent) == 3
+    assert all(bytes(ack.contents) == b'' for ack in sent)
+    assert sorted(ack.sequence_number for ack in sent) == [0, 1, 2]
+
+@pytest.mark.asyncio
+async def test__range(connect):
+    a, b = connect(b_kwargs=dict(ack_mode=AckMode.RANGE, ack_delay=0.01))
+    a._sequence_numbers[A, B] = 65533
+    await a.send_message(b'x' * 2500, source_id=A, destination_id=B, require_ack=True)
+    # one acknowledgement for all six fragments, across the wrap around
+    [ack] = acks(b)
+    assert ack.sequence_number == 65533
+    assert list(judp._acknowledged(ack)) == [65533, 65534, 65535, 0, 1, 2]
+    assert a._resolvers[A, B] == {}
+
+def test__sequence_ranges():
+    assert judp._sequence_ranges([5, 3, 4, 9]) == [(3, 5), (9, 9)]
+    assert judp._sequence_ranges([65534, 65535, 0, 1, 7]) == [(65534, 1), (7, 7)]
+    assert judp._sequence_ranges(range(65536)) == [(0, 65535)]
+
+def test__echo_is_not_a_range():
+    ack = Packet(
+        ack_nack=Packet.ACKNACKFlags.ACK,
+        data_flags=Packet.DataFlags.SINGLE_PACKET,
+        destination_id=A,
+        source_id=B,
+        contents=b'\xff\xffAR\x01\x00',
+        sequence_number=7)
+    assert list(judp._acknowledged(ack)) == [7]
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+import format.jaus.judp as judp
+
+
+def packet_counts(protocol):
+    return [len(judp.Payload._read(d).packets) for d in protocol.transport.sent]
+
+@pytest.mark.asyncio
+async def test__idle(event_loop, make_protocol, send):
+    protocol = make_protocol()
+    await asyncio.sleep(0.05, loop=event_loop)
+    assert protocol._flush_handle is None
+    assert protocol.transport.sent == []
+
+@pytest.mark.asyncio
+async def test__immediate(event_loop, make_protocol, send):
+    protocol = make_protocol()
+    sent = [send(protocol, b'a'), send(protocol, b'b'), send(protocol, b'c')]
+    assert protocol.transport.sent == []
+    await asyncio.sleep(0, loop=event_loop)
+    # sent together on the next pass of the event loop
+    assert packet_counts(protocol) == [3]
+    await asyncio.wait_for(asyncio.gather(*sent, loop=event_loop), 1, loop=event_loop)
+
+@pytest.mark.asyncio
+async def test__delay(event_loop, make_protocol, send):
+    protocol = make_protocol(flush_delay=0.05)
+    send(protocol, b'a')
+    await asyncio.sleep(0, loop=event_loop)
+    send(protocol, b'b')
+    assert protocol.transport.sent == []
+    await asyncio.sleep(0.1, loop=event_loop)
+    assert packet_counts(protocol) == [2]
+
+@pytest.mark.asyncio
+async def test__max_batch(event_loop, make_protocol, send):
+    protocol = make_protocol(flush_delay=10, max_batch=2)
+    first = send(protocol, b'a')
+    send(protocol, b'b')
+    # sent right away, without waiting for the delay
+    assert packet_counts(protocol) == [2]
+    await asyncio.wait_for(first, 1, loop=event_loop)
+    send(protocol, b'c')
+    assert packet_counts(protocol) == [2]
+    await protocol.close()
+    assert packet_counts(protocol) == [2, 1]
+    assert protocol._flush_handle is None
+
+@pytest.mark.asyncio
+async def test__before_connection(event_loop, make_protocol, transport, send):
+    protocol = make_protocol(connected=False)
+    send(protocol, b'a')
+    await asyncio.sleep(0, loop=event_loop)
+    protocol.connection_made(transport)
+    assert packet_counts(protocol) == [1]
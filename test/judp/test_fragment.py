@@ -0,0 +1,48 @@
+import format.jaus as jaus
+import format.jaus.judp as judp
+from format.jaus.judp import Packet
+
+
+def split(contents):
+    protocol = judp.JUDPProtocol.__new__(judp.JUDPProtocol)
+    protocol._sequence_numbers = {}
+    return protocol._split_into_packets(
+        contents,
+        priority=Packet.Priority.STANDARD,
+        broadcast=Packet.BroadcastFlags.NONE,
+        ack_nack=Packet.ACKNACKFlags.NO_RESPONSE_REQUIRED,
+        destination_id=jaus.Id(subsystem=1, node=1, component=2),
+        source_id=jaus.Id(subsystem=1, node=1, component=1))
+
+def test__fragments_are_views():
+    contents = bytes(range(256)) * 20
+    packets = split(contents)
+    assert len(packets) == 11
+    assert b''.join(bytes(p.contents) for p in packets) == contents
+    assert all(p.contents.obj is contents for p in packets)
+    assert [p.data_flags for p in packets] == (
+        [Packet.DataFlags.FIRST_PACKET]
+        + [Packet.DataFlags.NORMAL_PACKET] * 9
+        + [Packet.DataFlags.LAST_PACKET])
+    assert [p.sequence_number for p in packets] == list(range(11))
+
+def test__fragments_encode_like_new_packets():
+    packets = split(b'x' * 1200)
+    for p in packets:
+        assert p.data_size == len(p.contents) + 14
+        fresh = Packet(
+            contents=bytes(p.contents),
+            data_flags=p.data_flags,
+            priority=p.priority,
+            broadcast=p.broadcast,
+            ack_nack=p.ack_nack,
+            destination_id=p.destination_id,
+            source_id=p.source_id,
+            sequence_number=p.sequence_number)
+        assert p._write() == fresh._write()
+        assert Packet._read(p._write()) == fresh
+
+def test__single_packet():
+    [packet] = split(b'x' * 497)
+    assert packet.data_flags is Packet.DataFlags.SINGLE_PACKET
+    assert len(split(b'x' * 498)) == 2
@@ -0,0 +1,158 @@
+import asyncio
+import types
+
+import pytest
+
+import format.jaus as jaus
+import format.jaus.judp as judp
+from format.jaus.judp import Packet, Payload
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+A = jaus.Id(subsystem=1, node=1, component=1)
+B = jaus.Id(subsystem=1, node=1, component=2)
+
+
+@pytest.fixture
+def connect(connect):
+    # with b listening as B
+    def linked(**kwargs):
+        a, b = connect(**kwargs)
+        return a, b, b.connect(B)
+    return linked
+
+def poses(count):
+    # moving along y: the code, presence vector and x stay the same
+    return [ReportLocalPose(x=10, y=i * 0.01, z=1)._write() for i in range(count)]
+
+def sent_packets(protocol):
+    return [p for d in protocol.transport.sent for p in Payload._read(d).packets]
+
+async def stream(loop, a, connection, messages, **kwargs):
+    received = []
+    for message in messages:
+        await a.send_message(message, source_id=A, destination_id=B, **kwargs)
+        # until the message, and anything sent back, has arrived
+        await asyncio.sleep(0.001, loop=loop)
+        while a.transport.in_flight or a.transport.peer.transport.in_flight:
+            await asyncio.sleep(0.001, loop=loop)
+        while not connection.recv_queue.empty():
+            received.append(connection.recv_queue.get_nowait()[0])
+    return received
+
+@pytest.mark.asyncio
+async def test__fewer_bytes(event_loop, connect):
+    messages = poses(50)
+    a, b, connection = connect()
+    assert (await stream(event_loop, a, connection, messages)) == messages
+    plain, plain_b, plain_connection = connect(header_compression=False)
+    assert (await stream(event_loop, plain, plain_connection, messages)) == messages
+    flags = [p.HC_flags for p in sent_packets(a)]
+    assert flags[:2] == [Packet.HCFlags.NONE, Packet.HCFlags.REQUESTED]
+    assert flags[2:] == [Packet.HCFlags.COMPRESSED] * 48
+    # the 8 bytes of code, presence vector and x, less 2 for the HC fields
+    compressed = sum(map(len, a.transport.sent))
+    uncompressed = sum(map(len, plain.transport.sent))
+    assert uncompressed - compressed == 48 * 6 - 2
+    # the acceptance
+    assert [p.HC_flags for p in sent_packets(b)] == [Packet.HCFlags.HC_LENGTH]
+
+@pytest.mark.asyncio
+async def test__new_prefix(event_loop, connect):
+    a, b, connection = connect()
+    messages = poses(5) + [ReportLocalPose(x=20, y=1, z=1)._write() for i in range(5)]
+    assert (await stream(event_loop, a, connection, messages)) == messages
+    flags = [p.HC_flags for p in sent_packets(a)]
+    # asked again with what the new messages have in common with the old
+    assert flags[5:7] == [Packet.HCFlags.REQUESTED, Packet.HCFlags.COMPRESSED]
+    assert sent_packets(a)[5].HC_length == 4
+
+@pytest.mark.asyncio
+async def test__unsupported(event_loop, connect):
+    a, b, connection = connect(
+        compression_timeout=0.001, compression_requests=2,
+        b_kwargs=dict(header_compression=False))
+    messages = poses(10)
+    assert (await stream(event_loop, a, connection, messages)) == messages
+    assert not a.compression_flows[(A, B)].supported
+    flags = [p.HC_flags for p in sent_packets(a)]
+    assert flags.count(Packet.HCFlags.REQUESTED) == 2
+    assert flags[-1] is Packet.HCFlags.NONE
+    assert not b.transport.sent
+
+@pytest.mark.asyncio
+async def test__unknown_number(event_loop, connect):
+    a, b, connection = connect()
+    messages = poses(6)
+    assert (await stream(event_loop, a, connection, messages[:3], require_ack=True)) == messages[:3]
+    # restarted, without the prefixes it accepted
+    restarted = judp.ConnectedJUDPProtocol(loop=event_loop)
+    restarted.connection_made(b.transport)
+    a.transport.peer = restarted
+    connection = restarted.connect(B)
+    start = event_loop.time()
+    assert (await stream(event_loop, a, connection, messages[3:], require_ack=True)) == messages[3:]
+    # sent again as soon as the NACK is back, not after a timeout
+    assert event_loop.time() - start < 0.1
+    nacks = [p for p in sent_packets(restarted) if p.ack_nack is Packet.ACKNACKFlags.NACK]
+    assert [p.HC_flags for p in nacks] == [Packet.HCFlags.COMPRESSED]
+    # sent again in full, then compressed again
+    flags = [p.HC_flags for p in sent_packets(a) if p.ack_nack is Packet.ACKNACKFlags.RESPONSE_REQUIRED]
+    assert flags[3:] == [
+        Packet.HCFlags.COMPRESSED, Packet.HCFlags.REQUESTED,
+        Packet.HCFlags.COMPRESSED, Packet.HCFlags.COMPRESSED]
+
+@pytest.mark.asyncio
+async def test__full_packets(event_loop, connect):
+    a, b, connection = connect()
+    # the most that fits uncompressed, so no room to ask
+    messages = [b'\x01\x40' + bytes(30) + bytes([i]) * 465 for i in range(3)]
+    messages.append(messages[0] * 3)
+    assert (await stream(event_loop, a, connection, messages)) == messages
+    assert max(map(len, a.transport.sent)) <= judp.MAX_PAYLOAD_SIZE
+    assert Packet.HCFlags.REQUESTED not in [p.HC_flags for p in sent_packets(a)]
+
+def test__new_numbers():
+    now = [0]
+    flow = judp._CompressionFlow(timeout=1.0, clock=lambda: now[0])
+    numbers = []
+    for i in range(10):
+        # another x every other message, each asked for again
+        message = ReportLocalPose(x=10 + i // 2, y=i * 0.01, z=1)._write()
+        packet = flow.compress(Packet(
+            contents=message, data_flags=Packet.DataFlags.SINGLE_PACKET, broadcast=Packet.BroadcastFlags.NONE,
+            destination_id=B, source_id=A, sequence_number=i))
+        if packet.HC_flags is Packet.HCFlags.REQUESTED:
+            numbers.append(packet.HC_number)
+            flow.accepted(packet)
+    assert len(numbers) > 1
+    assert len(set(numbers)) == len(numbers)
+    # retired ones aren't used again until packets compressed with them are gone
+    flow.forget(numbers[-1])
+    flow._next_number = numbers[0]
+    assert flow._new_number(0.5) not in numbers
+    flow._next_number = numbers[0]
+    assert flow._new_number(2) == numbers[0]
+
+@pytest.mark.asyncio
+async def test__overtaken(event_loop, connect):
+    a, b, connection = connect()
+    # delivered below
+    a.transport.peer = types.SimpleNamespace(datagram_received=lambda datagram, addr: None)
+    messages = poses(3) + [ReportLocalPose(x=20, y=1, z=1)._write() for i in range(2)]
+    for message in messages:
+        a.send_message(message, source_id=A, destination_id=B)
+        a._flush()
+        # accepted right away
+        for p in sent_packets(a)[-1:]:
+            if p.HC_flags is Packet.HCFlags.REQUESTED:
+                a.compression_flows[(A, B)].accepted(p)
+    packets = sent_packets(a)
+    flags = [p.HC_flags for p in packets]
+    assert flags == [
+        Packet.HCFlags.NONE, Packet.HCFlags.REQUESTED, Packet.HCFlags.COMPRESSED,
+        Packet.HCFlags.REQUESTED, Packet.HCFlags.COMPRESSED]
+    # the second request arrives before the packet compressed before it
+    for i in (0, 1, 3, 2, 4):
+        b._packet_received(packets[i], ('localhost', 5001))
+    received = [connection.recv_queue.get_nowait()[0] for i in range(5)]
+    assert received == [messages[i] for i in (0, 1, 3, 2, 4)]
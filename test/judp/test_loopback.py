@@ -2,6 +2,8 @@ import pytest
 import asyncio
 import format.jaus.judp as judp
 import format.jaus as jaus
+import format.log as log
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
 
 @pytest.fixture
 def protocol1(event_loop):
@@ -102,3 +104,17 @@ async def test__response_required(connection1, connection2):
     msg, src = await connection2.listen(timeout=2)
     assert msg == b'aaaa'
     assert src == jaus.Id(subsystem=1, node=1, component=1)
+
+@pytest.mark.asyncio
+async def test__log(event_loop, tmpdir, connection1, connection2, protocol1, protocol2):
+    path = str(tmpdir.join('log'))
+    protocol2.log = log.Writer(path)
+    message = ReportLocalPose(x=1)._write()
+    await connection1.send_message(message, destination_id=jaus.Id(subsystem=1, node=1, component=2))
+    await connection2.listen(timeout=2)
+    protocol2.log.close()
+    with log.Reader(path) as r:
+        [entry] = r.select(codes=[jaus.Message.Code.ReportLocalPose])
+        assert entry.source == ('127.0.0.1', 5001)
+        assert [h.contents for h in judp.peek_packet_headers(entry.data)] == [message]
+        del entry
@@ -0,0 +1,56 @@
+import format.jaus as jaus
+import format.jaus.judp as judp
+from format.jaus.judp import Packet, Payload
+
+
+def packet(size, destination, sequence_number):
+    return Packet(
+        contents=b'x' * (size - 14),
+        data_flags=Packet.DataFlags.SINGLE_PACKET,
+        broadcast=Packet.BroadcastFlags.NONE,
+        destination_id=destination,
+        source_id=jaus.Id(subsystem=1, node=1, component=1),
+        sequence_number=sequence_number)
+
+def make_datagrams(packets):
+    protocol = judp.JUDPProtocol.__new__(judp.JUDPProtocol)
+    protocol.routings = {
+        jaus.Id(subsystem=1, node=1, component=2): ('localhost', 5002),
+        jaus.Id(subsystem=1, node=1, component=3): ('localhost', 5003),
+    }
+    return list(protocol._make_datagrams(packets))
+
+def test__same_as_payload():
+    to = jaus.Id(subsystem=1, node=1, component=2)
+    packets = [packet(20, to, i) for i in range(5)]
+    assert make_datagrams(packets) == [(('localhost', 5002), Payload(packets=packets)._write())]
+
+def test__best_fit():
+    to = jaus.Id(subsystem=1, node=1, component=2)
+    packets = [packet(size, to, i) for i, size in enumerate([300, 300, 200, 200])]
+    datagrams = make_datagrams(packets)
+    # next fit needs three
+    assert len(datagrams) == 2
+    received = [p for addr, d in datagrams for p in Payload._read(d).packets]
+    assert sorted(p.sequence_number for p in received) == [0, 1, 2, 3]
+    assert all(len(d) <= judp.MAX_PAYLOAD_SIZE for addr, d in datagrams)
+
+def test__by_address():
+    to2 = jaus.Id(subsystem=1, node=1, component=2)
+    to3 = jaus.Id(subsystem=1, node=1, component=3)
+    datagrams = make_datagrams([packet(100, to2, 0), packet(100, to3, 0), packet(100, to2, 1)])
+    assert sorted((addr[1], len(Payload._read(d).packets)) for addr, d in datagrams) == [(5002, 2), (5003, 1)]
+
+def test__full():
+    to = jaus.Id(subsystem=1, node=1, component=2)
+    packets = [packet(judp.MAX_PAYLOAD_SIZE - 1, to, i) for i in range(3)]
+    assert len(make_datagrams(packets)) == 3
+
+def test__many_open():
+    to = jaus.Id(subsystem=1, node=1, component=2)
+    # each datagram keeps room for a smaller packet, but not another of
+    # these (one packet, so that it is encoded once)
+    big = packet(260, to, 0)
+    datagrams = make_datagrams([big] * 20000 + [packet(200, to, 1)] * 10)
+    assert len(datagrams) == 20000
+    assert sorted(len(d) for addr, d in datagrams)[-10:] == [461] * 10
@@ -0,0 +1,75 @@
+import pytest
+
+from format.jaus import Id, Message
+from format.jaus.judp import Packet, Payload, datagram_codes, peek_packet_headers
+from format.jaus.mobility.local_pose_sensor import ReportLocalPose
+
+
+def make_payload():
+    contents = ReportLocalPose(x=1, yaw=0.5)._write()
+    return Payload(packets=[
+        Packet(
+            contents=contents,
+            data_flags=Packet.DataFlags.SINGLE_PACKET,
+            ack_nack=Packet.ACKNACKFlags.RESPONSE_REQUIRED,
+            broadcast=Packet.BroadcastFlags.NONE,
+            priority=Packet.Priority.HIGH,
+            destination_id=Id(subsystem=0x102, node=3, component=4),
+            source_id=Id(subsystem=5, node=6, component=7),
+            sequence_number=0x1234),
+        Packet(
+            HC_flags=Packet.HCFlags.REQUESTED,
+            HC_number=9,
+            HC_length=2,
+            contents=b'\x01\x02\x03',
+            data_flags=Packet.DataFlags.LAST_PACKET,
+            destination_id=Id(subsystem=1, node=1, component=1),
+            source_id=Id(subsystem=2, node=2, component=2),
+            sequence_number=65535),
+    ])
+
+def test__peek_matches_decode():
+    payload = make_payload()
+    datagram = payload._write()
+    headers = list(peek_packet_headers(datagram))
+    assert len(headers) == 2
+    for header, packet in zip(headers, Payload._read(datagram).packets):
+        for field in header._fields:
+            value = getattr(header, field)
+            if field.endswith('_id'):
+                id = getattr(packet, field)
+                assert value == (id.subsystem, id.node, id.component)
+            elif field in ('HC_number', 'HC_length') and packet.HC_flags is Packet.HCFlags.NONE:
+                assert value is None
+            else:
+                assert value == getattr(packet, field)
+
+def test__peek_contents_are_views():
+    datagram = make_payload()._write()
+    header = next(peek_packet_headers(datagram))
+    assert isinstance(header.contents, memoryview)
+    assert Message._peek_code(header.contents) is Message.Code.ReportLocalPose
+
+def test__peek_code():
+    assert Message._peek_code(b'\x03\x44\x00\x00') is Message.Code.ReportLocalPose
+    with pytest.raises(ValueError):
+        Message._peek_code(b'\x03')
+    with pytest.raises(ValueError):
+        Message._peek_code(b'\xff\xff')
+
+@pytest.mark.parametrize('datagram', [
+        b'',
+        b'\x01',
+        b'\x02\x00\x10',
+        # HC fields past the end
+        b'\x02\x01\x10\x00',
+        bytes.fromhex('0200110009ffffffff0201e803002b0204'),
+    ])
+def test__peek_bad_datagrams(datagram):
+    with pytest.raises(ValueError):
+        list(peek_packet_headers(datagram))
+
+def test__datagram_codes():
+    # the second packet is the end of a message, so has no code
+    assert datagram_codes(make_payload()._write()) == [Message.Code.ReportLocalPose.value]
+    assert datagram_codes(b'\x01') == []
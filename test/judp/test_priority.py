@@ -0,0 +1,44 @@
+import pytest
+
+from format.jaus.judp import Packet, Payload
+
+
+def sent_priorities(protocol):
+    return [p.priority for d in protocol.transport.sent for p in Payload._read(d).packets]
+
+@pytest.mark.asyncio
+async def test__safety_goes_first(make_protocol, send):
+    protocol = make_protocol(flush_delay=10, max_batch=100)
+    for i in range(50):
+        send(protocol, b'report', priority=Packet.Priority.STANDARD)
+    send(protocol, b'stop', priority=Packet.Priority.SAFETY)
+    # sent right away, without waiting behind the reports
+    assert sent_priorities(protocol) == [Packet.Priority.SAFETY]
+    assert protocol.queue_metrics()[Packet.Priority.STANDARD]['depth'] == 50
+    await protocol.close()
+    assert len(sent_priorities(protocol)) == 51
+
+@pytest.mark.asyncio
+async def test__weights(make_protocol, send):
+    protocol = make_protocol(flush_delay=10, max_batch=1000)
+    for priority in (Packet.Priority.LOW, Packet.Priority.STANDARD, Packet.Priority.HIGH):
+        for i in range(20):
+            send(protocol, b'x', priority=priority)
+    packets = protocol._dequeue(14)
+    assert [p.priority for p in packets] == 2 * (
+        [Packet.Priority.HIGH] * 4 + [Packet.Priority.STANDARD] * 2 + [Packet.Priority.LOW])
+    # what is left of the others once HIGH runs out
+    packets = protocol._dequeue(100)
+    assert [p.priority for p in packets[-8:]] == [Packet.Priority.LOW] * 8
+    assert protocol._queued == 0
+
+@pytest.mark.asyncio
+async def test__batches(make_protocol, send):
+    protocol = make_protocol(flush_delay=10, max_batch=10)
+    for i in range(25):
+        send(protocol, b'x', priority=Packet.Priority.LOW)
+    # a batch went out as soon as there were max_batch packets
+    assert len(sent_priorities(protocol)) == 20
+    await protocol.close()
+    metrics = protocol.queue_metrics()[Packet.Priority.LOW]
+    assert metrics == {'depth': 0, 'max_depth': 10, 'sent': 25}
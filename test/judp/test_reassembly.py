@@ -0,0 +1,139 @@
+import itertools
+
+import pytest
+
+from format.jaus.judp import Packet, _Reassembly
+
+FIRST = Packet.DataFlags.FIRST_PACKET
+NORMAL = Packet.DataFlags.NORMAL_PACKET
+LAST = Packet.DataFlags.LAST_PACKET
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+    def __call__(self):
+        return self.now
+
+def fragments(start, parts):
+    flags = [FIRST] + [NORMAL] * (len(parts) - 2) + [LAST]
+    return [(start + i, flag, part) for i, (flag, part) in enumerate(zip(flags, parts))]
+
+def add_all(reassembly, key, fragments):
+    return [reassembly.add(key, *fragment) for fragment in fragments]
+
+def test__in_order():
+    reassembly = _Reassembly(clock=Clock())
+    results = add_all(reassembly, 'a', fragments(10, [b'ab', b'cd', b'ef']))
+    assert results == [None, None, b'abcdef']
+    assert len(reassembly) == 0
+    assert reassembly.size == 0
+
+@pytest.mark.parametrize('order', list(itertools.permutations(range(4))))
+def test__any_order(order):
+    reassembly = _Reassembly(clock=Clock())
+    parts = fragments(0, [b'a', b'b', b'c', b'd'])
+    results = add_all(reassembly, 'a', [parts[i] for i in order])
+    assert results[:-1] == [None] * 3
+    assert results[-1] == b'abcd'
+    assert reassembly._runs == {}
+
+def test__back_to_back_messages():
+    reassembly = _Reassembly(clock=Clock())
+    first = fragments(0, [b'a', b'b'])
+    second = fragments(2, [b'c', b'd'])
+    results = add_all(reassembly, 'a', [second[1], first[0], second[0], first[1]])
+    assert [r for r in results if r is not None] == [b'cd', b'ab']
+
+def test__keys_are_separate():
+    reassembly = _Reassembly(clock=Clock())
+    assert reassembly.add('a', 0, FIRST, b'a') is None
+    assert reassembly.add('b', 1, LAST, b'b') is None
+    assert reassembly.add('a', 1, LAST, b'c') == b'ac'
+    assert len(reassembly) == 1
+
+def test__duplicates():
+    reassembly = _Reassembly(clock=Clock())
+    assert reassembly.add('a', 0, FIRST, b'a') is None
+    assert reassembly.add('a', 0, FIRST, b'a') is None
+    assert reassembly.add('a', 1, LAST, b'b') == b'ab'
+
+def test__timeout():
+    clock = Clock()
+    reassembly = _Reassembly(timeout=5, clock=clock)
+    reassembly.add('a', 0, FIRST, b'a')
+    clock.now = 4
+    reassembly.add('b', 0, FIRST, b'b')
+    clock.now = 6
+    reassembly.expire()
+    assert len(reassembly) == 1
+    assert reassembly.evicted == 1
+    assert reassembly.next_deadline() == 9
+    # the rest of a dropped message can't complete it
+    assert reassembly.add('a', 1, LAST, b'a') is None
+    assert reassembly.add('b', 1, LAST, b'b') == b'bb'
+
+def test__max_size():
+    reassembly = _Reassembly(max_size=10, clock=Clock())
+    reassembly.add('a', 0, FIRST, b'x' * 6)
+    reassembly.add('b', 0, FIRST, b'y' * 6)
+    assert reassembly.size == 6
+    assert reassembly.evicted == 1
+    assert reassembly.add('b', 1, LAST, b'y') == b'y' * 7
+
+def test__many_fragments():
+    reassembly = _Reassembly(max_size=1 << 30, clock=Clock())
+    parts = fragments(0, [bytes([i % 256]) for i in range(20000)])
+    # every other fragment first, then the gaps
+    results = add_all(reassembly, 'a', parts[::2] + parts[1::2])
+    assert results[-1] == b''.join(part for n, flag, part in parts)
+
+def test__wraparound():
+    reassembly = _Reassembly(clock=Clock())
+    parts = [((65534 + i) % 65536, flag, part) for i, (n, flag, part) in enumerate(fragments(0, [b'a', b'b', b'c', b'd']))]
+    assert [n for n, flag, part in parts] == [65534, 65535, 0, 1]
+    results = add_all(reassembly, 'a', [parts[2], parts[0], parts[3], parts[1]])
+    assert results[-1] == b'abcd'
+    assert reassembly._runs == {}
+
+def test__wraparound_many_times():
+    reassembly = _Reassembly(clock=Clock())
+    n = 0
+    for message in range(3 * 65536 // 5):
+        contents = [bytes([message % 256, i]) for i in range(5)]
+        parts = [((n + i) % 65536, flag, part) for i, (_, flag, part) in enumerate(fragments(0, contents))]
+        n += 5
+        results = add_all(reassembly, 'a', parts[::-1])
+        assert results[-1] == b''.join(contents)
+    assert len(reassembly) == 0
+
+def test__before_wraparound():
+    reassembly = _Reassembly(clock=Clock())
+    assert reassembly.add('a', 100, FIRST, b'A0') is None
+    assert reassembly.add('a', 101, NORMAL, b'A1') is None
+    # a new message, after the sequence numbers wrapped around
+    assert reassembly.add('a', 101, FIRST, b'C0') is None
+    assert reassembly.add('a', 102, LAST, b'C1') == b'C0C1'
+    assert reassembly.evicted == 1
+    assert len(reassembly) == 0
+
+def test__left_behind():
+    reassembly = _Reassembly(clock=Clock())
+    assert reassembly.add('a', 100, FIRST, b'A0') is None
+    # the first fragments of later messages, all the way around
+    for n in range(101, 101 + 65536, 1000):
+        reassembly.add('a', n % 65536, FIRST, b'')
+    assert reassembly.add('a', 101, LAST, b'C1') is None
+    assert reassembly.evicted >= 1
+    assert (('a', 100)) not in reassembly._runs
+
+def test__missing():
+    reassembly = _Reassembly(clock=Clock())
+    parts = fragments(65530, [bytes([i]) for i in range(12)])
+    for i in (0, 1, 4, 5, 9, 11):
+        reassembly.add('a', *parts[i])
+    assert sorted(reassembly.missing('a')) == [(0, 2), (4, 4), (65532, 65533)]
+    assert reassembly.missing('b') == []
+    for i in (2, 3, 6, 7, 8, 10):
+        reassembly.add('a', *parts[i])
+    assert reassembly.missing('a') == []
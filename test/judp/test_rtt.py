@@ -0,0 +1,86 @@
+import functools
+
+import pytest
+
+import format.jaus as jaus
+import format.jaus.judp as judp
+
+A = jaus.Id(subsystem=1, node=1, component=1)
+B = jaus.Id(subsystem=1, node=1, component=2)
+
+
+@pytest.fixture
+def connect(connect):
+    # retransmitting sooner than by default
+    return functools.partial(connect, initial_rto=0.1, min_rto=0.01)
+
+def test__estimator():
+    estimator = judp.RTTEstimator(initial_rto=1.0, min_rto=0.01)
+    assert estimator.rto == 1.0
+    estimator.sample(0.1)
+    assert estimator.srtt == 0.1
+    assert estimator.rttvar == 0.05
+    assert estimator.rto == pytest.approx(0.3)
+    estimator.sample(0.2)
+    assert estimator.rttvar == pytest.approx(0.75 * 0.05 + 0.25 * 0.1)
+    assert estimator.srtt == pytest.approx(0.875 * 0.1 + 0.125 * 0.2)
+    estimator.backoff()
+    estimator.backoff()
+    assert estimator.rto == pytest.approx(4 * (estimator.srtt + 4 * estimator.rttvar))
+    for i in range(100):
+        estimator.sample(0.001)
+    assert estimator.rto == 0.01
+    for i in range(100):
+        estimator.backoff()
+    assert estimator.rto == 60.0
+
+@pytest.mark.asyncio
+async def test__samples(connect):
+    a, b = connect(delay=0.01)
+    for i in range(5):
+        await a.send_message(b'x', source_id=A, destination_id=B, require_ack=True)
+    metrics = a.rtt_metrics()[B]
+    assert metrics['samples'] == 5
+    assert metrics['retransmits'] == 0
+    assert 0.02 <= metrics['srtt'] < 0.1
+    assert metrics['rto'] < 0.5
+
+@pytest.mark.asyncio
+async def test__retransmit(event_loop, connect):
+    a, b = connect(delay=0.01, lose=lambda n: n == 1)
+    started = event_loop.time()
+    await a.send_message(b'x', source_id=A, destination_id=B, require_ack=True)
+    # retransmitted after the initial timeout, not after seconds
+    assert event_loop.time() - started < 0.5
+    metrics = a.rtt_metrics()[B]
+    assert metrics['retransmits'] == 1
+    # Karn's rule: the acknowledgement of a retransmission isn't timed
+    assert metrics['samples'] == 0
+    assert metrics['rto'] == pytest.approx(0.2)
+
+@pytest.mark.asyncio
+async def test__backoff_once_per_timeout(connect):
+    a, b = connect(delay=0.01, lose=lambda n: n <= 10)
+    await a.send_message(b'x' * 4000, source_id=A, destination_id=B, require_ack=True)
+    metrics = a.rtt_metrics()[B]
+    assert metrics['samples'] == 0
+    # the 9 fragments timed out together, twice for the one lost again
+    assert metrics['rto'] <= 0.4
+
+@pytest.mark.asyncio
+async def test__retries(connect):
+    a, b = connect(delay=0.01, lose=lambda n: True)
+    with pytest.raises(Exception):
+        await a.send_message(b'x', source_id=A, destination_id=B, require_ack=True, retries=2)
+    assert len(a.transport.sent) == 3
+    metrics = a.rtt_metrics()[B]
+    assert metrics['failures'] == 1
+    assert metrics['rto'] == pytest.approx(0.8)
+
+@pytest.mark.asyncio
+async def test__deadline(event_loop, connect):
+    a, b = connect(delay=0.01, lose=lambda n: True)
+    started = event_loop.time()
+    with pytest.raises(Exception):
+        await a.send_message(b'x', source_id=A, destination_id=B, require_ack=True, retries=100, deadline=0.5)
+    assert event_loop.time() - started == pytest.approx(0.5, abs=0.1)
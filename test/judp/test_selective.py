@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import format.jaus as jaus
+from format.jaus.judp import Packet, Payload
+
+A = jaus.Id(subsystem=1, node=1, component=1)
+B = jaus.Id(subsystem=1, node=1, component=2)
+
+
+@pytest.fixture
+def connect(connect):
+    # with b listening as B, and a long retransmission timeout
+    def linked(**kwargs):
+        kwargs.setdefault('initial_rto', 5.0)
+        a, b = connect(**kwargs)
+        return a, b, b.connect(B)
+    return linked
+
+def lost(*sequence_numbers):
+    return [(Packet.ACKNACKFlags.NO_RESPONSE_REQUIRED, n) for n in sequence_numbers]
+
+def nacks(protocol):
+    return [p for d in protocol.transport.sent for p in Payload._read(d).packets
+            if p.ack_nack is Packet.ACKNACKFlags.NACK]
+
+def sent_sequence_numbers(protocol):
+    return [p.sequence_number for d in protocol.transport.sent for p in Payload._read(d).packets]
+
+@pytest.mark.asyncio
+async def test__resends_missing_fragments(connect):
+    a, b, connection = connect(lose=lost(3, 6))
+    message = bytes(range(256)) * 20
+    await a.send_message(message, source_id=A, destination_id=B)
+    assert (await connection.listen(timeout=1)) == (message, A)
+    # the lost fragments were sent again, and nothing else
+    assert sorted(sent_sequence_numbers(a)) == sorted(list(range(11)) + [3, 6])
+    assert a.selective_retransmits == 2
+
+@pytest.mark.asyncio
+async def test__require_ack(event_loop, connect):
+    a, b, connection = connect(lose=[(Packet.ACKNACKFlags.RESPONSE_REQUIRED, 2)])
+    message = b'x' * 3000
+    started = event_loop.time()
+    await a.send_message(message, source_id=A, destination_id=B, require_ack=True)
+    # without waiting for the 5 second retransmission timeout
+    assert event_loop.time() - started < 1
+    assert (await connection.listen(timeout=1)) == (message, A)
+    # acknowledged fragments are no longer kept
+    assert a._retained == {}
+
+@pytest.mark.asyncio
+async def test__retained_size(event_loop, connect):
+    a, b, connection = connect(lose=lost(1), retain_size=1000)
+    await a.send_message(b'x' * 3000, source_id=A, destination_id=B)
+    await asyncio.sleep(0.1, loop=event_loop)
+    # the lost fragment was dropped from the buffer
+    assert a._retained_size <= 1000
+    assert a.selective_retransmits == 0
+    assert connection.recv_queue.empty()
+
+@pytest.mark.asyncio
+async def test__nack_gaps_off(event_loop, connect):
+    a, b, connection = connect(lose=lost(3))
+    b.nack_gaps = False
+    await a.send_message(b'x' * 3000, source_id=A, destination_id=B)
+    await asyncio.sleep(0.1, loop=event_loop)
+    assert a.selective_retransmits == 0
+
+@pytest.mark.asyncio
+async def test__latency(connect):
+    # lost again when first resent, with 50 ms each way
+    a, b, connection = connect(lose=lost(3, 3), delay=0.05, nack_rtt=0.1)
+    # with some slack for a busy event loop
+    b.nack_rtt = 0.15
+    message = bytes(range(256)) * 20
+    await a.send_message(message, source_id=A, destination_id=B)
+    assert (await connection.listen(timeout=2)) == (message, A)
+    # asked for once per round trip, and resent as often
+    assert [p.sequence_number for p in nacks(b)] == [3, 3]
+    assert a.selective_retransmits == 2
+
+@pytest.mark.asyncio
+async def test__latency_require_ack(connect):
+    lose = [(Packet.ACKNACKFlags.RESPONSE_REQUIRED, 30)] * 2
+    a, b, connection = connect(lose=lose, delay=0.1)
+    message = b'x' * 30000
+    await a.send_message(message, source_id=A, destination_id=B, require_ack=True)
+    assert (await connection.listen(timeout=1)) == (message, A)
+    assert len(nacks(b)) >= 2
+    # NACKs for fragments on their way don't have them sent again
+    assert a.rtt_metrics()[B]['retransmits'] == 2
+    assert a.rtt_metrics()[B]['failures'] == 0
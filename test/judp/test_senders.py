@@ -0,0 +1,52 @@
+import asyncio
+import random
+
+import pytest
+
+import format.jaus as jaus
+import format.jaus.judp as judp
+
+
+DESTINATION = jaus.Id(subsystem=1, node=1, component=9)
+
+def sender(make_protocol, component):
+    protocol = make_protocol(sockname=('localhost', 5000 + component))
+    source = jaus.Id(subsystem=1, node=1, component=component)
+    # start just before the sequence numbers wrap around
+    protocol._sequence_numbers[source, DESTINATION] = 65530
+    return protocol, source
+
+@pytest.mark.asyncio
+async def test__interleaved_senders(event_loop, make_protocol):
+    receiver = make_protocol(sockname=('localhost', 5009))
+    connection = receiver.connect(DESTINATION)
+    senders = [sender(make_protocol, component) for component in (1, 2, 3)]
+    expected = set()
+    for i in range(20):
+        for protocol, source in senders:
+            message = bytes([source.component, i]) * 700
+            protocol.send_message(message, source_id=source, destination_id=DESTINATION)
+            expected.add((message, source))
+    await asyncio.sleep(0, loop=event_loop)
+    datagrams = [
+        (datagram, protocol.transport.sockname)
+        for protocol, source in senders
+        for datagram in protocol.transport.sent]
+    # every sender wrapped around
+    for protocol, source in senders:
+        assert protocol._sequence_numbers[source, DESTINATION] < 65530
+    random.Random(0).shuffle(datagrams)
+    for datagram, addr in datagrams:
+        receiver.datagram_received(datagram, addr)
+    received = set()
+    while not connection.recv_queue.empty():
+        received.add(connection.recv_queue.get_nowait())
+    assert received == expected
+    assert len(receiver._reassembly) == 0
+
+def test__sequence_numbers_wrap():
+    protocol = judp.JUDPProtocol.__new__(judp.JUDPProtocol)
+    protocol._sequence_numbers = {('a', 'b'): 65535}
+    assert protocol._generate_next_sequence_number('a', 'b') == 65535
+    assert protocol._generate_next_sequence_number('a', 'b') == 0
+    assert protocol._generate_next_sequence_number('b', 'a') == 0